@@ -0,0 +1,29 @@
+"""Import the in-tree package as ``exifmapper`` without installing it."""
+import importlib
+import importlib.util
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+
+
+def _load():
+    if 'exifmapper' in sys.modules:
+        return sys.modules['exifmapper']
+    spec = importlib.util.spec_from_file_location('exifmapper', SRC / '__init__.py',
+                                                  submodule_search_locations=[str(SRC)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['exifmapper'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Package:
+    """Lazily import ``exifmapper.<name>`` on attribute access."""
+
+    def __getattr__(self, name):
+        _load()
+        return importlib.import_module(f'exifmapper.{name}')
+
+
+exifmapper = _Package()
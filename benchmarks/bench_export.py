@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Throughput and peak memory of the streaming exporters.
+
+Peak memory is what the export allocates on top of the markers
+themselves. simplekml, which the KML export used to build the whole
+document with, is measured too when it is installed.
+
+Usage: python benchmarks/bench_export.py [count]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _common import exifmapper  # noqa: E402
+from bench_markers import make_markers  # noqa: E402
+
+export = exifmapper.export
+
+
+def measure(label, path, run, count):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<22} {count / elapsed:>10,.0f} markers/s  peak {peak / 1e6:7.1f} MB  "
+          f"file {os.path.getsize(path) / 1e6:7.1f} MB")
+
+
+def simplekml_export(path, markers):
+    import simplekml
+
+    kml = simplekml.Kml()
+    for marker in markers:
+        loc, name, timestamp, altitude, exif_data = marker
+        kml.newpoint(name=name, coords=[(loc[1], loc[0], altitude or 0)]).description = export.describe(marker)
+    kml.save(path)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    store = exifmapper.store.MarkerStore(make_markers(count))
+    print(f"{count} markers")
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext, fmt in export.EXPORT_FORMATS.items():
+            path = os.path.join(tmp, f"out{ext}")
+            measure(fmt, path, lambda: export.export_markers(path, store), count)
+        path = os.path.join(tmp, "tiled.kmz")
+        measure("KMZ (tiled)", path, lambda: export.export_markers(path, store, tiled=True), count)
+        try:
+            import simplekml  # noqa: F401
+        except ImportError:
+            print("simplekml not installed; skipping the old KML export")
+        else:
+            path = os.path.join(tmp, "simplekml.kml")
+            measure("KML (simplekml)", path, lambda: simplekml_export(path, store), count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Track length and nearest-neighbour queries from the geodesy module.
+
+Usage: python benchmarks/bench_geodesy.py [count]
+"""
+import itertools
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _common import exifmapper  # noqa: E402
+
+geodesy = exifmapper.geodesy
+
+
+def make_points(count, seed=1):
+    """Half the points clustered around one city, half spread over the globe."""
+    rnd = random.Random(seed)
+    lats, lons = [], []
+    for i in range(count):
+        if i % 2:
+            lats.append(rnd.gauss(48.85, 0.02))
+            lons.append(rnd.gauss(2.35, 0.02))
+        else:
+            lats.append(rnd.uniform(-70, 70))
+            lons.append(rnd.uniform(-180, 180))
+    return lats, lons
+
+
+def loop_track_length(lats, lons):
+    """The per-segment loop the gui used before."""
+    return sum(geodesy.haversine(lats[i], lons[i], lats[i + 1], lons[i + 1], 'mi') for i in range(len(lats) - 1))
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{label}: {(time.perf_counter() - start) * 1000:,.0f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lats, lons = make_points(count)
+    print(f"{count} points, numpy {'available' if geodesy.np is not None else 'missing'}")
+    timed("track length, per-segment loop", loop_track_length, lats, lons)
+    timed("track length, vectorized", geodesy.track_length, lats, lons, 'mi')
+    timed("track length, ellipsoid", geodesy.track_length, lats, lons, 'mi', ellipsoid=True)
+    if geodesy.np is not None:
+        timed("5 nearest neighbours", geodesy.nearest, lats, lons, k=5)
+        timed("first 1000 rows of the distance matrix",
+              lambda: list(itertools.takewhile(lambda chunk: chunk[0] < 1000, geodesy.pairwise(lats, lons))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Memory and throughput of MarkerStore against the old list of tuples.
+
+Usage: python benchmarks/bench_markers.py [count]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _common import exifmapper  # noqa: E402
+
+MarkerStore = exifmapper.store.MarkerStore
+
+
+def make_markers(count, seed=1):
+    rnd = random.Random(seed)
+    cameras = ['Canon EOS 5D', 'NIKON D750', 'iPhone 13', 'Pixel 7']
+    for i in range(count):
+        yield ([rnd.uniform(-60, 60), rnd.uniform(-180, 180)], f"/photos/{i // 1000:04d}/IMG_{i:07d}.JPG",
+               f"2023:{rnd.randint(1, 12):02d}:{rnd.randint(1, 28):02d} 12:{rnd.randint(0, 59):02d}:00",
+               rnd.uniform(0, 3000), {'CameraModel': rnd.choice(cameras), 'Exposure': 1 / rnd.choice([60, 125, 250])})
+
+
+def bytes_per_marker(build, count):
+    """Traced allocation per marker; tracing is slow, so it runs on its own pass."""
+    tracemalloc.start()
+    markers = build()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del markers
+    return used / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    source = list(make_markers(count))
+    names = [m[1] for m in source]
+    locs = [m[0] for m in source]
+    print(f"{count} markers")
+
+    start = time.perf_counter()
+    store = MarkerStore(source)
+    elapsed = time.perf_counter() - start
+    print(f"MarkerStore bulk insert: {count / elapsed:,.0f} markers/s")
+
+    start = time.perf_counter()
+    single = MarkerStore()
+    for marker in source[:100_000]:
+        if not single.is_duplicate(marker[0], marker[1]):
+            single.append(marker)
+    elapsed = time.perf_counter() - start
+    print(f"MarkerStore append+dedupe: {min(count, 100_000) / elapsed:,.0f} markers/s")
+
+    start = time.perf_counter()
+    hits = sum(store.is_duplicate(loc, name) for loc, name in zip(locs, names))
+    elapsed = time.perf_counter() - start
+    print(f"is_duplicate: {count / elapsed:,.0f} checks/s ({hits} hits)")
+
+    start = time.perf_counter()
+    store.remove_names(names[::10])
+    elapsed = time.perf_counter() - start
+    print(f"bulk remove {len(names[::10])}: {elapsed * 1000:.0f} ms")
+    del store
+
+    sample = min(count, 200_000)
+    print(f"MarkerStore memory: {bytes_per_marker(lambda: MarkerStore(make_markers(sample)), sample):.0f} bytes/marker")
+    print(f"list of tuples (for reference): "
+          f"{bytes_per_marker(lambda: [tuple(m) for m in make_markers(sample)], sample):.0f} bytes/marker")
+
+
+if __name__ == "__main__":
+    main()
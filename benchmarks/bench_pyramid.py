@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Build time, memory and viewport query latency of the cluster pyramid.
+
+Usage: python benchmarks/bench_pyramid.py [count]
+"""
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _common import exifmapper  # noqa: E402
+
+pyramid = exifmapper.pyramid
+
+
+def make_points(count, seed=1):
+    """A few dense cities plus points spread over the globe."""
+    rnd = random.Random(seed)
+    cities = [(48.85, 2.35), (40.71, -74.0), (35.68, 139.69), (-33.87, 151.21)]
+    lats, lons = [], []
+    for i in range(count):
+        if i % 4:
+            lat, lon = cities[i % len(cities)]
+            lats.append(rnd.gauss(lat, 0.1))
+            lons.append(rnd.gauss(lon, 0.1))
+        else:
+            lats.append(rnd.uniform(-70, 70))
+            lons.append(rnd.uniform(-180, 180))
+    return lats, lons
+
+
+def viewport(rnd, zoom, width=1024, height=768):
+    """A random screen-sized bbox at ``zoom`` centred near one of the test cities."""
+    lat, lon = rnd.choice([(48.85, 2.35), (40.71, -74.0), (rnd.uniform(-60, 60), rnd.uniform(-180, 180))])
+    span_x = width / (256 * 2 ** zoom)
+    span_y = height / (256 * 2 ** zoom)
+    x, y = pyramid.project(lat, lon)
+    north, west = pyramid.unproject(x - span_x / 2, y - span_y / 2)
+    south, east = pyramid.unproject(x + span_x / 2, y + span_y / 2)
+    return max(west, -180), south, min(east, 180), north
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lats, lons = make_points(count)
+    print(f"{count} points, numpy {'available' if pyramid.np is not None else 'missing'}")
+
+    start = time.perf_counter()
+    index = pyramid.ClusterPyramid.build(lats, lons)
+    print(f"build: {time.perf_counter() - start:.2f} s, "
+          f"{sum(len(level) for level in index.levels):,} cells, {index.nbytes / 1e6:.1f} MB")
+
+    tracemalloc.start()
+    pyramid.ClusterPyramid.build(lats, lons)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"build peak memory: {peak / 1e6:.1f} MB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'locations.json.pyramid')
+        start = time.perf_counter()
+        index.save(path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        index = pyramid.ClusterPyramid.load(path)
+        print(f"save: {saved * 1000:.0f} ms, load: {(time.perf_counter() - start) * 1000:.0f} ms, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB on disk")
+
+    rnd = random.Random(2)
+    for zoom in (2, 6, 10, 14, 16):
+        timings, sizes = [], []
+        for _ in range(200):
+            box = viewport(rnd, zoom)
+            start = time.perf_counter()
+            clusters = index.query(zoom, *box)
+            timings.append(time.perf_counter() - start)
+            sizes.append(len(clusters))
+        timings.sort()
+        print(f"zoom {zoom:2d}: median {statistics.median(timings) * 1000:.2f} ms, "
+              f"p99 {timings[math.ceil(len(timings) * 0.99) - 1] * 1000:.2f} ms, "
+              f"~{statistics.mean(sizes):.0f} clusters per viewport")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Startup cost of the GUI: what importing it loads, and time to first paint.
+
+The import breakdown comes from ``python -X importtime`` in a fresh
+interpreter, summed per top-level package. Heavy packages that should only
+load on first use (folium, requests, Pillow's Image, geopy, ...) are listed
+if they show up, and make the run exit with status 1, so the benchmark can
+guard against an import creeping back in.
+
+Time to first paint runs the app offscreen from a clean directory whose
+last_file.txt points at a saved file of ``count`` markers, and reports when
+the window first painted and when that file had finished loading.
+
+Usage: python benchmarks/bench_startup.py [count] [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from bench_markers import make_markers  # noqa: E402
+
+BENCHMARKS = Path(__file__).resolve().parent
+# Modules the GUI must not import before they are needed.
+DEFERRED = ('folium', 'branca', 'jinja2', 'requests', 'urllib3', 'PIL.Image', 'geopy', 'simplekml')
+
+# A plain import statement, since -X importtime doesn't time importlib.import_module.
+PRELUDE = f"import sys; sys.path.insert(0, {str(BENCHMARKS)!r}); import _common; _common._load()"
+IMPORT_GUI = PRELUDE + "; import exifmapper.gui"
+
+FIRST_PAINT = PRELUDE + """
+import json
+import time
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QApplication
+started = time.time()
+import exifmapper.gui as gui
+imported = time.time()
+app = QApplication(sys.argv)
+window = gui.MapUI()
+times = {'imported': imported - started, 'window': time.time() - started}
+
+class Painted(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and 'paint' not in times:
+            times['paint'] = time.time()
+        return False
+
+def poll():
+    if 'paint' in times and not window.restore_pending and window.ingest_worker is None:
+        times['loaded'] = time.time()
+        times['markers'] = len(window.markers)
+        app.quit()
+    else:
+        QTimer.singleShot(5, poll)
+
+painted = Painted()
+window.installEventFilter(painted)
+window.show()
+poll()
+app.exec()
+print(json.dumps(times))
+"""
+
+
+def import_breakdown():
+    """Return ``({package: cumulative us}, total us, [deferred modules imported])`` for importing the GUI."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_GUI],
+                            capture_output=True, text=True, check=True)
+    children, packages = [], defaultdict(int)
+    loaded = set()
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        loaded.update(module for module in DEFERRED if name == module or name.startswith(module + '.'))
+        if depth == 1:
+            children.append((name, int(cumulative)))
+        elif depth == 0:
+            if name == 'exifmapper.gui':
+                total = int(cumulative)
+                for child, time_us in children:
+                    packages[child if child.startswith('exifmapper.') else child.split('.')[0]] += time_us
+            children = []
+    return packages, total, sorted(loaded)
+
+
+def first_paint(directory):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    spawned = time.time()
+    result = subprocess.run([sys.executable, '-c', FIRST_PAINT], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True)
+    times = json.loads(result.stdout.strip().splitlines()[-1])
+    return times, times['paint'] - spawned, times['loaded'] - spawned
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    breakdowns = [import_breakdown() for _ in range(runs)]
+    totals = [total for _, total, _ in breakdowns]
+    packages, _, loaded = min(breakdowns, key=lambda run: run[1])
+    print(f"import exifmapper.gui: {statistics.median(totals) / 1000:.0f} ms (median of {runs})")
+    for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:12]:
+        print(f"  {name:<24} {cumulative / 1000:7.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = Path(tmp) / 'saved.json'
+        saved.write_text(json.dumps([list(marker) for marker in make_markers(count)]))
+        (Path(tmp) / 'last_file.txt').write_text(str(saved))
+        results = [first_paint(tmp) for _ in range(runs)]
+    paint = statistics.median(result[1] for result in results)
+    loaded_at = statistics.median(result[2] for result in results)
+    times = results[0][0]
+    print(f"first paint {paint * 1000:.0f} ms after launch (import {times['imported'] * 1000:.0f} ms, "
+          f"window built {times['window'] * 1000:.0f} ms); last file of {times['markers']} markers "
+          f"loaded {loaded_at * 1000:.0f} ms after launch")
+    if loaded:
+        print(f"imported at startup but should load on first use: {', '.join(loaded)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
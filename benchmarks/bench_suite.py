@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""The benchmark suite: ingest, dedupe, map, save/load and export, as JSON.
+
+For every count it generates synthetic GPS JPEGs (see
+synthetic_images.py) of every image size and times:
+
+- extract.serial, extract.threads, extract.processes, extract.cached:
+  Extractor.get_loc over the images one at a time, through an
+  ExtractionPool of threads or of processes, and through a warm
+  ExtractionCache;
+- map.served, map.served_view, map.served_view_again, map.bundle,
+  map.bundle_again, map.inline: MapUI.renderMap on the offscreen Qt
+  platform publishing to the local map server, then the first and a
+  second whole-world viewport query; writing map_bundle/ from scratch and
+  again with the layers cached; and as one HTML file. Each records the
+  bytes it wrote or sent;
+- dedupe.append: appending every marker after an is_duplicate check, as a
+  load from images does; merge.skip, merge.overwrite, merge.keep: merging
+  every marker into a list that already holds half of them;
+- save.json, load.json, save.project, load.project;
+- export.kml, export.kmz_tiled.
+
+The last four groups use the markers extracted from the first image size.
+Every timing is the best of ``--repeat`` runs, except the map's, which
+depend on what the previous run left cached. Results are printed as JSON
+(or written to ``--output``) with the machine, versions and git commit;
+``--compare`` prints how each timing moved against an earlier results file.
+
+Usage: python benchmarks/bench_suite.py [--counts 1000,10000] [--sizes 640x480]
+           [--only extract,map,dedupe,persist,export] [--images DIR] [--repeat N]
+           [--jobs N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _common import exifmapper  # noqa: E402
+from synthetic_images import make_images, parse_size  # noqa: E402
+
+STAGES = ('extract', 'map', 'dedupe', 'persist', 'export')
+REPO = Path(__file__).resolve().parent.parent
+
+
+def log(text):
+    print(text, file=sys.stderr, flush=True)
+
+
+def best(run, repeat, setup=None):
+    """Seconds of the fastest of ``repeat`` calls of ``run(setup())``, and the last result."""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        result = run(state) if setup is not None else run()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def tree_size(path):
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(entry.stat().st_size for entry in path.rglob('*') if entry.is_file())
+
+
+class Suite:
+    def __init__(self, repeat, jobs, workdir):
+        self.repeat = repeat
+        self.jobs = jobs
+        self.workdir = Path(workdir)
+        self.results = []
+        self.app = None
+
+    def record(self, name, count, seconds, image_size=None, **extra):
+        result = {'name': name, 'count': count, 'seconds': round(seconds, 6),
+                  'per_second': round(count / seconds, 1) if seconds else None}
+        if image_size is not None:
+            result['image_size'] = image_size
+        result.update(extra)
+        self.results.append(result)
+        size = f" {image_size}" if image_size else ""
+        detail = f"  {extra['bytes'] / 1e6:.1f} MB" if 'bytes' in extra else ""
+        log(f"  {name:<22} {count:>9}{size:<10} {seconds:9.3f} s {result['per_second'] or 0:>12,.0f}/s{detail}")
+
+    # -- stages ----------------------------------------------------------------
+
+    def extract(self, paths, image_size, timed):
+        """Return the markers extracted from ``paths``, timing each way of extracting them if ``timed``."""
+        extract = exifmapper.extract
+        count = len(paths)
+
+        def pool(extractor, processes=False):
+            results = extract.ExtractionPool(extractor, jobs=self.jobs, processes=processes).run(paths)
+            return {item: result for item, result, error in results if error is None}
+
+        if not timed:
+            found = pool(extract.Extractor(cache=None))
+        else:
+            extractor = extract.Extractor(cache=None)
+            seconds, _ = best(lambda: [extractor.get_loc(path) for path in paths], self.repeat)
+            self.record('extract.serial', count, seconds, image_size)
+            seconds, found = best(lambda: pool(extract.Extractor(cache=None)), self.repeat)
+            self.record('extract.threads', count, seconds, image_size)
+            seconds, _ = best(lambda: pool(extract.Extractor(cache=None), processes=True), self.repeat)
+            self.record('extract.processes', count, seconds, image_size)
+            cache = exifmapper.cache.ExtractionCache(self.workdir / f"extract-{count}-{image_size}.db")
+            try:
+                pool(extract.Extractor(cache=cache))  # fills the cache
+                cache.flush()
+                seconds, _ = best(lambda: pool(extract.Extractor(cache=cache)), self.repeat)
+                self.record('extract.cached', count, seconds, image_size, hits=cache.hits)
+            finally:
+                cache.close()
+        markers = []
+        for path in paths:
+            result = found.get(path)
+            if result is not None and result[0]:
+                loc, timestamp, altitude, exif_data = result
+                markers.append((loc, path, timestamp, altitude, exif_data))
+        return markers
+
+    def map(self, markers, image_size):
+        from PyQt6.QtWidgets import QApplication, QMessageBox
+
+        if self.app is None:
+            self.app = QApplication.instance() or QApplication(sys.argv[:1])
+            # Imported up front so the first count isn't charged for them; bench_startup.py times imports.
+            import folium.plugins  # noqa: F401
+            exifmapper.server, exifmapper.layers
+        directory = self.workdir / f"map-{len(markers)}-{image_size}"
+        directory.mkdir(exist_ok=True)
+        cwd = os.getcwd()
+        os.chdir(directory)  # the window keeps its caches and writes its maps in the working directory
+
+        def failed(parent, title, text, *args, **kwargs):
+            raise RuntimeError(f"{title}: {text}")
+
+        try:
+            with mock.patch('webbrowser.open'), mock.patch.object(QMessageBox, 'information'), \
+                    mock.patch.object(QMessageBox, 'warning', failed), mock.patch.object(QMessageBox, 'critical', failed):
+                window = exifmapper.gui.MapUI()
+                window.markers.extend(markers)
+                try:
+                    self.map_with(window, directory, len(markers), image_size)
+                finally:
+                    window.close()
+                    window.deleteLater()
+                    self.app.processEvents()
+        finally:
+            os.chdir(cwd)
+
+    def map_with(self, window, directory, count, image_size):
+        import urllib.request
+
+        window.serve_map = True
+        start = time.perf_counter()
+        window.renderMap(open_browser=False)
+        self.record('map.served', count, time.perf_counter() - start, image_size,
+                    bytes=len(window.map_server.page))
+        # The first viewport query builds the cluster pyramid; a later one only reads it.
+        for name in ('map.served_view', 'map.served_view_again'):
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{window.map_server.url}markers?zoom=3&bbox=-180,-85,180,85") as response:
+                body = response.read()
+            self.record(name, count, time.perf_counter() - start, image_size, bytes=len(body))
+
+        window.serve_map = False
+        window.map_bundle = True
+        start = time.perf_counter()
+        window.renderMap(open_browser=False)
+        seconds = time.perf_counter() - start
+        bundle = directory / 'map_bundle'
+        thumbs = bundle / 'thumbs'
+        self.record('map.bundle', count, seconds, image_size, bytes=tree_size(bundle),
+                    html_bytes=tree_size(bundle / 'index.html'), data_bytes=tree_size(bundle / 'markers.js'),
+                    thumbnail_bytes=tree_size(thumbs) if thumbs.exists() else 0)
+        start = time.perf_counter()
+        window.renderMap(open_browser=False)
+        self.record('map.bundle_again', count, time.perf_counter() - start, image_size,
+                    bytes=tree_size(bundle / 'index.html'))
+
+        window.map_bundle = False
+        start = time.perf_counter()
+        window.renderMap()
+        self.record('map.inline', count, time.perf_counter() - start, image_size,
+                    bytes=tree_size(directory / 'temp_map.html'))
+
+    def dedupe(self, markers):
+        MarkerStore = exifmapper.store.MarkerStore
+        count = len(markers)
+
+        def append_all():
+            store = MarkerStore()
+            for marker in markers:
+                if not store.is_duplicate(marker[0], marker[1]):
+                    store.append(marker)
+            return store
+
+        seconds, _ = best(append_all, self.repeat)
+        self.record('dedupe.append', count, seconds)
+        for policy in exifmapper.store.DUPLICATE_POLICIES:
+            seconds, counts = best(lambda store: store.merge(markers, policy), self.repeat,
+                                   setup=lambda: MarkerStore(markers[:count // 2]))
+            self.record(f'merge.{policy}', count, seconds, added=counts[0], replaced=counts[1], skipped=counts[2])
+
+    def persist(self, markers):
+        project = exifmapper.project
+        MarkerStore = exifmapper.store.MarkerStore
+        store = MarkerStore(markers)
+        count = len(store)
+        path = self.workdir / f"saved-{count}.json"
+        seconds, _ = best(lambda: project.write_json(path, store), self.repeat)
+        self.record('save.json', count, seconds, bytes=tree_size(path))
+        seconds, _ = best(lambda: MarkerStore(project.read_json(path)), self.repeat)
+        self.record('load.json', count, seconds)
+
+        path = self.workdir / f"saved-{count}{project.PROJECT_SUFFIX}"
+
+        def save():
+            project.ProjectFile.create(path, store).close()
+
+        def load():
+            saved = project.ProjectFile(path)
+            try:
+                return MarkerStore(saved.read())
+            finally:
+                saved.close()
+
+        seconds, _ = best(save, self.repeat)
+        self.record('save.project', count, seconds, bytes=tree_size(path))
+        seconds, _ = best(load, self.repeat)
+        self.record('load.project', count, seconds)
+
+    def export(self, markers):
+        export = exifmapper.export
+        store = exifmapper.store.MarkerStore(markers)
+        count = len(store)
+        path = self.workdir / f"export-{count}.kml"
+        seconds, _ = best(lambda: export.export_markers(path, store), self.repeat)
+        self.record('export.kml', count, seconds, bytes=tree_size(path))
+        path = self.workdir / f"export-{count}.kmz"
+        seconds, _ = best(lambda: export.export_markers(path, store, tiled=True), self.repeat)
+        self.record('export.kmz_tiled', count, seconds, bytes=tree_size(path))
+
+
+def environment(args):
+    def version(package):
+        try:
+            from importlib.metadata import version
+            return version(package)
+        except Exception:
+            return None
+
+    try:
+        commit = subprocess.run(['git', '-C', str(REPO), 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'started': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform(), 'machine': platform.machine(),
+            'cpus': os.cpu_count(), 'arguments': vars(args),
+            'packages': {package: version(package) for package in ('PyQt6', 'Pillow', 'folium', 'numpy', 'requests')}}
+
+
+def compare(results, path):
+    """Print each timing against the same benchmark in an earlier results file."""
+    with open(path, encoding='utf-8') as f:
+        earlier = {(r['name'], r['count'], r.get('image_size')): r for r in json.load(f)['results']}
+    log(f"\ncompared with {path} (ratio > 1 is slower):")
+    for result in results:
+        before = earlier.get((result['name'], result['count'], result.get('image_size')))
+        if before is None or not before['seconds']:
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = "  slower" if ratio > 1.1 else "  faster" if ratio < 0.9 else ""
+        log(f"  {result['name']:<22} {result['count']:>9} {before['seconds']:9.3f} s -> "
+            f"{result['seconds']:9.3f} s  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ExifMapper's ingest, map, dedupe, save/load and export.")
+    parser.add_argument('--counts', default='1000,10000', help="comma-separated image counts (default: 1000,10000)")
+    parser.add_argument('--sizes', default='640x480', help="comma-separated image sizes as WxH (default: 640x480)")
+    parser.add_argument('--only', default=','.join(STAGES), help=f"comma-separated stages out of {', '.join(STAGES)}")
+    parser.add_argument('--images', help="directory to keep the generated images in and reuse them from")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per timing; the fastest is kept (default: 1)")
+    parser.add_argument('--jobs', type=int, default=None, help="extraction threads or processes")
+    parser.add_argument('--output', help="write the JSON results here instead of printing them")
+    parser.add_argument('--compare', metavar='FILE', help="an earlier results file to compare the timings with")
+    args = parser.parse_args()
+    counts = [int(count) for count in args.counts.split(',')]
+    sizes = [size.strip() for size in args.sizes.split(',')]
+    stages = [stage.strip() for stage in args.only.split(',')]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    for size in sizes:
+        parse_size(size)
+
+    meta = environment(args)
+    with tempfile.TemporaryDirectory(prefix='exifmapper-bench-') as tmp:
+        images = Path(args.images) if args.images else Path(tmp) / 'images'
+        suite = Suite(max(1, args.repeat), args.jobs, tmp)
+        for count in counts:
+            markers = None
+            for size in sizes:
+                start = time.perf_counter()
+                paths = make_images(images / size, count, parse_size(size))
+                log(f"{count} images of {size} ready in {time.perf_counter() - start:.1f} s")
+                extracted = suite.extract(paths, size, timed='extract' in stages)
+                if 'map' in stages:
+                    suite.map(extracted, size)
+                if markers is None:
+                    markers = extracted
+            if 'dedupe' in stages:
+                suite.dedupe(markers)
+            if 'persist' in stages:
+                suite.persist(markers)
+            if 'export' in stages:
+                suite.export(markers)
+
+    report = {'environment': meta, 'results': suite.results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        log(f"results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=1))
+    if args.compare:
+        compare(suite.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
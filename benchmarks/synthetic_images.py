@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Deterministic JPEGs with GPS EXIF for the benchmarks.
+
+Each size is encoded once; every image is that JPEG with its own EXIF
+segment spliced in after the start-of-image marker, so generating a
+million files costs about as much as writing them. A 640x480 image is
+about 40 KB, so pick a small size for the largest counts. Image ``i`` of
+a seed always gets the same pixels, camera, time and position (a few
+dense cities plus points spread over the globe), and files that already
+exist are kept, so a directory can be reused between runs and grown to
+larger counts.
+
+Usage: python benchmarks/synthetic_images.py directory count [WxH] [seed]
+"""
+import io
+import random
+import struct
+import sys
+import time
+from pathlib import Path
+
+CAMERAS = ('Canon EOS 5D', 'NIKON D750', 'iPhone 13', 'Pixel 7', 'DSC-RX100')
+CITIES = ((48.85, 2.35), (40.71, -74.0), (35.68, 139.69), (-33.87, 151.21))
+PER_DIRECTORY = 1000
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def base_jpeg(size, seed=1):
+    """An EXIF-less JPEG of blurred noise, which compresses about like a photo of that size."""
+    from PIL import Image, ImageFilter
+
+    rnd = random.Random(seed)
+    noise = Image.frombytes('L', size, rnd.randbytes(size[0] * size[1]))
+    noise = noise.convert('RGB').filter(ImageFilter.GaussianBlur(2))
+    buffer = io.BytesIO()
+    noise.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def _entry(tag, kind, count, value):
+    return struct.pack('>HHI', tag, kind, count) + value
+
+
+def _rationals(*values, denominator=10000):
+    return b''.join(struct.pack('>II', round(value * denominator), denominator) for value in values)
+
+
+def _dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    return (struct.pack('>IIII', degrees, 1, minutes, 1)
+            + _rationals((value - degrees - minutes / 60) * 3600))
+
+
+def exif_segment(index, seed=1):
+    """The APP1 segment of image ``index``: camera, time, exposure and position.
+
+    The TIFF block is packed by hand, since building it through
+    PIL.Image.Exif would limit generation to a few thousand images a second.
+    """
+    rnd = random.Random(f"{seed}:{index}")
+    if index % 4:
+        lat, lon = CITIES[index % len(CITIES)]
+        lat, lon = rnd.gauss(lat, 0.1), rnd.gauss(lon, 0.1)
+    else:
+        lat, lon = rnd.uniform(-70, 70), rnd.uniform(-180, 180)
+    model = rnd.choice(CAMERAS).encode('ascii') + b'\0'
+    taken = (f"20{rnd.randint(10, 24)}:{rnd.randint(1, 12):02d}:{rnd.randint(1, 28):02d} "
+             f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}").encode('ascii') + b'\0'
+    exposure = struct.pack('>II', 1, rnd.choice((60, 125, 250, 500)))
+    altitude = _rationals(rnd.uniform(0, 3000), denominator=10)
+    # IFD0 at 8 (4 entries), the Exif IFD at 62 (1 entry), the GPS IFD at 80 (5 entries), values from 146.
+    data = 146
+    ifd0 = (struct.pack('>H', 4)
+            + _entry(0x0110, 2, len(model), struct.pack('>I', data + 84))
+            + _entry(0x0132, 2, 20, struct.pack('>I', data))
+            + _entry(0x8769, 4, 1, struct.pack('>I', 62))
+            + _entry(0x8825, 4, 1, struct.pack('>I', 80)) + b'\0\0\0\0')
+    exif_ifd = struct.pack('>H', 1) + _entry(0x829A, 5, 1, struct.pack('>I', data + 20)) + b'\0\0\0\0'
+    gps_ifd = (struct.pack('>H', 5)
+               + _entry(1, 2, 2, (b'N' if lat >= 0 else b'S') + b'\0\0\0')
+               + _entry(2, 5, 3, struct.pack('>I', data + 28))
+               + _entry(3, 2, 2, (b'E' if lon >= 0 else b'W') + b'\0\0\0')
+               + _entry(4, 5, 3, struct.pack('>I', data + 52))
+               + _entry(6, 5, 1, struct.pack('>I', data + 76)) + b'\0\0\0\0')
+    tiff = (b'MM\0*' + struct.pack('>I', 8) + ifd0 + exif_ifd + gps_ifd
+            + taken + exposure + _dms(lat) + _dms(lon) + altitude + model)
+    payload = b'Exif\0\0' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def image_path(directory, index):
+    return Path(directory) / f"{index // PER_DIRECTORY:04d}" / f"IMG_{index:07d}.jpg"
+
+
+def make_images(directory, count, size=(640, 480), seed=1):
+    """Return the paths of images 0..count-1 in ``directory``, writing any that are missing."""
+    directory = Path(directory)
+    body = None
+    paths = []
+    for index in range(count):
+        path = image_path(directory, index)
+        if not path.exists():
+            if body is None:
+                body = base_jpeg(size, seed)[2:]
+            if index % PER_DIRECTORY == 0 or not path.parent.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'\xff\xd8' + exif_segment(index, seed) + body)
+        paths.append(str(path))
+    return paths
+
+
+def main():
+    if len(sys.argv) < 3:
+        sys.exit(__doc__.strip().splitlines()[-1])
+    directory, count = sys.argv[1], int(sys.argv[2])
+    size = parse_size(sys.argv[3]) if len(sys.argv) > 3 else (640, 480)
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    start = time.perf_counter()
+    make_images(directory, count, size, seed)
+    elapsed = time.perf_counter() - start
+    print(f"{count} images of {size[0]}x{size[1]} in {directory} ({count / elapsed:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,11 +21,11 @@ setup(
         "Pillow>=10.2.0",
         "folium>=0.15.0",
         "geopy>=2.4.0",
-        "simplekml>=1.3.6",
     ],
     entry_points={
         "console_scripts": [
             "exifmapper=exifmapper.gui:main",
+            "exifmapper-batch=exifmapper.batch:main",
         ],
     },
     author="SirCryptic",
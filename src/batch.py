@@ -0,0 +1,245 @@
+"""Headless batch extraction: ``exifmapper-batch``.
+
+Walks folders or reads paths/URLs from stdin and streams one result per
+image as soon as it is extracted, without needing Qt.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+from .cache import ExtractionCache, CACHE_FILE
+from .extract import Extractor, ExtractionPool, is_valid_url
+from .gazetteer import Gazetteer, with_place
+from .profiling import profiler
+from .scanner import scan_images, SYMLINK_POLICIES
+from .scheduler import FetchScheduler, MAX_CONNECTIONS, PER_HOST, RETRIES
+
+FORMATS = ('ndjson', 'csv', 'geojson')
+CSV_FIELDS = ['input', 'lat', 'lon', 'timestamp', 'altitude', 'camera', 'exposure', 'city', 'region', 'country', 'error']
+
+
+def iter_inputs(sources, stdin=None, scan_options=None):
+    """Yield image paths/URLs from the given sources; '-' means read stdin."""
+    for source in sources:
+        if source == '-':
+            for line in stdin or sys.stdin:
+                line = line.strip()
+                if line:
+                    yield from iter_inputs([line], scan_options=scan_options)
+        elif is_valid_url(source):
+            yield source
+        elif os.path.isdir(source):
+            yield from scan_images(source, **(scan_options or {}))
+        else:
+            yield source
+
+
+def _row(item, result, error):
+    loc, timestamp, altitude, exif_data = result if result else (None, None, None, None)
+    if error is not None:
+        error = str(error) or type(error).__name__
+    elif not loc:
+        error = "No GPS Data Found"
+    return {
+        'input': item,
+        'lat': loc[0] if loc else None,
+        'lon': loc[1] if loc else None,
+        'timestamp': timestamp,
+        'altitude': altitude,
+        'exif': exif_data,
+        'error': error,
+    }
+
+
+class NDJSONWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, default=str) + "\n")
+
+    def close(self):
+        pass
+
+
+class CSVWriter:
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        exif_data = row['exif'] or {}
+        self.writer.writerow({
+            'input': row['input'], 'lat': row['lat'], 'lon': row['lon'],
+            'timestamp': row['timestamp'], 'altitude': row['altitude'],
+            'camera': exif_data.get('CameraModel'), 'exposure': exif_data.get('Exposure'),
+            'city': exif_data.get('City'), 'region': exif_data.get('Region'), 'country': exif_data.get('Country'),
+            'error': row['error'],
+        })
+
+    def close(self):
+        pass
+
+
+class GeoJSONWriter:
+    """Streams a FeatureCollection; images without GPS data are skipped."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.first = True
+        self.stream.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, row):
+        if row['lat'] is None:
+            return
+        properties = {'name': row['input'], 'timestamp': row['timestamp'], 'altitude': row['altitude']}
+        properties.update(row['exif'] or {})
+        feature = {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [row['lon'], row['lat']]},
+            'properties': properties,
+        }
+        self.stream.write(("" if self.first else ",\n") + json.dumps(feature, default=str))
+        self.first = False
+
+    def close(self):
+        self.stream.write("\n]}\n")
+
+
+class SavedLocationsWriter:
+    """Writes the JSON list that MapUI.loadSavedData reads, one marker at a time."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.first = True
+        self.stream.write("[")
+
+    def write(self, row):
+        if row['lat'] is None:
+            return
+        marker = [[row['lat'], row['lon']], row['input'], row['timestamp'], row['altitude'], row['exif']]
+        self.stream.write(("\n" if self.first else ",\n") + json.dumps(marker, default=str))
+        self.first = False
+
+    def close(self):
+        self.stream.write("\n]\n")
+
+
+WRITERS = {'ndjson': NDJSONWriter, 'csv': CSVWriter, 'geojson': GeoJSONWriter}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='exifmapper-batch',
+        description="Extract GPS data from images without the GUI and stream the results.")
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help="Image files, folders or URLs; '-' (the default) reads one per line from stdin.")
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help="Only scan files matching this glob (repeatable).")
+    parser.add_argument('--exclude', action='append', metavar='GLOB',
+                        help="Skip files and folders matching this glob (repeatable).")
+    parser.add_argument('--max-depth', type=int, help="How many folder levels to descend (default: unlimited).")
+    parser.add_argument('--symlinks', choices=SYMLINK_POLICIES, default='files',
+                        help="Symlink policy when scanning folders (default: files).")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='ndjson', help="Output format (default: ndjson).")
+    parser.add_argument('-o', '--output', help="Write results here instead of stdout.")
+    parser.add_argument('--save-json', metavar='FILE',
+                        help="Also write a saved-locations JSON file the GUI can load.")
+    parser.add_argument('-j', '--jobs', type=int, default=8, help="Number of parallel workers (default: 8).")
+    parser.add_argument('--processes', action='store_true',
+                        help="Use worker processes instead of threads for CPU-bound parsing.")
+    parser.add_argument('--cache', default=CACHE_FILE, help=f"Extraction cache file (default: {CACHE_FILE}).")
+    parser.add_argument('--no-cache', action='store_true', help="Don't read or write the extraction cache.")
+    parser.add_argument('--full-fetch', action='store_true',
+                        help="Download whole remote images instead of only their EXIF header.")
+    parser.add_argument('--gazetteer', metavar='FILE',
+                        help="GeoNames cities file for offline place names (default: one in the current folder).")
+    parser.add_argument('--no-places', action='store_true', help="Don't add place names.")
+    parser.add_argument('--timeout', type=float, default=5, help="Network timeout in seconds (default: 5).")
+    parser.add_argument('--per-host', type=int, default=PER_HOST,
+                        help=f"Most downloads in flight to one host (default: {PER_HOST}).")
+    parser.add_argument('--connections', type=int, default=MAX_CONNECTIONS,
+                        help=f"Most downloads in flight in all (default: {MAX_CONNECTIONS}).")
+    parser.add_argument('--retries', type=int, default=RETRIES,
+                        help=f"Retries after a timeout, lost connection or 429/5xx answer (default: {RETRIES}).")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="Time each stage (file reads, EXIF parsing, downloads, ...) and write the stats here as JSON.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for option, value, least in (('--jobs', args.jobs, 1), ('--per-host', args.per_host, 1),
+                                 ('--connections', args.connections, 1), ('--retries', args.retries, 0)):
+        if value < least:
+            print(f"exifmapper-batch: {option} must be at least {least}", file=sys.stderr)
+            return 2
+    if args.gazetteer and not os.path.isfile(args.gazetteer):
+        print(f"exifmapper-batch: no such gazetteer file: {args.gazetteer}", file=sys.stderr)
+        return 2
+    if args.stats:
+        profiler.enabled = True
+    cache = None if args.no_cache else ExtractionCache(args.cache)
+    scheduler = FetchScheduler(per_host=args.per_host, max_connections=args.connections, retries=args.retries)
+    extractor = Extractor(cache=cache, partial_fetch=not args.full_fetch, timeout=args.timeout, scheduler=scheduler)
+    gazetteer = None
+    if not args.no_places:
+        gazetteer = Gazetteer(args.gazetteer) if args.gazetteer else Gazetteer.find()
+
+    if args.output:
+        out = open(args.output, 'w', newline='', encoding='utf-8')
+    else:
+        out = sys.stdout
+        out.reconfigure(line_buffering=True)  # stream each result as it completes
+    saved = open(args.save_json, 'w', encoding='utf-8') if args.save_json else None
+    writers = [WRITERS[args.format](out)]
+    if saved:
+        writers.append(SavedLocationsWriter(saved))
+
+    found = failed = total = 0
+    try:
+        pool = ExtractionPool(extractor, jobs=args.jobs, processes=args.processes)
+        scan_options = {'include': args.include, 'exclude': args.exclude,
+                        'max_depth': args.max_depth, 'symlinks': args.symlinks}
+        for item, result, error in pool.run(iter_inputs(args.inputs, scan_options=scan_options)):
+            row = _row(item, result, error)
+            total += 1
+            if row['lat'] is not None:
+                found += 1
+                if gazetteer is not None:
+                    row['exif'] = with_place(row['exif'], gazetteer.place(row['lat'], row['lon']))
+            elif error is not None:
+                failed += 1
+            for writer in writers:
+                writer.write(row)
+            if total % 1000 == 0:
+                out.flush()
+                extractor.flush()
+    except KeyboardInterrupt:
+        print("exifmapper-batch: interrupted", file=sys.stderr)
+    finally:
+        for writer in writers:
+            writer.close()
+        if args.output:
+            out.close()
+        if saved:
+            saved.close()
+        extractor.flush()
+        scheduler.close()
+        if cache is not None:
+            cache.close()
+
+    summary = extractor.summary()
+    print(f"Processed {total} input(s): {found} with GPS data, {failed} failed"
+          + (f" | {summary}" if summary else ""), file=sys.stderr)
+    if scheduler.report():
+        print(scheduler.report(), file=sys.stderr)
+    if args.stats:
+        profiler.save(args.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""On-disk cache of extraction results.
+
+Local files are keyed by path and validated against (size, mtime_ns, inode);
+URLs are keyed by the URL and revalidated with their ETag/Last-Modified.
+"""
+import json
+import numbers
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = 'exif_cache.sqlite'
+MAX_ENTRIES = 500_000
+FLUSH_EVERY = 1000
+
+MISS = object()
+
+
+def _encode(value):
+    if isinstance(value, numbers.Number):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode('latin-1')
+    return str(value)
+
+
+def file_identity(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}"
+
+
+class ExtractionCache:
+    """SQLite-backed store of ``(loc, timestamp, altitude, exif_data)`` results."""
+
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._pending = 0
+        try:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                identity TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                result TEXT,
+                last_used REAL)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self._count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            self.db = None
+            self._count = 0
+
+    def _get(self, key):
+        if self.db is None:
+            return None
+        with self._lock:
+            return self.db.execute(
+                "SELECT identity, etag, last_modified, result FROM entries WHERE key = ?", (key,)).fetchone()
+
+    def _put(self, key, identity, result, etag=None, last_modified=None):
+        if self.db is None:
+            return
+        payload = json.dumps(result, default=_encode)
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, identity, etag, last_modified, payload, time.time()))
+            self._count += 1  # may overcount replacements; recounted before evicting
+            self._pending += 1
+            if self._pending >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def _record(self, key, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self._touched[key] = time.time()
+            else:
+                self.misses += 1
+
+    def get_file(self, path):
+        """Return the cached result for a local file, or MISS if it changed."""
+        key = f"file:{os.path.abspath(path)}"
+        row = self._get(key)
+        hit = row is not None and row[0] == file_identity(path)
+        self._record(key, hit)
+        return json.loads(row[3]) if hit else MISS
+
+    def put_file(self, path, result):
+        self._put(f"file:{os.path.abspath(path)}", file_identity(path), result)
+
+    def get_url(self, url, revalidate):
+        """Return the cached result for a URL if ``revalidate(validators)`` says it is unchanged."""
+        key = f"url:{url}"
+        row = self._get(key)
+        hit = False
+        if row is not None and (row[1] or row[2]):
+            hit = revalidate({'etag': row[1], 'last_modified': row[2]})
+        self._record(key, hit)
+        return json.loads(row[3]) if hit else MISS
+
+    def put_url(self, url, result, validators):
+        if not validators.get('etag') and not validators.get('last_modified'):
+            return  # nothing to revalidate against later
+        self._put(f"url:{url}", None, result, validators.get('etag'), validators.get('last_modified'))
+
+    def flush(self):
+        """Commit pending writes, record access times and enforce the size cap."""
+        if self.db is None:
+            return
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._touched:
+            self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+        if self._count > self.max_entries:
+            self._count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if self._count > self.max_entries:
+            excess = self._count - self.max_entries
+            self.db.execute("DELETE FROM entries WHERE key IN "
+                            "(SELECT key FROM entries ORDER BY last_used LIMIT ?)", (excess,))
+            self._count -= excess
+        self.db.commit()
+        self._pending = 0
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def summary(self):
+        return f"Cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
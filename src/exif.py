@@ -0,0 +1,281 @@
+"""Header-only EXIF reader for JPEG and TIFF images.
+
+Only the APP1 segment of a JPEG (or the IFDs of a TIFF) is read, so large
+photos are never decoded. Anything else is handed to Pillow.
+"""
+import mmap
+import numbers
+import struct
+from io import BytesIO
+
+from .profiling import profiler
+
+HEAD_SIZE = 64 * 1024
+
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+THUMBNAIL_OFFSET = 0x0201  # JPEGInterchangeFormat, in IFD1
+THUMBNAIL_LENGTH = 0x0202
+
+# Same names Pillow's TAGS table uses, so callers see identical keys.
+IFD0_TAGS = {
+    0x0110: 'Model',
+    0x0132: 'DateTime',
+}
+EXIF_TAGS = {
+    0x829A: 'ExposureTime',
+}
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+_TYPE_FORMATS = {3: 'H', 4: 'I', 8: 'h', 9: 'i', 11: 'f', 12: 'd'}
+
+
+class UnsupportedFormat(Exception):
+    """Raised when the data is neither a JPEG nor a TIFF stream."""
+
+
+class Truncated(Exception):
+    """Raised when the buffer ends before the EXIF block does."""
+
+    def __init__(self, needed):
+        super().__init__(f"Need at least {needed} bytes")
+        self.needed = needed
+
+
+def is_tiff(buf):
+    return bytes(buf[:4]) in (b'II*\x00', b'MM\x00*')
+
+
+def locate_exif(buf):
+    """Return (start, end) of the TIFF block inside a JPEG/TIFF buffer.
+
+    Returns None when a JPEG has no EXIF segment. For TIFF files the whole
+    stream is the block, so end is None. Raises Truncated when the buffer
+    is too short to tell.
+    """
+    if is_tiff(buf):
+        return 0, None
+    if bytes(buf[:2]) != b'\xff\xd8':
+        if len(buf) < 4:
+            raise Truncated(4)
+        raise UnsupportedFormat("Not a JPEG or TIFF stream")
+    pos = 2
+    while True:
+        if pos + 4 > len(buf):
+            raise Truncated(pos + 4)
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / SOS: no metadata past this point
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack_from('>H', buf, pos + 2)[0]
+        if marker == 0xE1:
+            if pos + 10 > len(buf):
+                raise Truncated(pos + 10)
+            if bytes(buf[pos + 4:pos + 10]) == b'Exif\x00\x00':
+                return pos + 10, pos + 2 + length
+        pos += 2 + length
+
+
+def parse_tiff(buf, start=0):
+    """Walk IFD0, the Exif IFD and the GPS IFD of a TIFF block.
+
+    Returns a dict shaped like Pillow's ``_getexif()`` after TAGS mapping:
+    named IFD0/Exif tags plus a ``GPSInfo`` dict keyed by numeric GPS tag.
+    """
+    order = bytes(buf[start:start + 2])
+    if order == b'II':
+        endian = '<'
+    elif order == b'MM':
+        endian = '>'
+    else:
+        raise UnsupportedFormat("Invalid TIFF byte order")
+    if struct.unpack_from(endian + 'H', buf, start + 2)[0] != 42:
+        raise UnsupportedFormat("Invalid TIFF header")
+    ifd0 = struct.unpack_from(endian + 'I', buf, start + 4)[0]
+
+    tags = {}
+    entries = _read_ifd(buf, start, ifd0, endian)
+    for tag, entry in entries.items():
+        if tag in IFD0_TAGS:
+            tags[IFD0_TAGS[tag]] = _read_value(buf, start, endian, *entry)
+    if EXIF_IFD_POINTER in entries:
+        offset = _read_value(buf, start, endian, *entries[EXIF_IFD_POINTER])
+        for tag, entry in _read_ifd(buf, start, offset, endian).items():
+            if tag in EXIF_TAGS:
+                tags[EXIF_TAGS[tag]] = _read_value(buf, start, endian, *entry)
+    if GPS_IFD_POINTER in entries:
+        offset = _read_value(buf, start, endian, *entries[GPS_IFD_POINTER])
+        tags['GPSInfo'] = {tag: _read_value(buf, start, endian, *entry)
+                           for tag, entry in _read_ifd(buf, start, offset, endian).items()}
+    return tags
+
+
+def _read_ifd(buf, base, offset, endian):
+    """Return {tag: (type, count, value_pos)} for one IFD without decoding values."""
+    entries = {}
+    if not isinstance(offset, int):
+        return entries
+    pos = base + offset
+    try:
+        count = struct.unpack_from(endian + 'H', buf, pos)[0]
+        for i in range(count):
+            tag, typ, n = struct.unpack_from(endian + 'HHI', buf, pos + 2 + i * 12)
+            entries[tag] = (typ, n, pos + 2 + i * 12 + 8)
+    except struct.error:
+        pass
+    return entries
+
+
+def _read_value(buf, base, endian, typ, count, value_pos):
+    size = _TYPE_SIZES.get(typ)
+    if size is None:
+        return None
+    try:
+        if size * count > 4:
+            value_pos = base + struct.unpack_from(endian + 'I', buf, value_pos)[0]
+        data = bytes(buf[value_pos:value_pos + size * count])
+        if len(data) < size * count:
+            return None
+        if typ == 2:
+            return data.rstrip(b'\x00').decode('latin-1', 'replace')
+        if typ in (1, 6, 7):
+            return data
+        if typ in (5, 10):
+            fmt = 'I' if typ == 5 else 'i'
+            raw = struct.unpack(endian + fmt * (2 * count), data)
+            values = tuple(num / den if den else float('nan')
+                           for num, den in zip(raw[::2], raw[1::2]))
+        else:
+            values = struct.unpack(endian + _TYPE_FORMATS[typ] * count, data)
+    except struct.error:
+        return None
+    return values[0] if count == 1 else values
+
+
+def read_exif_bytes(data):
+    """Parse EXIF from an in-memory image, falling back to Pillow."""
+    try:
+        span = locate_exif(data)
+    except (UnsupportedFormat, Truncated):
+        return _read_with_pillow(BytesIO(data))
+    if span is None:
+        return None
+    start, end = span
+    view = memoryview(data)[:end] if end is not None else data
+    try:
+        return parse_tiff(view, start)
+    except (UnsupportedFormat, struct.error):
+        return None
+
+
+def read_exif(source):
+    """Return the EXIF tags of a file path or bytes object, or None."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return read_exif_bytes(source)
+    with open(source, 'rb') as f:
+        with profiler.stage('exif.read') as stage:
+            head = f.read(HEAD_SIZE)
+            block = _read_jpeg_block(f, head) if head[:2] == b'\xff\xd8' else None
+            stage.bytes = len(block[0].obj) if block is not None else len(head)
+        if is_tiff(head):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, profiler.stage('exif.parse'):
+                try:
+                    return parse_tiff(mm)
+                except (UnsupportedFormat, struct.error):
+                    return None
+        if head[:2] != b'\xff\xd8':
+            with profiler.stage('exif.pillow'):
+                return _read_with_pillow(source)
+        if block is None:
+            return None
+        with profiler.stage('exif.parse'):
+            try:
+                return parse_tiff(*block)
+            except (UnsupportedFormat, struct.error):
+                return None
+
+
+def _read_jpeg_block(f, head):
+    """Read just enough of a JPEG file to return (buffer, start) of its EXIF block."""
+    while True:
+        try:
+            span = locate_exif(head)
+            break
+        except Truncated as e:
+            more = f.read(max(e.needed - len(head), HEAD_SIZE))
+            if not more:
+                return None
+            head += more
+    if span is None:
+        return None
+    start, end = span
+    if end > len(head):
+        head += f.read(end - len(head))
+    return memoryview(head)[:end], start
+
+
+def read_thumbnail(path):
+    """Return the JPEG thumbnail embedded in a JPEG's EXIF block (IFD1), or None.
+
+    Only the APP1 segment is read; the thumbnail lives inside it.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_SIZE)
+        if head[:2] != b'\xff\xd8':
+            return None
+        block = _read_jpeg_block(f, head)
+    if block is None:
+        return None
+    buf, start = block
+    try:
+        endian = {b'II': '<', b'MM': '>'}[bytes(buf[start:start + 2])]
+        ifd0 = struct.unpack_from(endian + 'I', buf, start + 4)[0]
+        count = struct.unpack_from(endian + 'H', buf, start + ifd0)[0]
+        ifd1 = struct.unpack_from(endian + 'I', buf, start + ifd0 + 2 + count * 12)[0]
+    except (KeyError, struct.error):
+        return None
+    if not ifd1:
+        return None
+    entries = _read_ifd(buf, start, ifd1, endian)
+    if THUMBNAIL_OFFSET not in entries or THUMBNAIL_LENGTH not in entries:
+        return None
+    offset = _read_value(buf, start, endian, *entries[THUMBNAIL_OFFSET])
+    length = _read_value(buf, start, endian, *entries[THUMBNAIL_LENGTH])
+    if not isinstance(offset, int) or not isinstance(length, int) or not length:
+        return None
+    data = bytes(buf[start + offset:start + offset + length])
+    return data if len(data) == length and data[:2] == b'\xff\xd8' else None
+
+
+def _plain(value):
+    """Turn Pillow's IFDRational values into floats like parse_tiff returns."""
+    if isinstance(value, tuple):
+        return tuple(_plain(v) for v in value)
+    if isinstance(value, numbers.Rational) and not isinstance(value, int):
+        return float(value)
+    return value
+
+
+def _read_with_pillow(fp):
+    from PIL import Image
+    from PIL.ExifTags import TAGS
+
+    with Image.open(fp) as img:
+        exif = img.getexif()
+        if not exif:
+            return None
+        tags = {TAGS.get(tag, tag): _plain(value) for tag, value in exif.items()
+                if tag not in (EXIF_IFD_POINTER, GPS_IFD_POINTER)}
+        tags.update({TAGS.get(tag, tag): _plain(value)
+                     for tag, value in exif.get_ifd(EXIF_IFD_POINTER).items()})
+        gps = exif.get_ifd(GPS_IFD_POINTER)
+        if gps:
+            tags['GPSInfo'] = {tag: _plain(value) for tag, value in gps.items()}
+        return tags
@@ -0,0 +1,251 @@
+"""Streaming export of markers to KML, KMZ, GeoJSON, GPX and CSV.
+
+Every writer turns one marker into text and writes it straight to the
+output, so memory doesn't grow with the number of markers. Files are
+written next to the target and renamed into place when complete.
+
+A tiled KMZ is a KML super-overlay: markers are split into a quadtree of
+tiles, each a KML file with a Region, and Google Earth only fetches the
+tiles in view at a useful size through Region-bound NetworkLinks.
+"""
+import csv
+import html
+import io
+import json
+import os
+import zipfile
+
+from .mapbundle import place_label
+from .store import PLACE_KEYS, parse_timestamp
+
+EXPORT_FORMATS = {'.kml': 'KML', '.kmz': 'KMZ', '.geojson': 'GeoJSON', '.gpx': 'GPX', '.csv': 'CSV'}
+CSV_FIELDS = ['name', 'lat', 'lon', 'timestamp', 'altitude', 'camera', 'exposure', 'city', 'region', 'country']
+PROGRESS_EVERY = 5000
+TILE_MARKERS = 2000  # tiles with more markers are split in four
+MAX_TILE_DEPTH = 16
+MIN_LOD_PIXELS = 256  # a tile's contents show once its region covers about this many pixels
+KML_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n')
+KML_FOOTER = '</Document>\n</kml>\n'
+
+
+def escape(text):
+    """Escape &, < and > like xml.sax.saxutils.escape, whose import pulls in urllib.request."""
+    return html.escape(text, quote=False)
+
+
+class Cancelled(Exception):
+    """Raised by a progress callback to stop an export; the target file is left untouched."""
+
+
+def describe(marker):
+    """The description lines shown for a marker: time, altitude, camera and place."""
+    loc, name, timestamp, altitude, exif_data = marker
+    description = []
+    if timestamp:
+        try:
+            date, time = timestamp.split(" ")
+            description.append(f"Time: {time}\nDate: {date.replace(':', '-')}")
+        except ValueError:
+            description.append(f"Timestamp: {timestamp}")
+    if altitude is not None:
+        description.append(f"Altitude: {altitude:.1f} m")
+    if exif_data and 'CameraModel' in exif_data:
+        description.append(f"Camera: {exif_data['CameraModel']}\nExposure: {exif_data.get('Exposure', 'N/A')}")
+    if place_label(exif_data):
+        description.append(f"Place: {place_label(exif_data)}")
+    return "\n".join(description)
+
+
+def iso_time(timestamp):
+    """EXIF 'YYYY:MM:DD HH:MM:SS' as ISO 8601, or None."""
+    if parse_timestamp(timestamp) is None:
+        return None
+    return f"{timestamp[:10].replace(':', '-')}T{timestamp[11:]}Z"
+
+
+def placemark(marker):
+    loc, name, timestamp, altitude, exif_data = marker
+    when = iso_time(timestamp)
+    return (f"<Placemark><name>{escape(str(name))}</name>"
+            f"<description>{escape(describe(marker))}</description>"
+            + (f"<TimeStamp><when>{when}</when></TimeStamp>" if when else "")
+            + f"<Point><coordinates>{loc[1]},{loc[0]},{altitude or 0}</coordinates></Point></Placemark>\n")
+
+
+class KMLWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream.write(KML_HEADER)
+
+    def write(self, marker):
+        self.stream.write(placemark(marker))
+
+    def close(self):
+        self.stream.write(KML_FOOTER)
+
+
+class GeoJSONWriter:
+    """Streams a FeatureCollection with the exif_data keys as properties."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.first = True
+        self.stream.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, marker):
+        loc, name, timestamp, altitude, exif_data = marker
+        properties = {'name': name, 'timestamp': timestamp, 'altitude': altitude}
+        properties.update(exif_data or {})
+        coordinates = [loc[1], loc[0]] if altitude is None else [loc[1], loc[0], altitude]
+        feature = {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': coordinates},
+                   'properties': properties}
+        self.stream.write(("" if self.first else ",\n") + json.dumps(feature, default=str))
+        self.first = False
+
+    def close(self):
+        self.stream.write("\n]}\n")
+
+
+class GPXWriter:
+    """Streams one waypoint per marker."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.stream.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                          '<gpx version="1.1" creator="ExifMapper" xmlns="http://www.topografix.com/GPX/1/1">\n')
+
+    def write(self, marker):
+        loc, name, timestamp, altitude, exif_data = marker
+        when = iso_time(timestamp)
+        self.stream.write(f'<wpt lat="{loc[0]}" lon="{loc[1]}">'
+                          + (f"<ele>{altitude}</ele>" if altitude is not None else "")
+                          + (f"<time>{when}</time>" if when else "")
+                          + f"<name>{escape(str(name))}</name><desc>{escape(describe(marker))}</desc></wpt>\n")
+
+    def close(self):
+        self.stream.write("</gpx>\n")
+
+
+class CSVWriter:
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(CSV_FIELDS)
+
+    def write(self, marker):
+        loc, name, timestamp, altitude, exif_data = marker
+        exif_data = exif_data or {}
+        self.writer.writerow([name, loc[0], loc[1], timestamp, altitude, exif_data.get('CameraModel'),
+                              exif_data.get('Exposure')] + [exif_data.get(key) for key in PLACE_KEYS])
+
+    def close(self):
+        pass
+
+
+WRITERS = {'KML': KMLWriter, 'GeoJSON': GeoJSONWriter, 'GPX': GPXWriter, 'CSV': CSVWriter}
+
+
+def export_markers(path, markers, fmt=None, tiled=False, progress=None):
+    """Write markers to ``path``; return how many were written.
+
+    ``fmt`` defaults to the one named by the file extension. ``tiled``
+    writes a KMZ super-overlay instead of one flat KML document.
+    ``progress(done)`` is called every few thousand markers and may raise
+    Cancelled.
+    """
+    path = str(path)
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unknown export format for {path}")
+    tmp = f"{path}.tmp"
+    try:
+        if fmt == 'KMZ' or tiled:
+            with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as kmz:
+                count = (_write_tiles(kmz, markers, progress) if tiled
+                         else _write_entry(kmz, 'doc.kml', KMLWriter, markers, progress))
+        else:
+            with open(tmp, 'w', newline='' if fmt == 'CSV' else None, encoding='utf-8') as f:
+                count = _write_all(WRITERS[fmt](f), markers, progress)
+        os.replace(tmp, path)
+        return count
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _write_all(writer, markers, progress, done=0):
+    for marker in markers:
+        writer.write(marker)
+        done += 1
+        if progress is not None and done % PROGRESS_EVERY == 0:
+            progress(done)
+    writer.close()
+    return done
+
+
+def _write_entry(kmz, name, writer, markers, progress, done=0):
+    with kmz.open(name, 'w', force_zip64=True) as raw:
+        stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        count = _write_all(writer(stream), markers, progress, done)
+        stream.flush()
+        stream.detach()
+    return count
+
+
+# -- tiled KMZ ---------------------------------------------------------------
+
+def _region(bounds, min_pixels):
+    west, south, east, north = bounds
+    return (f"<Region><LatLonAltBox><north>{north}</north><south>{south}</south>"
+            f"<east>{east}</east><west>{west}</west></LatLonAltBox>"
+            f"<Lod><minLodPixels>{min_pixels}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod></Region>")
+
+
+def _quarters(bounds):
+    west, south, east, north = bounds
+    lon, lat = (west + east) / 2, (south + north) / 2
+    return [(west, lat, lon, north), (lon, lat, east, north), (west, south, lon, lat), (lon, south, east, lat)]
+
+
+def _write_tiles(kmz, markers, progress):
+    """Write doc.kml and one KML per quadtree tile; every file sits at the top of the archive."""
+    if hasattr(markers, 'coordinates'):
+        lats, lons = markers.coordinates()
+    else:
+        markers = markers if isinstance(markers, list) else list(markers)
+        lats, lons = [marker[0][0] for marker in markers], [marker[0][1] for marker in markers]
+    done = 0
+    # Depth first, so only the row lists of one branch are held at a time.
+    stack = [('doc', (-180.0, -90.0, 180.0, 90.0), list(range(len(lats))), 0)]
+    while stack:
+        key, bounds, rows, depth = stack.pop()
+        name = 'doc.kml' if key == 'doc' else f"{key}.kml"
+        with kmz.open(name, 'w', force_zip64=True) as raw:
+            stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            stream.write(KML_HEADER)
+            if key != 'doc':
+                stream.write(_region(bounds, MIN_LOD_PIXELS) + "\n")
+            if len(rows) > TILE_MARKERS and depth < MAX_TILE_DEPTH:
+                lon_mid, lat_mid = (bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2
+                parts = ([], [], [], [])
+                for row in rows:
+                    parts[(0 if lats[row] >= lat_mid else 2) + (0 if lons[row] < lon_mid else 1)].append(row)
+                rows = None
+                for quarter, (child, part) in enumerate(zip(_quarters(bounds), parts)):
+                    if not part:
+                        continue
+                    child_key = f"{'t' if key == 'doc' else key}{quarter}"
+                    stream.write(f"<NetworkLink><name>{len(part)} locations</name>{_region(child, MIN_LOD_PIXELS)}"
+                                 f"<Link><href>{child_key}.kml</href><viewRefreshMode>onRegion</viewRefreshMode>"
+                                 f"</Link></NetworkLink>\n")
+                    stack.append((child_key, child, part, depth + 1))
+            else:
+                for row in rows:
+                    stream.write(placemark(markers[row]))
+                    done += 1
+                    if progress is not None and done % PROGRESS_EVERY == 0:
+                        progress(done)
+            stream.write(KML_FOOTER)
+            stream.flush()
+            stream.detach()
+    return done
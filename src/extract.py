@@ -0,0 +1,231 @@
+"""GPS extraction shared by the GUI and the batch command line tool."""
+import functools
+import os
+import re
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import util
+
+from PIL import UnidentifiedImageError
+from PIL.ExifTags import GPSTAGS
+
+from .cache import ExtractionCache, MISS
+from .exif import read_exif
+from .fetch import FetchStats, fetch_exif, is_network_error, not_modified
+from .profiling import profiler
+from .scheduler import FetchScheduler
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def is_valid_url(url):
+    """Check if the input is a valid URL."""
+    try:
+        parsed = urllib.parse.urlparse(url)
+        return parsed.scheme in ('http', 'https') and bool(re.match(r'^[\w\-\.\:\/]+$', parsed.netloc))
+    except Exception:
+        return False
+
+
+class Extractor:
+    """Turns image paths/URLs into ``(loc, timestamp, altitude, exif_data)`` tuples."""
+
+    def __init__(self, cache=None, partial_fetch=True, timeout=5, scheduler=None):
+        self.cache = cache
+        self.partial_fetch = partial_fetch  # Range-request only the EXIF header of remote images
+        self.timeout = timeout
+        self.scheduler = scheduler if scheduler is not None else FetchScheduler()  # per-host limits and retries
+        self.fetch_stats = FetchStats()
+
+    @profiler.timed('extract.get_loc')
+    def get_loc(self, file_or_url, from_file=True, stop=None):
+        """Extract one image; setting the ``stop`` event makes a download give up instead of retrying."""
+        try:
+            if from_file:
+                result = self.cache.get_file(file_or_url) if self.cache is not None else MISS
+                if result is MISS:
+                    result = self.extract_location(read_exif(file_or_url))
+                    if self.cache is not None:
+                        self.cache.put_file(file_or_url, result)
+            else:
+                result = MISS
+                if self.cache is not None:
+                    result = self.cache.get_url(file_or_url, lambda validators: self.scheduler.call(
+                        file_or_url, lambda session: not_modified(file_or_url, validators, session, self.timeout),
+                        stop))
+                if result is MISS:
+                    data, validators = self.fetch_image_data(file_or_url, stop)
+                    result = self.extract_location(read_exif(data))
+                    if self.cache is not None:
+                        self.cache.put_url(file_or_url, result, validators)
+            return tuple(result)
+        except (FileNotFoundError, UnidentifiedImageError):
+            raise
+        except Exception as e:
+            if is_network_error(e):
+                raise
+            raise Exception(f"Processing failed: {str(e)}")
+
+    def extract_location(self, exif_data):
+        if not exif_data:
+            return None, None, None, None
+
+        loc, altitude = self.get_gps_data(exif_data)
+        timestamp = exif_data.get('DateTime', None)
+        additional_exif = {
+            'CameraModel': exif_data.get('Model', 'N/A'),
+            'Exposure': exif_data.get('ExposureTime', 'N/A')
+        }
+        return loc, timestamp, altitude, additional_exif
+
+    def fetch_image_data(self, url, stop=None):
+        with profiler.stage('extract.fetch') as stage:
+            data, validators = self.scheduler.call(url, lambda session: self._download(session, url), stop)
+            stage.bytes = len(data)
+        return data, validators
+
+    def _download(self, session, url):
+        if self.partial_fetch:
+            return fetch_exif(url, session, timeout=self.timeout, stats=self.fetch_stats)
+        response = session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content, {'etag': response.headers.get('ETag'),
+                                  'last_modified': response.headers.get('Last-Modified')}
+
+    @profiler.timed('extract.get_gps_data')
+    def get_gps_data(self, tags):
+        if 'GPSInfo' not in tags or not tags['GPSInfo']:
+            return None, None
+        gps_info = {GPSTAGS.get(key, key): value for key, value in tags['GPSInfo'].items()}
+        lat = gps_info.get('GPSLatitude')
+        lat_ref = gps_info.get('GPSLatitudeRef')
+        lon = gps_info.get('GPSLongitude')
+        lon_ref = gps_info.get('GPSLongitudeRef')
+        alt = gps_info.get('GPSAltitude')
+        if lat and lat_ref and lon and lon_ref:
+            try:
+                lat = self.convert_to_degrees(lat, lat_ref)
+                lon = self.convert_to_degrees(lon, lon_ref)
+                alt_value = float(alt) if alt else None
+                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                    return None, None
+                return [lat, lon], alt_value
+            except (ValueError, TypeError):
+                return None, None
+        return None, None
+
+    def convert_to_degrees(self, value, ref):
+        try:
+            d, m, s = value
+            degrees = float(d)
+            minutes = float(m) / 60.0
+            seconds = float(s) / 3600.0
+            result = degrees + minutes + seconds
+            if ref in ['S', 'W']:
+                result = -result
+            return result
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid GPS coordinate format: {str(e)}")
+
+    def reset_stats(self):
+        self.fetch_stats = FetchStats()
+        self.scheduler.reset_stats()
+        if self.cache is not None:
+            self.cache.reset_stats()
+
+    def flush(self):
+        if self.cache is not None:
+            self.cache.flush()
+
+    def summary(self):
+        parts = []
+        if self.cache is not None:
+            parts.append(self.cache.summary())
+        if self.fetch_stats.files:
+            parts.append(self.fetch_stats.summary())
+        if self.scheduler.summary():
+            parts.append(self.scheduler.summary())
+        return " | ".join(parts)
+
+
+_process_extractor = None
+
+
+def _init_process(cache_path, partial_fetch, timeout, scheduler_settings):
+    global _process_extractor
+    cache = ExtractionCache(cache_path) if cache_path else None
+    # Each process has its own scheduler, so the connection limits apply per process.
+    _process_extractor = Extractor(cache=cache, partial_fetch=partial_fetch, timeout=timeout,
+                                   scheduler=FetchScheduler(**scheduler_settings))
+    if cache is not None:
+        util.Finalize(cache, cache.close, exitpriority=10)
+
+
+def _process_get_loc(file_or_url, from_file):
+    return _process_extractor.get_loc(file_or_url, from_file)
+
+
+class ExtractionPool:
+    """Runs an Extractor over many inputs on a thread or process pool.
+
+    Only a few jobs per worker are queued at once, so inputs can be a lazy
+    iterator of any length. ``cancel()`` may be called from another thread;
+    it only sets the pool's own stop event, and ``run()`` then stops
+    submitting, shuts the executor down and returns. On a thread pool the
+    event also makes this pool's downloads give up their retries.
+    """
+
+    def __init__(self, extractor, jobs=None, processes=False):
+        self.extractor = extractor
+        self.jobs = jobs or min(32, (os.cpu_count() or 1) + 4)
+        self.processes = processes
+        self._cancelled = threading.Event()
+
+    def _make_executor(self):
+        if not self.processes:
+            return (ThreadPoolExecutor(max_workers=self.jobs),
+                    functools.partial(self.extractor.get_loc, stop=self._cancelled))
+        cache = self.extractor.cache
+        executor = ProcessPoolExecutor(
+            max_workers=self.jobs, initializer=_init_process,
+            initargs=(cache.path if cache is not None else None,
+                      self.extractor.partial_fetch, self.extractor.timeout, self.extractor.scheduler.settings()))
+        return executor, _process_get_loc
+
+    def run(self, inputs):
+        """Yield ``(input, result, exception)`` in completion order."""
+        executor, get_loc = self._make_executor()
+        limit = self.jobs * 4
+        pending = {}
+        inputs = iter(inputs)
+        exhausted = False
+        try:
+            while not self._cancelled.is_set():
+                while not exhausted and len(pending) < limit and not self._cancelled.is_set():
+                    try:
+                        item = next(inputs)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(get_loc, item, not is_valid_url(item))] = item
+                if not pending:
+                    break
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    if self._cancelled.is_set():
+                        break
+                    try:
+                        yield item, future.result(), None
+                    except Exception as e:
+                        yield item, None, e
+        finally:
+            executor.shutdown(wait=not self._cancelled.is_set(), cancel_futures=True)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
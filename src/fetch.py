@@ -0,0 +1,173 @@
+"""Partial HTTP fetching of remote images.
+
+Only the leading bytes of an image are needed to read its EXIF block, so
+remote images are requested with ``Range`` headers and the range is grown
+only when the APP1 segment runs past it.
+"""
+import re
+import sys
+import threading
+
+from .exif import locate_exif, Truncated, UnsupportedFormat
+
+RANGE_SIZE = 64 * 1024
+CHUNK_SIZE = 16 * 1024
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+class FetchStats:
+    """Byte counters for a batch of fetches; safe to share between threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.files = 0
+        self.bytes_downloaded = 0
+        self.bytes_total = 0
+        self.full_downloads = 0
+
+    def record(self, downloaded, total, requests_made, full):
+        with self._lock:
+            self.files += 1
+            self.requests += requests_made
+            self.bytes_downloaded += downloaded
+            self.bytes_total += total if total is not None else downloaded
+            if full:
+                self.full_downloads += 1
+
+    @property
+    def bytes_saved(self):
+        return max(self.bytes_total - self.bytes_downloaded, 0)
+
+    def summary(self):
+        return (f"Fetched {format_bytes(self.bytes_downloaded)} for {self.files} URL(s), "
+                f"saved {format_bytes(self.bytes_saved)}")
+
+
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+def _exif_complete(data):
+    """True once ``data`` holds everything the EXIF reader needs, or more can't help."""
+    try:
+        span = locate_exif(data)
+    except Truncated:
+        return False
+    except UnsupportedFormat:
+        return None  # Pillow fallback needs the whole file
+    if span is None:
+        return True
+    end = span[1]
+    if end is None:
+        return None  # TIFF offsets can point anywhere in the file
+    return len(data) >= end
+
+
+def _needed(data):
+    try:
+        span = locate_exif(data)
+    except Truncated as e:
+        return e.needed
+    except UnsupportedFormat:
+        return None
+    if span is None or span[1] is None:
+        return None
+    return span[1]
+
+
+def fetch_exif_bytes(url, session=None, timeout=5, initial=RANGE_SIZE, stats=None):
+    """Download just enough of ``url`` to parse its EXIF block.
+
+    Falls back to the whole body for formats the header reader can't handle
+    and when the server ignores ``Range``.
+    """
+    return fetch_exif(url, session, timeout, initial, stats)[0]
+
+
+def fetch_exif(url, session=None, timeout=5, initial=RANGE_SIZE, stats=None):
+    """Like fetch_exif_bytes, but also return the response's cache validators."""
+    data, total, requests_made, full, validators = _fetch(session or _requests(), url, timeout, initial)
+    if stats is not None:
+        stats.record(len(data), total, requests_made, full)
+    return bytes(data), validators
+
+
+def not_modified(url, validators, session=None, timeout=5):
+    """Ask the server whether ``url`` still matches the stored ETag/Last-Modified."""
+    headers = {'Range': 'bytes=0-0'}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    with (session or _requests()).get(url, headers=headers, timeout=timeout, stream=True) as response:
+        return response.status_code == 304
+
+
+def is_network_error(error):
+    """True if ``error`` came from requests, without importing requests to find out."""
+    exceptions = sys.modules.get('requests.exceptions')
+    return exceptions is not None and isinstance(error, exceptions.RequestException)
+
+
+def _requests():
+    import requests  # on first download; it takes longer to import than the rest of the app
+
+    return requests
+
+
+def _validators(response):
+    return {'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')}
+
+
+def _fetch(http, url, timeout, initial):
+    data = bytearray()
+    total = None
+    with http.get(url, headers={'Range': f'bytes=0-{initial - 1}'}, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        validators = _validators(response)
+        match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        if response.status_code != 206 or not match or int(match.group(1)) != 0:
+            # Server ignored the range; stream the body and stop once the header is in.
+            length = response.headers.get('Content-Length', '')
+            total = int(length) if length.isdigit() else None
+            complete = False
+            for chunk in response.iter_content(CHUNK_SIZE):
+                data += chunk
+                complete = _exif_complete(data)
+                if complete:
+                    break
+            return data, total, 1, complete is not True, validators
+        data += response.content
+        if match.group(3) != '*':
+            total = int(match.group(3))
+
+    requests_made = 1
+    full = False
+    while total is None or len(data) < total:
+        complete = _exif_complete(data)
+        if complete:
+            break
+        needed = _needed(data) if complete is False else None
+        if needed is None:
+            end = ''
+            full = True
+        else:
+            end = max(needed, len(data) * 2) - 1
+            if total is not None:
+                end = min(end, total - 1)
+        response = http.get(url, headers={'Range': f'bytes={len(data)}-{end}'}, timeout=timeout)
+        requests_made += 1
+        response.raise_for_status()
+        if response.status_code != 206:
+            return bytearray(response.content), total, requests_made, True, _validators(response)
+        if not response.content or full:
+            data += response.content
+            break
+        data += response.content
+    return data, total, requests_made, full, validators
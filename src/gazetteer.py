@@ -0,0 +1,360 @@
+"""Offline reverse geocoding from a GeoNames-style gazetteer.
+
+The gazetteer (e.g. GeoNames' ``cities500.txt``, with ``admin1CodesASCII.txt``
+and ``countryInfo.txt`` beside it for region and country names) is compiled
+once into ``<file>.idx``: places sorted into 1-degree cells, with columns
+for coordinates, region and country and one block of UTF-8 names. The
+index is memory-mapped on the first lookup, so creating a Gazetteer costs
+nothing at startup. A marker gets the nearest place within max_km, looked
+for in every cell that distance can reach, which near the poles is many
+more columns than rows.
+"""
+import json
+import math
+import os
+import sys
+import threading
+from array import array
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # optional; lookups fall back to a per-point scan
+    np = None
+
+from .cache import file_identity
+from .store import PLACE_KEYS
+
+GAZETTEER_FILES = ('cities500.txt', 'cities1000.txt', 'cities5000.txt', 'cities15000.txt')
+INDEX_SUFFIX = '.idx'
+FORMAT_VERSION = 1
+CELL = 1.0  # degrees
+ROWS, COLS = int(180 / CELL), int(360 / CELL)
+SLACK = 1e-4  # degrees added to search windows, for the float32 rounding of stored coordinates
+MAX_DISTANCE_KM = 100.0
+EARTH_RADIUS_KM = 6371.0
+CHUNK_ELEMENTS = 1_000_000  # candidate pairs compared at once
+# name, type code, numpy dtype
+_FIELDS = (('lat', 'f', '<f4'), ('lon', 'f', '<f4'), ('region', 'i', '<i4'), ('country', 'i', '<i4'),
+           ('starts', 'i', '<i4'), ('name_offsets', 'q', '<i8'), ('names', 'B', 'u1'))
+
+
+def with_place(exif_data, place):
+    """exif_data with City/Region/Country from a ``(city, region, country)`` place added."""
+    if place is None:
+        return exif_data
+    merged = dict(exif_data) if exif_data else {}
+    merged.update(zip(PLACE_KEYS, place))
+    return merged
+
+
+class Gazetteer:
+    """Nearest-place lookups over a compiled, memory-mapped gazetteer index."""
+
+    def __init__(self, path, max_km=MAX_DISTANCE_KM):
+        self.path = str(path)
+        self.index_path = self.path + INDEX_SUFFIX
+        self.max_km = max_km
+        self._columns = None
+        self._names = self._regions = self._countries = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def find(cls, directory='.'):
+        """A Gazetteer for the first GeoNames cities file in ``directory``, or None."""
+        for name in GAZETTEER_FILES:
+            path = Path(directory) / name
+            if path.exists():
+                return cls(path)
+        return None
+
+    def __len__(self):
+        return len(self._load()['lat'])
+
+    # -- lookups -------------------------------------------------------------
+
+    def lookup(self, lats, lons):
+        """Return a ``(city, region, country)`` tuple, or None past max_km, for every point."""
+        columns = self._load()
+        if not len(lats):
+            return []
+        if np is not None:
+            nearest = _nearest_np(columns, lats, lons, self.max_km)
+            labels = self._labels(np.unique(nearest[nearest >= 0]))
+            nearest = nearest.tolist()
+        else:
+            nearest = [_nearest_python(columns, lat, lon, self.max_km) for lat, lon in zip(lats, lons)]
+            labels = self._labels(sorted({index for index in nearest if index >= 0}))
+        return [labels[index] if index >= 0 else None for index in nearest]
+
+    def place(self, lat, lon):
+        return self.lookup([lat], [lon])[0]
+
+    def annotate(self, markers):
+        """Return the markers with their place added to exif_data; ones already labelled are left alone."""
+        markers = list(markers)
+        todo = [i for i, marker in enumerate(markers)
+                if not (isinstance(marker[4], dict) and PLACE_KEYS[-1] in marker[4])]
+        places = self.lookup([markers[i][0][0] for i in todo], [markers[i][0][1] for i in todo])
+        for i, place in zip(todo, places):
+            if place is not None:
+                loc, name, timestamp, altitude, exif_data = markers[i]
+                markers[i] = (loc, name, timestamp, altitude, with_place(exif_data, place))
+        return markers
+
+    def _labels(self, indexes):
+        """``{index: (city, region, country)}`` for distinct place indexes."""
+        columns = self._columns
+        offsets = columns['name_offsets']
+        if np is not None:
+            starts, stops = offsets[indexes].tolist(), offsets[indexes + 1].tolist()
+            regions, countries = columns['region'][indexes].tolist(), columns['country'][indexes].tolist()
+            indexes = indexes.tolist()
+        else:
+            starts, stops = [offsets[i] for i in indexes], [offsets[i + 1] for i in indexes]
+            regions, countries = [columns['region'][i] for i in indexes], [columns['country'][i] for i in indexes]
+        names = self._names
+        return {index: (str(names[start:stop], 'utf-8'), self._regions[region], self._countries[country])
+                for index, start, stop, region, country in zip(indexes, starts, stops, regions, countries)}
+
+    # -- index ---------------------------------------------------------------
+
+    def _load(self):
+        with self._lock:
+            if self._columns is None:
+                try:
+                    self._open()
+                except (OSError, ValueError, KeyError):
+                    self.compile()
+                    self._open()
+            return self._columns
+
+    def _open(self):
+        with open(self.index_path, 'rb') as f:
+            header = json.loads(f.readline())
+            base = f.tell()
+        if header.get('version') != FORMAT_VERSION or header.get('source') != file_identity(self.path):
+            raise ValueError(f"Stale gazetteer index {self.index_path}")
+        columns = {}
+        for name, typecode, dtype in _FIELDS:
+            offset, length = header['columns'][name]
+            if np is not None:
+                columns[name] = np.memmap(self.index_path, dtype=dtype, mode='r', offset=base + offset,
+                                          shape=(length,)) if length else np.zeros(0, dtype=dtype)
+                continue
+            column = array(typecode)
+            with open(self.index_path, 'rb') as f:
+                f.seek(base + offset)
+                column.fromfile(f, length)
+            if sys.byteorder != 'little':
+                column.byteswap()
+            columns[name] = column
+        if np is not None:
+            columns['xyz'] = _xyz(columns['lat'].astype(float), columns['lon'].astype(float))
+        self._names = memoryview(columns['names'])
+        self._regions, self._countries = header['regions'], header['countries']
+        self._columns = columns
+
+    def compile(self):
+        """Parse the gazetteer and write its index next to it."""
+        source = Path(self.path)
+        regions, countries = _names(source.parent / 'admin1CodesASCII.txt', 1), \
+            _names(source.parent / 'countryInfo.txt', 4)
+        region_ids, country_ids = {}, {}
+        places = []
+        with open(source, encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 11 or (fields[6] and fields[6] != 'P'):
+                    continue  # only populated places
+                try:
+                    lat, lon = float(fields[4]), float(fields[5])
+                except ValueError:
+                    continue
+                code, admin1 = fields[8], fields[10]
+                region = regions.get(f"{code}.{admin1}", admin1)
+                country = countries.get(code, code)
+                places.append((_cell(lat, lon), lat, lon, fields[1],
+                               region_ids.setdefault(region, len(region_ids)),
+                               country_ids.setdefault(country, len(country_ids))))
+        places.sort(key=lambda place: place[0])
+
+        counts = [0] * (ROWS * COLS + 1)
+        for place in places:
+            counts[place[0] + 1] += 1
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        names = bytearray()
+        name_offsets = array('q', [0])
+        for place in places:
+            names += place[3].encode('utf-8')
+            name_offsets.append(len(names))
+        columns = {
+            'lat': array('f', (place[1] for place in places)),
+            'lon': array('f', (place[2] for place in places)),
+            'region': array('i', (place[4] for place in places)),
+            'country': array('i', (place[5] for place in places)),
+            'starts': array('i', counts),
+            'name_offsets': name_offsets,
+            'names': array('B', bytes(names)),
+        }
+
+        layout, offset = {}, 0
+        for name, _, _ in _FIELDS:
+            layout[name] = (offset, len(columns[name]))
+            offset += -(-len(columns[name]) * columns[name].itemsize // 8) * 8  # keep columns 8-byte aligned
+        header = {'version': FORMAT_VERSION, 'source': file_identity(self.path), 'columns': layout,
+                  'regions': list(region_ids), 'countries': list(country_ids)}
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            for name, _, _ in _FIELDS:
+                column = columns[name]
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                data = column.tobytes()
+                f.write(data + b'\0' * (-len(data) % 8))
+        os.replace(tmp, self.index_path)
+
+
+def _names(path, column):
+    """``{code: name}`` from a GeoNames admin1 or country info file, if it is there."""
+    names = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) > column:
+                    names[fields[0]] = fields[column]
+    except OSError:
+        pass
+    return names
+
+
+def _cell(lat, lon):
+    row = min(max(int((lat + 90) // CELL), 0), ROWS - 1)
+    return row * COLS + int((lon + 180) // CELL) % COLS
+
+
+def _window(lat, lon, max_km):
+    """First and last cell row, and west and east cell column, that can hold a place within max_km of a point.
+
+    Columns are not wrapped yet: west is in ``0..COLS-1`` and east may run
+    past COLS into the next lap, up to a whole row near the poles.
+    """
+    reach = min(max_km / EARTH_RADIUS_KM, math.pi)  # radians of arc
+    dlat = math.degrees(reach) + SLACK
+    if abs(lat) + dlat >= 90:
+        dlon = 180.0
+    else:  # widest longitude difference on a circle of radius ``reach``
+        dlon = math.degrees(math.asin(math.sin(reach) / math.cos(math.radians(lat)))) + SLACK
+    first_row = min(max(int((lat - dlat + 90) // CELL), 0), ROWS - 1)
+    last_row = min(max(int((lat + dlat + 90) // CELL), 0), ROWS - 1)
+    west, east = int((lon - dlon + 180) // CELL), int((lon + dlon + 180) // CELL)
+    shift = west % COLS - west
+    west, east = west + shift, east + shift
+    if east - west + 1 >= COLS:
+        west, east = 0, COLS - 1
+    return first_row, last_row, west, east
+
+
+def _candidates(starts, lat, lon, max_km):
+    """Place index ranges in every cell that can hold a place within max_km of a point."""
+    first_row, last_row, west, east = _window(lat, lon, max_km)
+    ranges = []
+    for row in range(first_row, last_row + 1):
+        base = row * COLS
+        ranges.append((int(starts[base + west]), int(starts[base + min(east, COLS - 1) + 1])))
+        if east >= COLS:  # across the antimeridian
+            ranges.append((int(starts[base]), int(starts[base + east - COLS + 1])))
+    return ranges
+
+
+def _nearest_np(columns, lats, lons, max_km):
+    lat = np.asarray(lats, dtype=float)
+    lon = np.asarray(lons, dtype=float)
+    query = _xyz(lat, lon)
+    starts = np.asarray(columns['starts'], dtype=np.int64)
+    nearest = np.full(len(lat), -1, dtype=np.int64)
+    best = np.full(len(lat), np.inf)
+    # The same window as _window(), for every point at once. Near the poles a degree of longitude is
+    # only a few km wide, so the window spans more columns the further a point is from the equator.
+    reach = min(max_km / EARTH_RADIUS_KM, math.pi)
+    dlat = math.degrees(reach) + SLACK
+    polar = np.abs(lat) + dlat >= 90
+    ratio = np.minimum(math.sin(reach) / np.maximum(np.cos(np.radians(lat)), 1e-12), 1.0)
+    dlon = np.where(polar, 180.0, np.degrees(np.arcsin(ratio)) + SLACK)
+    first_row = np.clip(((lat - dlat + 90) // CELL).astype(np.int64), 0, ROWS - 1)
+    last_row = np.clip(((lat + dlat + 90) // CELL).astype(np.int64), 0, ROWS - 1)
+    west = ((lon - dlon + 180) // CELL).astype(np.int64)
+    east = ((lon + dlon + 180) // CELL).astype(np.int64)
+    shift = west % COLS - west
+    west, east = west + shift, east + shift
+    full = east - west + 1 >= COLS
+    west[full], east[full] = 0, COLS - 1
+    wrapped = np.flatnonzero(east >= COLS)
+    # Per row of the window, its cells are one run of places, plus a second run past the antimeridian.
+    for dr in range(int((last_row - first_row).max()) + 1):
+        row = first_row + dr
+        inside = row <= last_row
+        base = np.minimum(row, ROWS - 1) * COLS
+        first = starts[base + west]
+        counts = np.where(inside, starts[base + np.minimum(east, COLS - 1) + 1] - first, 0)
+        _scan(columns['xyz'], query, first, counts, nearest, best)
+        edge = wrapped[inside[wrapped]]
+        if len(edge):
+            first = starts[base[edge]]
+            _scan(columns['xyz'], query, first, starts[base[edge] + east[edge] - COLS + 1] - first,
+                  nearest, best, edge)
+    # squared chord on the unit sphere -> great-circle km
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(best) / 2, 1.0))
+    nearest[distance > max_km] = -1
+    return nearest
+
+
+def _scan(points, query, first, counts, nearest, best, owners=None):
+    """Compare each query point with its ``counts`` places from ``first`` on, keeping the closest in best/nearest."""
+    if owners is None:
+        owners = np.arange(len(query))
+    keep = counts > 0
+    owners, first, counts = owners[keep], first[keep], counts[keep]
+    ends = np.cumsum(counts)
+    i = 0
+    while i < len(owners):
+        j = max(i + 1, int(np.searchsorted(ends, ends[i] - counts[i] + CHUNK_ELEMENTS, side='right')))
+        group = counts[i:j]
+        offsets = np.cumsum(group) - group
+        member = np.repeat(np.arange(j - i), group)
+        candidates = np.arange(int(group.sum())) - np.repeat(offsets, group) + np.repeat(first[i:j], group)
+        chords = ((query[owners[i:j]][member] - points[candidates]) ** 2).sum(axis=1)
+        closest = np.minimum.reduceat(chords, offsets)
+        hits = np.flatnonzero(chords == closest[member])
+        hits = hits[np.flatnonzero(np.diff(member[hits], prepend=-1))]  # first hit per point
+        who = owners[i:j]
+        better = closest < best[who]
+        best[who[better]] = closest[better]
+        nearest[who[better]] = candidates[hits][better]
+        i = j
+
+
+def _xyz(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos = np.cos(lat)
+    return np.column_stack((cos * np.cos(lon), cos * np.sin(lon), np.sin(lat)))
+
+
+def _nearest_python(columns, lat, lon, max_km):
+    ranges = _candidates(columns['starts'], lat, lon, max_km)
+    best, nearest = math.inf, -1
+    phi, lam = math.radians(lat), math.radians(lon)
+    for start, stop in ranges:
+        for i in range(start, stop):
+            p2, l2 = math.radians(columns['lat'][i]), math.radians(columns['lon'][i])
+            a = math.sin((p2 - phi) / 2) ** 2 + math.cos(phi) * math.cos(p2) * math.sin((l2 - lam) / 2) ** 2
+            if a < best:
+                best, nearest = a, i
+    if nearest < 0 or 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(best), 1.0)) > max_km:
+        return -1
+    return nearest
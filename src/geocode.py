@@ -0,0 +1,297 @@
+"""Bulk geocoding with a persistent cache.
+
+Addresses are normalised and de-duplicated before any request is made,
+answered from an SQLite cache when possible, and otherwise sent to the
+backend from a few worker threads behind a rate limiter that follows the
+provider's policy. Results are committed as they arrive, so an interrupted
+import picks up where it stopped the next time it is run.
+
+A backend is any object with ``geocode(query)`` returning
+``(lat, lon, address)`` or None. It may also set ``name`` (the cache
+namespace), ``rate`` (requests per second), ``max_workers`` and
+``transient`` (exception types worth retrying).
+"""
+import csv
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+CACHE_FILE = 'geocode_cache.sqlite'
+USER_AGENT = 'exifmapper'
+NEGATIVE_TTL = 7 * 24 * 3600  # "not found" answers are asked again after a week
+FLUSH_EVERY = 50
+RETRIES = 3
+ADDRESS_COLUMNS = ('street', 'address2', 'city', 'town', 'county', 'state', 'region', 'postcode', 'zip', 'country')
+
+MISS = object()
+
+
+def normalize(query):
+    """Cache key for an address: case and runs of whitespace don't matter."""
+    return ' '.join(str(query).split()).casefold()
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across all threads."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def defer(self, seconds):
+        """Hold every caller back for ``seconds``, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class NominatimBackend:
+    """OpenStreetMap Nominatim through geopy, at its policy's one request per second."""
+
+    name = 'nominatim'
+    rate = 1.0
+    max_workers = 1
+
+    def __init__(self, user_agent=USER_AGENT, timeout=5, domain=None):
+        from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
+        from geopy.geocoders import Nominatim
+
+        kwargs = {'domain': domain} if domain else {}
+        self.geolocator = Nominatim(user_agent=user_agent, timeout=timeout, **kwargs)
+        self.rate_limited = GeocoderRateLimited
+        self.transient = (GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited, OSError)
+
+    def geocode(self, query):
+        location = self.geolocator.geocode(query)
+        if location is None:
+            return None
+        return location.latitude, location.longitude, location.address
+
+
+class GeocodeCache:
+    """SQLite store of ``(lat, lon, address)`` answers per backend and normalised query."""
+
+    def __init__(self, path=CACHE_FILE, negative_ttl=NEGATIVE_TTL):
+        self.path = str(path)
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        try:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS answers (
+                backend TEXT,
+                query TEXT,
+                lat REAL,
+                lon REAL,
+                address TEXT,
+                created REAL,
+                PRIMARY KEY (backend, query))""")
+        except sqlite3.Error:
+            self.db = None
+
+    def get(self, backend, query):
+        """Return the cached answer (None when the address wasn't found), or MISS."""
+        row = None
+        if self.db is not None:
+            with self._lock:
+                row = self.db.execute("SELECT lat, lon, address, created FROM answers WHERE backend = ? AND query = ?",
+                                      (backend, query)).fetchone()
+        if row is not None and row[0] is None and time.time() - row[3] > self.negative_ttl:
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return MISS
+            self.hits += 1
+        return None if row[0] is None else (row[0], row[1], row[2])
+
+    def put(self, backend, query, answer):
+        if self.db is None:
+            return
+        lat, lon, address = answer if answer is not None else (None, None, None)
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                            (backend, query, lat, lon, address, time.time()))
+            self._pending += 1
+            if self._pending >= FLUSH_EVERY:
+                self.db.commit()
+                self._pending = 0
+
+    def flush(self):
+        if self.db is not None:
+            with self._lock:
+                self.db.commit()
+                self._pending = 0
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def summary(self):
+        return f"Geocode cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+
+class Geocoder:
+    """Geocodes addresses through a cache, a rate limiter and a small thread pool.
+
+    ``run`` accepts a lazy iterator of any length; each distinct address is
+    looked up once however often it repeats. ``cancel()`` may be called
+    from another thread.
+    """
+
+    def __init__(self, backend=None, cache=None, jobs=None):
+        self.backend = backend if backend is not None else NominatimBackend()
+        self.cache = cache
+        self.jobs = max(1, min(jobs or 4, getattr(self.backend, 'max_workers', None) or 4))
+        self.limiter = RateLimiter(getattr(self.backend, 'rate', None))
+        self.requests = 0
+        self._cancelled = threading.Event()
+        self._stopping = threading.Event()
+
+    @property
+    def namespace(self):
+        return getattr(self.backend, 'name', type(self.backend).__name__)
+
+    def geocode(self, query):
+        """Return ``(lat, lon, address)`` for one address, or None if it wasn't found."""
+        key = normalize(query)
+        answer = self.cache.get(self.namespace, key) if self.cache is not None else MISS
+        if answer is MISS:
+            answer = self._lookup(key)
+            if self.cache is not None:
+                self.cache.put(self.namespace, key, answer)
+                self.cache.flush()
+        return answer
+
+    def _lookup(self, key):
+        transient = getattr(self.backend, 'transient', ())
+        rate_limited = getattr(self.backend, 'rate_limited', None)
+        for attempt in range(RETRIES + 1):
+            self.limiter.acquire()
+            self.requests += 1
+            try:
+                return self.backend.geocode(key)
+            except transient as e:
+                if attempt == RETRIES or self._stopping.is_set():
+                    raise
+                delay = 2 ** attempt
+                if rate_limited is not None and isinstance(e, rate_limited):
+                    delay = max(delay, getattr(e, 'retry_after', None) or 0)
+                    self.limiter.defer(delay)
+                time.sleep(delay)
+
+    def run(self, queries):
+        """Yield ``(query, answer, exception)`` for every query, cached ones first as they come."""
+        self._cancelled.clear()
+        self._stopping.clear()
+        limit = self.jobs * 4
+        pending = {}  # future -> normalised query
+        waiting = {}  # normalised query -> original queries sharing its lookup
+        queries = iter(queries)
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            try:
+                while not self._cancelled.is_set():
+                    while not exhausted and len(pending) < limit:
+                        try:
+                            query = next(queries)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        key = normalize(query)
+                        if key in waiting:
+                            waiting[key].append(query)
+                            continue
+                        answer = self.cache.get(self.namespace, key) if self.cache is not None else MISS
+                        if answer is not MISS:
+                            yield query, answer, None
+                            continue
+                        waiting[key] = [query]
+                        pending[executor.submit(self._lookup, key)] = key
+                    if not pending:
+                        break
+                    done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = pending.pop(future)
+                        try:
+                            answer, error = future.result(), None
+                        except Exception as e:
+                            answer, error = None, e
+                        if error is None and self.cache is not None:
+                            self.cache.put(self.namespace, key, answer)
+                        for query in waiting.pop(key):
+                            yield query, answer, error
+            finally:
+                self._stopping.set()  # lets retries give up instead of sleeping
+                executor.shutdown(wait=True, cancel_futures=True)
+                self._stopping.clear()
+                if self.cache is not None:
+                    self.cache.flush()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._stopping.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+def read_addresses(path):
+    """Yield ``(name, address)`` rows from a CSV file.
+
+    The address comes from an ``address`` column, else from columns such as
+    street, city and country joined with commas. Without a header, each
+    row is one address. A ``name`` column, when present, names the marker.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = [column.strip().casefold() for column in next(reader, [])]
+        if not ({'address', 'name'} | set(ADDRESS_COLUMNS)) & set(header):
+            f.seek(0)  # no header we understand; each row is one address, however it was split
+            for row in csv.reader(f, dialect):
+                address = ', '.join(cell.strip() for cell in row if cell.strip())
+                if address:
+                    yield address, address
+            return
+        name_at = header.index('name') if 'name' in header else None
+        if 'address' in header:
+            parts = [header.index('address')]
+        else:
+            parts = [header.index(column) for column in ADDRESS_COLUMNS if column in header]
+        for row in reader:
+            address = ', '.join(row[i].strip() for i in parts if i < len(row) and row[i].strip())
+            if not address:
+                continue
+            name = address
+            if name_at is not None and name_at < len(row) and row[name_at].strip():
+                name = row[name_at].strip()
+            yield name, address
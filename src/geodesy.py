@@ -0,0 +1,273 @@
+"""Distances between markers.
+
+Works on whole coordinate columns at once: with NumPy installed every
+function is vectorized, without it the same results come from plain Python
+loops. Distances are great-circle (haversine on a sphere of radius
+EARTH_RADIUS_KM) unless ``ellipsoid=True``, which solves Vincenty's inverse
+problem on WGS-84 instead.
+"""
+import heapq
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional; everything below has a pure-Python path
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+UNITS = {'km': 1.0, 'mi': 0.621371, 'nm': 1 / 1.852}
+UNIT_NAMES = {'km': 'km', 'mi': 'miles', 'nm': 'nautical miles'}
+
+# WGS-84
+_A = 6378.137
+_F = 1 / 298.257223563
+_B = _A * (1 - _F)
+
+VINCENTY_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+CHUNK_ELEMENTS = 4_000_000  # distances held in memory at once by pairwise()
+LEAF_SIZE = 32
+
+
+def _scale(unit):
+    try:
+        return UNITS[unit]
+    except KeyError:
+        raise ValueError(f"unit must be one of {', '.join(UNITS)}") from None
+
+
+def haversine(lat1, lon1, lat2, lon2, unit='km'):
+    """Great-circle distance between two points given in degrees."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a))) * _scale(unit)
+
+
+def vincenty(lat1, lon1, lat2, lon2, unit='km'):
+    """Distance on the WGS-84 ellipsoid between two points given in degrees.
+
+    Falls back to haversine for the nearly antipodal pairs where the
+    iteration doesn't converge.
+    """
+    u1 = math.atan((1 - _F) * math.tan(math.radians(lat1)))
+    u2 = math.atan((1 - _F) * math.tan(math.radians(lat2)))
+    sin_u1, cos_u1, sin_u2, cos_u2 = math.sin(u1), math.cos(u1), math.sin(u2), math.cos(u2)
+    big_l = math.radians(lon2 - lon1)
+    lam = big_l
+    for _ in range(VINCENTY_ITERATIONS):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sm = cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha if cos2_alpha else 0.0
+        c = _F / 16 * cos2_alpha * (4 + _F * (4 - 3 * cos2_alpha))
+        previous = lam
+        lam = big_l + (1 - c) * _F * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sm + c * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        if abs(lam - previous) < VINCENTY_TOLERANCE:
+            break
+    else:
+        return haversine(lat1, lon1, lat2, lon2, unit)
+    u_sq = cos2_alpha * (_A ** 2 - _B ** 2) / _B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sm + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2)
+        - big_b / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    return _B * big_a * (sigma - delta_sigma) * _scale(unit)
+
+
+def _haversine_np(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _vincenty_np(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2)))
+    shape = lat1.shape
+    lat1, lon1, lat2, lon2 = (v.ravel() for v in (lat1, lon1, lat2, lon2))
+    u1 = np.arctan((1 - _F) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - _F) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1, sin_u2, cos_u2 = np.sin(u1), np.cos(u1), np.sin(u2), np.cos(u2)
+    big_l = np.radians(lon2 - lon1)
+    lam = big_l.copy()
+    sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sm = (np.zeros_like(lam) for _ in range(5))
+    active = np.arange(len(lam))  # pairs still iterating; most converge in a handful of rounds
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(VINCENTY_ITERATIONS):
+            s1, c1, s2, c2 = sin_u1[active], cos_u1[active], sin_u2[active], cos_u2[active]
+            sin_lam, cos_lam = np.sin(lam[active]), np.cos(lam[active])
+            ss = np.hypot(c2 * sin_lam, c1 * s2 - s1 * c2 * cos_lam)
+            cs = s1 * s2 + c1 * c2 * cos_lam
+            sg = np.arctan2(ss, cs)
+            sin_alpha = np.where(ss == 0, 0.0, c1 * c2 * sin_lam / ss)
+            c2a = 1 - sin_alpha ** 2
+            c2m = np.where(c2a == 0, 0.0, cs - 2 * s1 * s2 / c2a)
+            c = _F / 16 * c2a * (4 + _F * (4 - 3 * c2a))
+            updated = big_l[active] + (1 - c) * _F * sin_alpha * (
+                sg + c * ss * (c2m + c * cs * (-1 + 2 * c2m ** 2)))
+            done = np.abs(updated - lam[active]) < VINCENTY_TOLERANCE
+            sin_sigma[active], cos_sigma[active], sigma[active] = ss, cs, sg
+            cos2_alpha[active], cos_2sm[active] = c2a, c2m
+            lam[active] = updated
+            active = active[~done]
+            if not len(active):
+                break
+    u_sq = cos2_alpha * (_A ** 2 - _B ** 2) / _B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sm + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2)
+        - big_b / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    distance = np.where(sin_sigma == 0, 0.0, _B * big_a * (sigma - delta_sigma))
+    if len(active):
+        distance[active] = _haversine_np(lat1[active], lon1[active], lat2[active], lon2[active])
+    return distance.reshape(shape)
+
+
+def segment_distances(lats, lons, unit='km', ellipsoid=False):
+    """Distance of each leg of the track through the given points (n - 1 values)."""
+    scale = _scale(unit)
+    if np is not None:
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        if len(lats) < 2:
+            return np.zeros(0)
+        solve = _vincenty_np if ellipsoid else _haversine_np
+        return solve(lats[:-1], lons[:-1], lats[1:], lons[1:]) * scale
+    solve = vincenty if ellipsoid else haversine
+    return [solve(lats[i], lons[i], lats[i + 1], lons[i + 1], unit) for i in range(len(lats) - 1)]
+
+
+def cumulative_distances(lats, lons, unit='km', ellipsoid=False):
+    """Distance travelled along the track up to each point; starts at 0."""
+    legs = segment_distances(lats, lons, unit, ellipsoid)
+    if np is not None:
+        return np.concatenate(([0.0], np.cumsum(legs))) if len(lats) else np.zeros(0)
+    total, out = 0.0, [0.0] if len(lats) else []
+    for leg in legs:
+        total += leg
+        out.append(total)
+    return out
+
+
+def track_length(lats, lons, unit='km', ellipsoid=False):
+    """Total length of the track through the given points."""
+    legs = segment_distances(lats, lons, unit, ellipsoid)
+    return float(legs.sum()) if np is not None else math.fsum(legs)
+
+
+def pairwise(lats, lons, unit='km', chunk_elements=CHUNK_ELEMENTS):
+    """Yield (first_row, block) for the full distance matrix, a few rows at a time.
+
+    Each block holds the great-circle distances from rows
+    ``first_row .. first_row + len(block)`` to every point, so memory stays at
+    about ``chunk_elements`` floats however many points there are.
+    """
+    n = len(lats)
+    rows = max(1, chunk_elements // max(n, 1))
+    scale = _scale(unit)
+    if np is not None:
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        for start in range(0, n, rows):
+            stop = min(start + rows, n)
+            yield start, _haversine_np(lats[start:stop, None], lons[start:stop, None], lats, lons) * scale
+        return
+    for start in range(0, n, rows):
+        yield start, [[haversine(lats[i], lons[i], lats[j], lons[j], unit) for j in range(n)]
+                      for i in range(start, min(start + rows, n))]
+
+
+def nearest(lats, lons, k=1, unit='km'):
+    """Return (indices, distances) of each point's ``k`` nearest other points.
+
+    Both are n x k, closest first. Points are bucketed into leaves of a k-d
+    tree over their positions on the unit sphere, and each leaf only compares
+    against the leaves that can hold a closer point, so 100k markers take
+    seconds rather than the minutes an all-pairs scan would.
+    """
+    n = len(lats)
+    if not 0 < k < n:
+        raise ValueError(f"k must be between 1 and {n - 1}")
+    if np is None:
+        return _nearest_python(lats, lons, k, unit)
+    xyz = _unit_vectors(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+    order, bounds = _leaves(xyz)
+    lo = np.array([xyz[order[a:b]].min(axis=0) for a, b in bounds])
+    hi = np.array([xyz[order[a:b]].max(axis=0) for a, b in bounds])
+    sizes = np.array([b - a for a, b in bounds])
+    indices = np.empty((n, k), dtype=np.intp)
+    chords = np.empty((n, k))
+
+    for leaf, (a, b) in enumerate(bounds):
+        members = order[a:b]
+        query = xyz[members]
+        gap = np.maximum(0, np.maximum(lo - hi[leaf], lo[leaf] - hi))
+        box_distance = np.sqrt((gap ** 2).sum(axis=1))
+        # Any k other points give an upper bound on the search radius; the
+        # leaf itself usually has enough, otherwise take the closest leaves.
+        if b - a > k:
+            seed = members
+        else:
+            by_distance = np.argsort(box_distance, kind='stable')
+            enough = np.searchsorted(np.cumsum(sizes[by_distance]), k + 1) + 1
+            seed = _gather(order, bounds, by_distance[:enough])
+        radius = _kth_chord(query, xyz[seed], members, seed, k).max()
+        candidates = _gather(order, bounds, np.flatnonzero(box_distance <= radius))
+        d = np.sqrt(((query[:, None, :] - xyz[candidates][None, :, :]) ** 2).sum(axis=2))
+        d[members[:, None] == candidates[None, :]] = np.inf
+        part = np.argpartition(d, k - 1, axis=1)[:, :k]
+        part_d = np.take_along_axis(d, part, axis=1)
+        ranked = np.argsort(part_d, axis=1, kind='stable')
+        indices[members] = candidates[np.take_along_axis(part, ranked, axis=1)]
+        chords[members] = np.take_along_axis(part_d, ranked, axis=1)
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chords / 2, 1.0)) * _scale(unit)
+    return indices, distances
+
+
+def _unit_vectors(lats, lons):
+    lat, lon = np.radians(lats), np.radians(lons)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _leaves(xyz):
+    """Split points along their widest axis until each leaf has <= LEAF_SIZE."""
+    order = np.arange(len(xyz))
+    bounds = []
+    stack = [(0, len(xyz))]
+    while stack:
+        a, b = stack.pop()
+        if b - a <= LEAF_SIZE:
+            bounds.append((a, b))
+            continue
+        points = xyz[order[a:b]]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        mid = (b - a) // 2
+        order[a:b] = order[a:b][np.argpartition(points[:, axis], mid)]
+        stack.append((a + mid, b))
+        stack.append((a, a + mid))
+    return order, bounds
+
+
+def _gather(order, bounds, leaves):
+    return np.concatenate([order[bounds[leaf][0]:bounds[leaf][1]] for leaf in leaves])
+
+
+def _kth_chord(query, points, members, candidates, k):
+    d = np.sqrt(((query[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    d[members[:, None] == candidates[None, :]] = np.inf
+    return np.partition(d, k - 1, axis=1)[:, k - 1]
+
+
+def _nearest_python(lats, lons, k, unit):
+    indices, distances = [], []
+    for i in range(len(lats)):
+        best = heapq.nsmallest(k, ((haversine(lats[i], lons[i], lats[j], lons[j], unit), j)
+                                   for j in range(len(lats)) if j != i))
+        distances.append([d for d, _ in best])
+        indices.append([j for _, j in best])
+    return indices, distances
@@ -1,46 +1,194 @@
 #!/usr/bin/env python3
 import sys
 import webbrowser
-import requests
 import io
 import base64
 from PyQt6.QtWidgets import (QApplication, QWidget, QGridLayout, QHBoxLayout, 
                              QPushButton, QLabel, QLineEdit, QFileDialog, 
-                             QListWidget, QMessageBox, QInputDialog, QComboBox,
-                             QProgressDialog)
-from PyQt6.QtCore import Qt
+                             QTableView, QTabWidget, QAbstractItemView, QHeaderView, QVBoxLayout,
+                             QMessageBox, QInputDialog, QComboBox, QProgressDialog, QDialog,
+                             QTableWidget, QTableWidgetItem, QCheckBox, QPlainTextEdit)
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QIcon, QPixmap, QColor
-from io import BytesIO
-import folium
-from folium.plugins import FastMarkerCluster, HeatMap, AntPath
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
 import json
-from math import radians, sin, cos, sqrt, atan2
-from geopy.geocoders import Nominatim
-import simplekml
+import time
 import urllib.parse
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
-import re
-from requests.exceptions import RequestException
 from PIL import UnidentifiedImageError
 
+from .cache import ExtractionCache
+from .export import EXPORT_FORMATS
+from .extract import Extractor, is_valid_url
+from .fetch import is_network_error
+from .geocode import GeocodeCache, Geocoder, read_addresses
+from .gazetteer import Gazetteer
+from .geodesy import UNIT_NAMES, track_length
+from .ingest import ExportWorker, GeocodeWorker, IngestWorker, LoadWorker, Throughput, WatchWorker
+from .journal import UndoJournal
+from .models import InputErrorModel, MarkerFilterModel, MarkerTableModel
+from .mapbundle import FAST_THRESHOLD, LayerCache, MapBundle, dump_payload, marker_payload, popup_html, write_html
+from .profiling import CAPTURES, profiler
+from .project import PROJECT_SUFFIX, ProjectFile, is_project, read_json, write_json
+from .pyramid import ClusterPyramid
+from .scanner import scan_images
+from .store import MarkerStore
+from .thumbnails import ThumbnailCache, Thumbnailer, make_thumbnail
+from .watch import FileIndex, FolderWatcher
+
+TILED_KMZ = "Tiled KMZ for Google Earth"
+
+
+class StatsDialog(QDialog):
+    """Live view of the profiler's stages, with captures and a JSON export."""
+
+    COLUMNS = ('Stage', 'Calls', 'Errors', 'Total (s)', 'Mean (ms)', 'p50 (ms)', 'p95 (ms)', 'Max (ms)', 'MB')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Performance Stats")
+        self.resize(900, 560)
+        layout = QVBoxLayout(self)
+        self.recording = QCheckBox("Record stage timings", self)
+        self.recording.setChecked(profiler.enabled)
+        self.recording.setToolTip("Time loads, maps, saves and exports; off, it costs next to nothing.")
+        self.recording.toggled.connect(self.setRecording)
+        layout.addWidget(self.recording)
+        self.table = QTableWidget(0, len(self.COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        capture_layout = QHBoxLayout()
+        self.captureKind = QComboBox(self)
+        self.captureKind.addItems(CAPTURES)
+        self.captureKind.setToolTip("cProfile: where the time goes. tracemalloc: peak memory and where it was allocated.")
+        capture_layout.addWidget(self.captureKind)
+        captureButton = QPushButton('Profile Next Operation', self)
+        captureButton.clicked.connect(self.armCapture)
+        captureButton.setToolTip("Profile the next map view, save or export.")
+        capture_layout.addWidget(captureButton)
+        self.captureStatus = QLabel(self)
+        capture_layout.addWidget(self.captureStatus, 1)
+        layout.addLayout(capture_layout)
+        self.captureReport = QPlainTextEdit(self)
+        self.captureReport.setReadOnly(True)
+        self.captureReport.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.captureReport.setPlaceholderText("The report of the last profiled operation appears here.")
+        layout.addWidget(self.captureReport)
+
+        buttons = QHBoxLayout()
+        for label, slot in (('Reset', self.resetStats), ('Export JSON...', self.exportStats), ('Close', self.close)):
+            button = QPushButton(label, self)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.shown_capture = None
+        self.refresh()
+
+    def setRecording(self, on):
+        profiler.enabled = on
+
+    def armCapture(self):
+        profiler.arm(self.captureKind.currentText())
+        self.refresh()
+
+    def resetStats(self):
+        profiler.reset()
+        self.refresh()
+
+    def exportStats(self):
+        fileName, _ = QFileDialog.getSaveFileName(self, "Export Stats", "exifmapper-stats.json", "JSON Files (*.json)")
+        if not fileName:
+            return
+        try:
+            profiler.save(fileName)
+        except Exception as e:
+            QMessageBox.critical(self, "Export Error", f"Couldn’t export: {str(e)}")
+
+    def refresh(self):
+        stages = profiler.stages()
+        self.table.setRowCount(len(stages))
+        for row, stats in enumerate(stages):
+            values = (stats.name, stats.count, stats.errors, f"{stats.total:.3f}", f"{stats.mean * 1000:.3f}",
+                      f"{stats.percentile(0.5) * 1000:.3f}", f"{stats.percentile(0.95) * 1000:.3f}",
+                      f"{stats.max * 1000:.3f}", f"{stats.bytes / 1e6:.2f}" if stats.bytes else "")
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(str(value))
+                if column:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+        captures = list(profiler.captures)
+        if profiler.armed:
+            self.captureStatus.setText(f"The next operation will be profiled with {profiler.armed}.")
+        elif captures:
+            self.captureStatus.setText(captures[-1].title())
+        else:
+            self.captureStatus.setText("")
+        if captures and captures[-1] is not self.shown_capture:
+            self.shown_capture = captures[-1]
+            self.captureReport.setPlainText(f"{self.shown_capture.title()}\n\n{self.shown_capture.report}")
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
+
+    def showEvent(self, event):
+        self.timer.start()
+        self.refresh()
+        super().showEvent(event)
+
+
 class MapUI(QWidget):
     def __init__(self):
         super().__init__()
-        self.markers = []  # (location, name, timestamp, altitude, exif_data) tuples
-        self.undo_stack = []
-        self.redo_stack = []
+        self.markers = MarkerStore()  # iterates as (location, name, timestamp, altitude, exif_data) tuples
+        self.journal = UndoJournal(self.markers)
         self.show_distance_lines = False
         self.show_heatmap = False
+        self.distance_unit = 'mi'
+        self.map_bundle = True  # write map_bundle/ with markers.js and thumbnail files instead of one inline HTML file
+        self.fast_cluster_threshold = FAST_THRESHOLD  # inline maps with more markers skip per-marker popups
+        self.map_layers = LayerCache()  # thumbnails, payloads and track length of the last map
+        self.map_shown = None  # markers version of the bundle map last written
+        self.serve_map = True  # serve the map from a local server answering viewport queries
+        self.map_server = None  # started by the first map view
+        self.map_port = 0  # 0 picks a free port
+        self.map_page_key = None
+        self.map_publish = QTimer(self)
+        self.map_publish.setSingleShot(True)
+        self.map_publish.setInterval(1000)
+        self.map_publish.timeout.connect(self.publishMarkers)
+        self.markers.subscribe(self.onMarkersChanged)
+        self.temp_map = None
+        self.pyramid = None  # zoom-level cluster index, see cluster_pyramid()
+        self.pyramid_version = None
+        self.pyramid_threshold = 50_000  # saves with at least this many markers also write <file>.pyramid
+        self.extractor = Extractor(cache=ExtractionCache())
+        self.thumbnailer = Thumbnailer(cache=ThumbnailCache())
+        self.ingest_jobs = None  # worker count; None picks a default from the CPU count
+        self.ingest_processes = False  # use a process pool for CPU-bound parsing
+        self.ingest_worker = None
+        self.geocoder = None  # see geocoding()
+        self.geocode_backend = None  # None uses Nominatim; any object with geocode(query), see geocode.py
+        self.gazetteer = Gazetteer.find()  # offline place names from a GeoNames cities file; indexed on first use
+        self.project = None  # project file the markers were loaded from or saved to; saving writes only changes
+        self.duplicate_policy = None  # 'skip', 'overwrite' or 'keep'; None asks on each load into a non-empty list
+        self.scan_options = {}  # include/exclude globs, max_depth, symlinks; see scanner.scan_images
+        self.stats_dialog = None  # see showStats()
+        self.watch_worker = None  # see startWatch()
+        self.watch_index = None  # sizes and mtimes of the images watches have seen, opened on the first watch
+        self.watch_recording = False  # a set of watch changes is being recorded as one undo step
+        self.watch_map_current = False  # the bundle map was up to date when the current set started
+        self.watch_last = None  # time and counts of the last set of changes
         self.last_file = self.load_last_file()
+        self.restore_pending = True  # the last file loads once the window has been shown
         self.initUI()
-        if self.last_file and Path(self.last_file).exists():
-            try:
-                self.loadSavedData(self.last_file)
-            except Exception as e:
-                QMessageBox.critical(self, "Load Error", f"Could not load last file: {str(e)}")
 
     def initUI(self):
         self.setWindowTitle('ExifMapper')
@@ -87,6 +235,10 @@ class MapUI(QWidget):
         folderButton.clicked.connect(self.processFolder)
         folderButton.setToolTip("Recursively load all images from a folder.")
         input_layout.addWidget(folderButton)
+        self.watchButton = QPushButton('Watch Folder', self)
+        self.watchButton.clicked.connect(self.toggleWatch)
+        self.watchButton.setToolTip("Keep the list in step with a folder: new and changed images are added, deleted ones removed.")
+        input_layout.addWidget(self.watchButton)
         main_layout.addLayout(input_layout, 0, 0, 1, 2)
 
         # Action Buttons
@@ -111,13 +263,38 @@ class MapUI(QWidget):
         self.statusLabel = QLabel(f"Loaded Locations: {len(self.markers)}", self)
         main_layout.addWidget(self.statusLabel, 2, 0, 1, 2)
 
-        # Marker List
-        main_layout.addWidget(QLabel('Locations:'), 3, 0, 1, 2)
-        self.fileList = QListWidget(self)
-        self.fileList.itemDoubleClicked.connect(self.editMarker)
-        self.fileList.setToolTip("Double-click to rename a location; all loaded locations appear here.")
-        self.fileList.setMinimumHeight(150)
-        main_layout.addWidget(self.fileList, 4, 0, 1, 2)
+        # Marker List: a table over the marker store, and the inputs that failed
+        self.markerModel = MarkerTableModel(self.markers, self)
+        self.markerFilter = MarkerFilterModel(self.markerModel, self)
+        self.errorModel = InputErrorModel(self)
+        self.listTabs = QTabWidget(self)
+        locations = QWidget(self)
+        locations_layout = QVBoxLayout(locations)
+        locations_layout.setContentsMargins(0, 0, 0, 0)
+        self.locationFilter = QLineEdit(self)
+        self.locationFilter.setPlaceholderText("Filter by name, camera or place")
+        self.locationFilter.setClearButtonEnabled(True)
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(150)
+        self.filterTimer.timeout.connect(self.applyFilter)
+        self.locationFilter.textChanged.connect(self.filterTimer.start)
+        locations_layout.addWidget(self.locationFilter)
+        self.locationTable = self.tableView(self.markerFilter)
+        self.locationTable.doubleClicked.connect(self.editMarker)
+        self.locationTable.setToolTip("Double-click to rename a location; click a column header to sort.")
+        self.locationTable.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.locationTable.horizontalHeader().setSortIndicatorClearable(True)
+        self.locationTable.setSortingEnabled(True)
+        locations_layout.addWidget(self.locationTable)
+        self.listTabs.addTab(locations, "Locations")
+        self.errorTable = self.tableView(self.errorModel)
+        self.errorTable.setToolTip("Inputs that couldn't be added, and why.")
+        self.listTabs.addTab(self.errorTable, "Problems")
+        self.errorModel.rowsInserted.connect(self.updateErrorTab)
+        self.errorModel.modelReset.connect(self.updateErrorTab)
+        self.listTabs.setMinimumHeight(180)
+        main_layout.addWidget(self.listTabs, 3, 0, 2, 2)
 
         # Marker Management Buttons
         marker_buttons = QHBoxLayout()
@@ -129,9 +306,13 @@ class MapUI(QWidget):
         geocodeButton.clicked.connect(self.addGeocodedLocation)
         geocodeButton.setToolTip("Add a location by entering an address.")
         marker_buttons.addWidget(geocodeButton)
+        importAddressesButton = QPushButton('Import Addresses', self)
+        importAddressesButton.clicked.connect(self.importAddresses)
+        importAddressesButton.setToolTip("Geocode a CSV file of addresses (an 'address' column, or street/city/country).")
+        marker_buttons.addWidget(importAddressesButton)
         removeMarkerButton = QPushButton('Remove Selected', self)
         removeMarkerButton.clicked.connect(self.removeMarker)
-        removeMarkerButton.setToolTip("Remove the currently selected location.")
+        removeMarkerButton.setToolTip("Remove the selected locations.")
         marker_buttons.addWidget(removeMarkerButton)
         clearButton = QPushButton('Clear All', self)
         clearButton.clicked.connect(self.clearAll)
@@ -163,16 +344,24 @@ class MapUI(QWidget):
         save_load_layout = QHBoxLayout()
         saveButton = QPushButton('Save Locations', self)
         saveButton.clicked.connect(self.saveData)
-        saveButton.setToolTip("Save all locations to a JSON file.")
+        saveButton.setToolTip("Save locations; an open project only writes what changed.")
         save_load_layout.addWidget(saveButton)
-        exportKMLButton = QPushButton('Export to KML', self)
-        exportKMLButton.clicked.connect(self.exportKML)
-        exportKMLButton.setToolTip("Export locations to KML for Google Earth.")
-        save_load_layout.addWidget(exportKMLButton)
+        saveAsButton = QPushButton('Save As...', self)
+        saveAsButton.clicked.connect(self.saveDataAs)
+        saveAsButton.setToolTip("Save all locations to a new project or JSON file.")
+        save_load_layout.addWidget(saveAsButton)
+        exportButton = QPushButton('Export...', self)
+        exportButton.clicked.connect(self.exportData)
+        exportButton.setToolTip("Export locations to KML/KMZ for Google Earth, GeoJSON, GPX or CSV.")
+        save_load_layout.addWidget(exportButton)
         loadSavedButton = QPushButton('Load Saved Locations', self)
         loadSavedButton.clicked.connect(lambda: self.loadSavedData())
-        loadSavedButton.setToolTip("Add locations from a saved JSON file.")
+        loadSavedButton.setToolTip("Add locations from a saved project or JSON file.")
         save_load_layout.addWidget(loadSavedButton)
+        statsButton = QPushButton('Stats', self)
+        statsButton.clicked.connect(self.showStats)
+        statsButton.setToolTip("Time each stage of loads, maps, saves and exports, or profile one of them.")
+        save_load_layout.addWidget(statsButton)
         helpButton = QPushButton('Help', self)
         helpButton.clicked.connect(self.showHelp)
         helpButton.setToolTip("View instructions for using the app.")
@@ -213,381 +402,624 @@ class MapUI(QWidget):
     def processFolder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Folder")
         if folder:
-            try:
-                image_files = []
-                extensions = ('*.png', '*.jpg', '*.jpeg')
-                # Initialize progress dialog
-                progress = QProgressDialog("Scanning folder for images...", "Cancel", 0, 0, self)
-                progress.setWindowModality(Qt.WindowModality.WindowModal)
-                progress.setMinimumDuration(0)
-                progress.setValue(0)
-                progress.show()
-                QApplication.processEvents()
-
-                for ext in extensions:
-                    for file in Path(folder).rglob(ext):
-                        image_files.append(str(file))
-                        progress.setValue(progress.value() + 1)
-                        QApplication.processEvents()
-                        if progress.wasCanceled():
-                            progress.close()
-                            QMessageBox.information(self, "Cancelled", "Folder processing cancelled.")
-                            return
-
-                progress.close()
-                if image_files:
-                    self.fileInput.setText(", ".join(image_files))
-                    QMessageBox.information(self, "Success", f"Found {len(image_files)} image(s). Click 'Load Location' to process.")
-                else:
-                    QMessageBox.warning(self, "No Images", "No images found in the selected folder!")
-            except Exception as e:
-                QMessageBox.critical(self, "Folder Error", f"Failed to process folder: {str(e)}")
+            if self.ingest_worker is not None:
+                QMessageBox.warning(self, "Busy", "Images are still being loaded!")
+                return
+            # Paths stream from the scanner straight into the extraction pool.
+            self.startIngest(scan_images(folder, **self.scan_options))
+        else:
+            QMessageBox.information(self, "No Selection", "No folder selected.")
+
+    def toggleWatch(self):
+        if self.watch_worker is not None:
+            self.stopWatch()
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder to Watch")
+        if folder:
+            self.startWatch(folder)
         else:
             QMessageBox.information(self, "No Selection", "No folder selected.")
 
+    def startWatch(self, folder):
+        """Watch a folder in the background; only new, changed and deleted images are processed."""
+        try:
+            if self.watch_index is None:
+                self.watch_index = FileIndex()
+            watcher = FolderWatcher(folder, self.watch_index, **self.scan_options)
+        except Exception as e:
+            QMessageBox.critical(self, "Watch Error", f"Couldn’t watch {folder}: {str(e)}")
+            return
+        worker = WatchWorker(self.extractor, watcher, known=set(self.markers.names()),
+                             jobs=self.ingest_jobs, parent=self)
+        worker.batchReady.connect(self.onWatchBatch)
+        worker.changesDone.connect(self.onWatchChanges)
+        worker.finished.connect(self.onWatchFinished)
+        self.watch_worker = worker
+        self.watch_last = None
+        self.watchButton.setText('Stop Watching')
+        self.updateStatus()
+        worker.start()
+
+    def stopWatch(self):
+        # onWatchFinished cleans up once the batches already sent have been applied.
+        self.watch_worker.stop()
+        self.watchButton.setText('Stopping...')
+        self.watchButton.setEnabled(False)
+
+    def onWatchBatch(self, batch, removed):
+        if not self.watch_recording:
+            self.journal.begin("Watch Folder")
+            self.watch_recording = True
+            self.watch_map_current = self.map_shown == self.markers.version
+        found = self.with_places([(result[0], item) + tuple(result[1:]) for item, result, error in batch
+                                  if error is None and result is not None and result[0]])
+        problems = [(item, self.input_problem(item, result, error)) for item, result, error in batch
+                    if error is not None or result is None or not result[0]]
+        # Changed images replace their marker in place; assignments compact the store, so removals come last.
+        new = []
+        replaced = set()
+        for loc, item, timestamp, altitude, exif_data in found:
+            rows = self.markers.rows_named(item)
+            if rows:
+                self.markers[self.markers.position(min(rows))] = (loc, item, timestamp, altitude, exif_data)
+                replaced.add(item)
+            else:
+                new.append((loc, item, timestamp, altitude, exif_data))
+        self.markers.extend(new)
+        stale = [row for item in replaced for row in sorted(self.markers.rows_named(item))[1:]]
+        # Deleted images, and images that no longer have GPS data.
+        for item in list(removed) + [item for item, problem in problems if problem == "No GPS Data Found"]:
+            stale.extend(self.markers.rows_named(item))
+        if stale:
+            self.markers.remove_rows(stale)
+        self.errorModel.add(problems)
+        self.updateStatus()
+
+    def onWatchChanges(self, added, changed, removed):
+        if self.watch_recording:
+            self.journal.commit()
+            self.watch_recording = False
+        self.watch_last = f"{added} new, {changed} changed, {removed} deleted at {time.strftime('%H:%M:%S')}"
+        # A served map gets the changes by itself; an open bundle map is rewritten for its next reload.
+        if (not self.serve_map and self.map_bundle and self.watch_map_current and self.markers
+                and self.map_shown != self.markers.version):
+            self.renderMap(open_browser=False)
+        self.updateStatus()
+
+    def onWatchFinished(self):
+        worker, self.watch_worker = self.watch_worker, None
+        worker.deleteLater()
+        if self.watch_recording:
+            self.journal.commit()
+            self.watch_recording = False
+        self.watchButton.setText('Watch Folder')
+        self.watchButton.setEnabled(True)
+        self.updateStatus()
+        if worker.error is not None:
+            QMessageBox.critical(self, "Watch Error", f"Stopped watching {worker.watcher.root}: {str(worker.error)}")
+
     def is_valid_url(self, url):
         """Check if the input is a valid URL."""
-        try:
-            parsed = urllib.parse.urlparse(url)
-            return parsed.scheme in ('http', 'https') and bool(re.match(r'^[\w\-\.\:\/]+$', parsed.netloc))
-        except Exception:
-            return False
+        return is_valid_url(url)
 
     def loadGPSData(self):
-        self.undo_stack.append(self.markers.copy())
-        self.redo_stack.clear()
+        if self.ingest_worker is not None:
+            QMessageBox.warning(self, "Busy", "Images are still being loaded!")
+            return
         inputs = [x.strip() for x in self.fileInput.text().split(',')]
         if not inputs or all(not x for x in inputs):
             QMessageBox.warning(self, "Oops", "Please enter an image URL or path first!")
             return
         
         validated_inputs = []
-        from_file_flags = []
         for item in inputs:
-            if self.is_valid_url(item):
-                validated_inputs.append(item)
-                from_file_flags.append(False)
-            elif Path(item).is_file():
+            if self.is_valid_url(item) or Path(item).is_file():
                 validated_inputs.append(item)
-                from_file_flags.append(True)
             else:
-                self.fileList.addItem(f"{item} - Invalid URL or file path")
+                self.errorModel.add([(item, "Invalid URL or file path")])
 
         if not validated_inputs:
             QMessageBox.warning(self, "No Valid Inputs", "No valid URLs or file paths found!")
             return
+        self.startIngest(validated_inputs, len(validated_inputs), clear_input=True)
 
-        new_locations = 0
-        try:
-            with ThreadPoolExecutor() as executor:
-                results = executor.map(self.get_loc, validated_inputs, from_file_flags)
-            for item, result in zip(validated_inputs, results):
-                try:
-                    if result is None:
-                        self.fileList.addItem(f"{item} - No GPS Data Found")
-                        continue
-                    loc, timestamp, altitude, exif_data = result
-                    if loc:
-                        if not self.is_duplicate(loc, item):
-                            self.markers.append((loc, item, timestamp, altitude, exif_data))
-                            self.fileList.addItem(item)
-                            new_locations += 1
-                        else:
-                            reply = QMessageBox.question(self, "Duplicate Found", 
-                                                        f"'{item}' already exists. Overwrite?", 
-                                                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, 
-                                                        QMessageBox.StandardButton.No)
-                            if reply == QMessageBox.StandardButton.Yes:
-                                self.removeMarkerByName(item)
-                                self.markers.append((loc, item, timestamp, altitude, exif_data))
-                                self.fileList.addItem(item)
-                                new_locations += 1
-                    else:
-                        self.fileList.addItem(f"{item} - No GPS Data Found")
-                except RequestException as e:
-                    self.fileList.addItem(f"{item} - Network Error: {str(e)}")
-                except FileNotFoundError:
-                    self.fileList.addItem(f"{item} - File not found")
-                except UnidentifiedImageError:
-                    self.fileList.addItem(f"{item} - Invalid image format")
-                except Exception as e:
-                    self.fileList.addItem(f"{item} - Error: {str(e)}")
-        except Exception as e:
-            QMessageBox.critical(self, "Processing Error", f"Failed to process images: {str(e)}")
+    def startIngest(self, inputs, total=0, clear_input=False):
+        """Extract GPS data from inputs in the background; results arrive in batches."""
+        policy = self.duplicate_policy or self.askDuplicatePolicy()
+        if policy is None:
             return
+        self.ingest_clear_input = clear_input
+        self.ingest_policy = policy
+        self.journal.begin("Load Locations")
+        self.extractor.reset_stats()
+        self.ingest_new = 0
+        self.ingest_throughput = Throughput()
+        worker = IngestWorker(self.extractor, inputs, total, jobs=self.ingest_jobs,
+                              processes=self.ingest_processes, parent=self)
+        self.startWorker(worker, "Loading Locations", "Loading images...", total)
+        worker.batchReady.connect(self.onIngestBatch)
+        worker.finished.connect(self.onIngestFinished)
+        worker.start()
+
+    def startWorker(self, worker, title, label, total):
+        """Show a progress dialog for a background worker and make it the current ingest."""
+        self.ingest_progress = QProgressDialog(label, "Cancel", 0, total, self)
+        self.ingest_progress.setWindowTitle(title)
+        self.ingest_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.ingest_progress.setMinimumDuration(500)
+        self.ingest_progress.setAutoClose(False)
+        self.ingest_progress.setAutoReset(False)
+        self.ingest_progress.canceled.connect(self.cancelIngest)
+        self.ingest_worker = worker
+        worker.progress.connect(self.onIngestProgress)
+
+    def cancelIngest(self):
+        if self.ingest_worker is not None:
+            self.ingest_worker.cancel()
 
+    def onIngestBatch(self, batch):
+        found = iter(self.with_places([(result[0], item) + tuple(result[1:]) for item, result, error in batch
+                                       if error is None and result is not None and result[0]]))
+        problems = []
+        markers = []
+        for item, result, error in batch:
+            problem = self.input_problem(item, result, error)
+            if problem is not None:
+                problems.append((item, problem))
+            else:
+                markers.append(next(found))
+        added, replaced, _ = self.mergeMarkers(markers, self.ingest_policy)
+        self.ingest_new += added + replaced
+        self.errorModel.add(problems)
         self.updateStatus()
-        if new_locations > 0:
-            QMessageBox.information(self, "Success", f"Added {new_locations} new location(s).")
-            self.fileInput.clear()
+
+    def input_problem(self, item, result, error):
+        """Why an extraction result can't become a marker, or None if it can."""
+        if is_network_error(error):
+            return f"Network Error: {str(error)}"
+        if isinstance(error, FileNotFoundError):
+            return "File not found"
+        if isinstance(error, UnidentifiedImageError):
+            return "Invalid image format"
+        if error is not None:
+            return f"Error: {str(error)}"
+        if result is None or not result[0]:
+            return "No GPS Data Found"
+        return None
+
+    def onIngestProgress(self, done, total):
+        if self.ingest_worker is None:
+            return
+        if total:
+            self.ingest_progress.setValue(done)
+        self.ingest_progress.setLabelText(self.ingest_throughput.describe(done, total))
+
+    def onIngestFinished(self):
+        worker, self.ingest_worker = self.ingest_worker, None
+        self.ingest_progress.close()
+        worker.deleteLater()
+        self.journal.commit()
+        self.extractor.flush()
+        self.updateStatus()
+        self.statusLabel.setText(f"{self.statusLabel.text()} | {self.extractor.summary()}")
+        self.statusLabel.setToolTip(self.extractor.scheduler.report())  # downloads per host
+        if worker.cancelled:
+            QMessageBox.information(self, "Cancelled", f"Loading cancelled. Added {self.ingest_new} new location(s).")
+        elif worker.done == 0:
+            QMessageBox.warning(self, "No Images", "No images found to load!")
+        elif self.ingest_new > 0:
+            QMessageBox.information(self, "Success", f"Added {self.ingest_new} new location(s).")
+            if self.ingest_clear_input:
+                self.fileInput.clear()
         elif self.markers:
             QMessageBox.information(self, "No New Locations", "No new GPS data added.")
         else:
             QMessageBox.warning(self, "No Locations", "No GPS data found. Try another image.")
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.restore_pending:
+            self.restore_pending = False
+            # Queued behind the first paint, so the window appears before the last file is opened.
+            QTimer.singleShot(0, self.restoreLastFile)
+
+    def restoreLastFile(self):
+        if self.last_file and Path(self.last_file).exists():
+            try:
+                self.loadSavedData(self.last_file)
+            except Exception as e:
+                QMessageBox.critical(self, "Load Error", f"Could not load last file: {str(e)}")
+
+    def closeEvent(self, event):
+        if self.ingest_worker is not None:
+            self.ingest_worker.cancel()
+            self.ingest_worker.wait()
+        if self.watch_worker is not None:
+            self.watch_worker.stop()
+            self.watch_worker.wait()
+        if self.watch_index is not None:
+            self.watch_index.close()
+        self.extractor.flush()
+        self.extractor.scheduler.close()
+        if self.geocoder is not None:
+            self.geocoder.cache.close()
+        if self.map_server is not None:
+            self.map_server.stop()
+        if self.project is not None:
+            self.project.close()
+        if self.temp_map is not None and self.temp_map.exists():
+            try:
+                self.temp_map.unlink()
+            except Exception:
+                pass
+        super().closeEvent(event)
+
     def get_loc(self, file_or_url, from_file=True):
-        try:
-            exif_data = None
-            if from_file:
-                with Image.open(file_or_url) as img:
-                    img.verify()  # Validate image
-                    img = Image.open(file_or_url)  # Reopen after verification
-                    exif_data = img._getexif()
-            else:
-                response = requests.get(file_or_url, timeout=5)
-                response.raise_for_status()
-                img_data = BytesIO(response.content)
-                with Image.open(img_data) as img:
-                    img.verify()  # Validate image
-                    img = Image.open(BytesIO(response.content))  # Reopen after verification
-                    exif_data = img._getexif()
-            
-            if not exif_data:
-                return None, None, None, None
-
-            exif_data = {TAGS.get(tag, tag): value for tag, value in exif_data.items()}
-            loc, altitude = self.get_gps_data(exif_data)
-            timestamp = exif_data.get('DateTime', None)
-            additional_exif = {
-                'CameraModel': exif_data.get('Model', 'N/A'),
-                'Exposure': exif_data.get('ExposureTime', 'N/A')
-            }
-            return loc, timestamp, altitude, additional_exif
-        except FileNotFoundError:
-            raise
-        except UnidentifiedImageError:
-            raise
-        except RequestException as e:
-            raise
-        except Exception as e:
-            raise Exception(f"Processing failed: {str(e)}")
+        return self.extractor.get_loc(file_or_url, from_file)
 
     def get_gps_data(self, tags):
-        if 'GPSInfo' not in tags or not tags['GPSInfo']:
-            return None, None
-        gps_info = {GPSTAGS.get(key, key): value for key, value in tags['GPSInfo'].items()}
-        lat = gps_info.get('GPSLatitude')
-        lat_ref = gps_info.get('GPSLatitudeRef')
-        lon = gps_info.get('GPSLongitude')
-        lon_ref = gps_info.get('GPSLongitudeRef')
-        alt = gps_info.get('GPSAltitude')
-        if lat and lat_ref and lon and lon_ref:
-            try:
-                lat = self.convert_to_degrees(lat, lat_ref)
-                lon = self.convert_to_degrees(lon, lon_ref)
-                alt_value = float(alt) if alt else None
-                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
-                    return None, None
-                return [lat, lon], alt_value
-            except (ValueError, TypeError):
-                return None, None
-        return None, None
+        return self.extractor.get_gps_data(tags)
 
     def convert_to_degrees(self, value, ref):
-        try:
-            d, m, s = value
-            degrees = float(d)
-            minutes = float(m) / 60.0
-            seconds = float(s) / 3600.0
-            result = degrees + minutes + seconds
-            if ref in ['S', 'W']:
-                result = -result
-            return result
-        except (ValueError, TypeError) as e:
-            raise ValueError(f"Invalid GPS coordinate format: {str(e)}")
+        return self.extractor.convert_to_degrees(value, ref)
 
+    @profiler.timed('thumbnails.compress_image')
     def compress_image(self, file_path, max_width=100):
-        try:
-            with Image.open(file_path) as img:
-                img.verify()  # Validate image
-                img = Image.open(file_path)  # Reopen after verification
-                img.thumbnail((max_width, max_width))
-                buffer = BytesIO()
-                img.save(buffer, format="JPEG", quality=75)
-                return buffer.getvalue()
-        except FileNotFoundError:
-            return None
-        except UnidentifiedImageError:
-            return None
-        except Exception:
-            return None
+        if max_width != self.thumbnailer.size:
+            return make_thumbnail(file_path, max_width)
+        return self.thumbnailer.thumbnails([file_path]).get(file_path)
 
     def displayMap(self):
+        with profiler.operation('map.display'):
+            self.renderMap()
+
+    def baseMap(self):
+        """An empty folium map centred on the markers, with the chosen tiles."""
+        import folium  # on first map; it takes longer to import than the rest of the app
+
+        lats, lons = self.markers.coordinates()
+        avg_lat = sum(lats) / len(self.markers)
+        avg_lon = sum(lons) / len(self.markers)
+        m = folium.Map(location=[avg_lat, avg_lon], zoom_start=12)
+        tile_choice = self.mapTiles.currentText()
+        if tile_choice == 'OpenStreetMap':
+            folium.TileLayer(tiles='openstreetmap', attr='© OpenStreetMap contributors').add_to(m)
+        elif tile_choice == 'Stamen Terrain':
+            folium.TileLayer(tiles='stamen terrain', attr='Map tiles by Stamen Design, under CC BY 3.0. Data by OpenStreetMap, under ODbL.').add_to(m)
+        elif tile_choice == 'CartoDB Positron':
+            folium.TileLayer(tiles='cartodb positron', attr='© CartoDB, © OpenStreetMap contributors').add_to(m)
+        return m
+
+    def renderMap(self, open_browser=True):
+        """Build the map from the cached layers; with open_browser=False only rewrite an open bundle."""
         if not self.markers:
             QMessageBox.warning(self, "Oops", "No locations loaded yet!")
             return
+        if self.serve_map:
+            return self.serveMap(open_browser)
+        import folium
+        from folium.plugins import AntPath, FastMarkerCluster, HeatMap, MarkerCluster
+        from .layers import MarkerLayer
+
         try:
-            avg_lat = sum(m[0][0] for m in self.markers) / len(self.markers)
-            avg_lon = sum(m[0][1] for m in self.markers) / len(self.markers)
-            m = folium.Map(location=[avg_lat, avg_lon], zoom_start=12)
-            tile_choice = self.mapTiles.currentText()
-            if tile_choice == 'OpenStreetMap':
-                folium.TileLayer(tiles='openstreetmap', attr='© OpenStreetMap contributors').add_to(m)
-            elif tile_choice == 'Stamen Terrain':
-                folium.TileLayer(tiles='stamen terrain', attr='Map tiles by Stamen Design, under CC BY 3.0. Data by OpenStreetMap, under ODbL.').add_to(m)
-            elif tile_choice == 'CartoDB Positron':
-                folium.TileLayer(tiles='cartodb positron', attr='© CartoDB, © OpenStreetMap contributors').add_to(m)
+            bundle = MapBundle() if self.map_bundle else None
+            version = self.markers.version
+            lats, lons = self.markers.coordinates()
+            m = self.baseMap()
             
-            marker_cluster = FastMarkerCluster([]).add_to(m)
-            for loc, name, timestamp, altitude, exif_data in self.markers:
-                popup_text = f"<b>{name}</b>"
-                if timestamp:
-                    try:
-                        date, time = timestamp.split(" ")
-                        popup_text += f"<br>Time: {time}<br>Date: {date.replace(':', '-')}"
-                    except ValueError:
-                        popup_text += f"<br>Timestamp: {timestamp}"
-                if altitude is not None:
-                    popup_text += f"<br>Altitude: {altitude:.1f} m"
-                if exif_data:
-                    popup_text += f"<br>Camera: {exif_data['CameraModel']}<br>Exposure: {exif_data['Exposure']}"
-                if name.startswith(('http://', 'https://')):
-                    popup_text += f"<br><img src='{name}' width='100'>"
-                else:
-                    try:
-                        img_data = self.compress_image(name)
-                        if img_data:
-                            img_b64 = base64.b64encode(img_data).decode('utf-8')
-                            popup_text += f"<br><img src='data:image/jpeg;base64,{img_b64}' width='100'>"
-                    except Exception:
-                        pass
-                folium.Marker(loc, popup=folium.Popup(popup_text, max_width=300)).add_to(marker_cluster)
+            # Large inline maps send flat arrays to the browser instead of one folium.Marker each.
+            fast = bundle is not None or len(self.markers) > self.fast_cluster_threshold
+            thumbnails = {}
+            if bundle is not None or not fast:
+                thumbnails = self.map_layers.get(self.markers, 'thumbnails', lambda: self.thumbnailer.thumbnails(
+                    name for name in self.markers.names() if not name.startswith(('http://', 'https://'))))
+            if fast:
+                marker_cluster = MarkerCluster(name='Markers', chunkedLoading=True).add_to(m)
+            else:
+                marker_cluster = FastMarkerCluster([], name='Markers').add_to(m)
+                for loc, popup_text in self.map_layers.get(self.markers, 'popups', lambda: self.popups(thumbnails)):
+                    folium.Marker(loc, popup=folium.Popup(popup_text, max_width=300)).add_to(marker_cluster)
             
-            if self.show_distance_lines and len(self.markers) >= 2:
-                total_distance = 0
-                coords = [marker[0] for marker in self.markers]
-                for i in range(len(coords) - 1):
-                    lat1, lon1 = map(radians, coords[i])
-                    lat2, lon2 = map(radians, coords[i + 1])
-                    dlat, dlon = lat2 - lat1, lon2 - lon1
-                    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                    c = 2 * atan2(sqrt(a), sqrt(1-a))
-                    distance_km = 6371 * c
-                    distance_miles = distance_km * 0.621371
-                    total_distance += distance_miles
-                AntPath(coords, tooltip=f"Total Distance: {total_distance:.2f} miles", color='red').add_to(m)
+            # Overlays are always built and switched from the layer control; the toggles set what shows first.
+            path_layer, path_tooltip = None, None
+            if len(self.markers) >= 2:
+                total_distance = self.map_layers.get(self.markers, ('track', self.distance_unit),
+                                                     lambda: track_length(lats, lons, unit=self.distance_unit))
+                path_tooltip = f"Total Distance: {total_distance:.2f} {UNIT_NAMES[self.distance_unit]}"
+                path_layer = folium.FeatureGroup(name='Distance Lines', show=self.show_distance_lines).add_to(m)
+                if not fast:
+                    coords = [[round(lat, 6), round(lon, 6)] for lat, lon in zip(lats, lons)]
+                    AntPath(coords, tooltip=path_tooltip, color='red').add_to(path_layer)
             
-            if self.show_heatmap:
-                heat_data = [[loc[0], loc[1]] for loc, _, _, _, _ in self.markers]
-                HeatMap(heat_data).add_to(m)
-
-            temp_html = Path('temp_map.html')
-            m.save(str(temp_html))
-            webbrowser.open(temp_html.absolute().as_uri())
-            QMessageBox.information(self, "Map Ready", "Map opened in your browser!")
+            # The marker layer fills the heatmap from its own arrays instead of inlining the points twice.
+            heat_data = [] if fast else [[lat, lon] for lat, lon in zip(lats, lons)]
+            heatmap = HeatMap(heat_data, name='Heatmap', show=self.show_heatmap).add_to(m)
+            if fast and bundle is None:
+                payload = self.map_layers.get(self.markers, 'payload', lambda: dump_payload(marker_payload(self.markers)))
+                MarkerLayer(marker_cluster, payload, heatmap, path_layer, path_tooltip).add_to(m)
+
+            if bundle is not None:
+                # markers.js and the thumbnails are only rewritten when the markers change.
+                self.map_layers.get(self.markers, 'bundle', lambda: bundle.write_markers(
+                    marker_payload(self.markers, bundle.write_thumbnails(thumbnails))))
+                folium.LayerControl().add_to(m)
+                report = bundle.save(m, marker_cluster, heatmap, path_layer, path_tooltip)
+                self.map_shown = version
+                self.statusLabel.setText(f"Loaded Locations: {len(self.markers)} | Map: {report}")
+                if open_browser:
+                    webbrowser.open(bundle.index.absolute().as_uri())
+                    QMessageBox.information(self, "Map Ready", f"Map opened in your browser!\n{report}")
+            else:
+                folium.LayerControl().add_to(m)
+                # Removed on exit rather than right away, so the browser can't find it gone.
+                self.temp_map = Path('temp_map.html')
+                write_html(m, self.temp_map)
+                webbrowser.open(self.temp_map.absolute().as_uri())
+                QMessageBox.information(self, "Map Ready", "Map opened in your browser!")
         except Exception as e:
             QMessageBox.critical(self, "Map Error", f"Failed to display map: {str(e)}")
-        finally:
-            if temp_html.exists():
-                try:
-                    temp_html.unlink()
-                except Exception:
-                    pass
+
+    def serveMap(self, open_browser=True):
+        """Publish the markers to the local map server; open a tab unless a map page is already polling it."""
+        try:
+            if self.map_server is None:
+                from .server import MapServer
+
+                self.map_server = MapServer(self.thumbnailer, port=self.map_port).start()
+            # An open page reloads when the page changes, so only republish it when its settings did.
+            page_key = (self.mapTiles.currentText(), self.show_distance_lines, self.show_heatmap, self.distance_unit)
+            page = None
+            if page_key != self.map_page_key:
+                page = self.mapPage()
+                self.map_page_key = page_key
+            self.publishMarkers(page)
+            url = self.map_server.url
+            if open_browser and not self.map_server.connected():
+                webbrowser.open(url)
+                self.statusLabel.setText(f"Loaded Locations: {len(self.markers)} | Map: {url}")
+                QMessageBox.information(self, "Map Ready", f"Map opened in your browser!\n{url}")
+            else:
+                self.statusLabel.setText(f"Loaded Locations: {len(self.markers)} | Map updated in the open browser tab")
+        except Exception as e:
+            QMessageBox.critical(self, "Map Error", f"Failed to display map: {str(e)}")
+
+    def mapPage(self):
+        """HTML of the served map: base layers plus a client that asks the server for its viewport."""
+        import folium
+        from folium.plugins import HeatMap
+        from .layers import ViewportLayer
+
+        m = self.baseMap()
+        marker_layer = folium.FeatureGroup(name='Markers').add_to(m)
+        path_layer = folium.FeatureGroup(name='Distance Lines', show=self.show_distance_lines).add_to(m)
+        heatmap = HeatMap([], name='Heatmap', show=self.show_heatmap).add_to(m)
+        ViewportLayer(marker_layer, heatmap, path_layer, self.distance_unit).add_to(m)
+        folium.LayerControl().add_to(m)
+        with profiler.stage('map.serialise'):
+            return m.get_root().render()
+
+    def publishMarkers(self, page=None):
+        if self.map_server is None:
+            return
+        pyramid = self.pyramid if self.pyramid_version == self.markers.version else None
+        with profiler.stage('map.publish'):
+            self.map_server.publish(self.markers.copy(), page, pyramid)
+
+    def onMarkersChanged(self, op, *args):
+        # An open map page gets the new markers a moment after the last change, not once per change.
+        if self.map_server is not None and self.map_server.connected() and not self.map_publish.isActive():
+            self.map_publish.start()
+
+    def popups(self, thumbnails):
+        """Return ``(location, popup html)`` for every marker, for maps with one folium.Marker each."""
+        popups = []
+        for loc, name, timestamp, altitude, exif_data in self.markers:
+            image = None
+            if name.startswith(('http://', 'https://')):
+                image = name
+            else:
+                img_data = thumbnails.get(name)
+                if img_data:
+                    image = f"data:image/jpeg;base64,{base64.b64encode(img_data).decode('utf-8')}"
+            popups.append((loc, popup_html(name, timestamp, altitude, exif_data, image)))
+        return popups
 
     def saveData(self):
+        if not self.markers and self.project is None:
+            QMessageBox.warning(self, "Oops", "No locations to save!")
+            return
+        if self.project is None:
+            self.saveDataAs()
+            return
+        try:
+            with profiler.operation('save.project') as stage:
+                changed = self.project.save()
+                if len(self.markers) >= self.pyramid_threshold:
+                    self.cluster_pyramid().save_for(self.project.path)
+                stage.bytes = Path(self.project.path).stat().st_size
+            self.last_file = self.project.path
+            self.save_last_file(self.project.path)
+            QMessageBox.information(self, "Saved", f"Saved {changed} change(s) to {self.project.path}!")
+        except Exception as e:
+            QMessageBox.critical(self, "Save Error", f"Couldn’t save: {str(e)}")
+
+    def saveDataAs(self):
         if not self.markers:
             QMessageBox.warning(self, "Oops", "No locations to save!")
             return
-        fileName, _ = QFileDialog.getSaveFileName(self, "Save Your Locations", "", "JSON Files (*.json)")
+        fileName, selected = QFileDialog.getSaveFileName(
+            self, "Save Your Locations", "", f"ExifMapper Projects (*{PROJECT_SUFFIX});;JSON Files (*.json)")
         if fileName:
             try:
-                with open(fileName, 'w') as f:
-                    json.dump(self.markers, f)
+                if fileName.lower().endswith('.json') or (selected.startswith('JSON') and not Path(fileName).suffix):
+                    if not Path(fileName).suffix:
+                        fileName += '.json'
+                    with profiler.operation('save.json') as stage:
+                        write_json(fileName, self.markers)
+                        stage.bytes = Path(fileName).stat().st_size
+                else:
+                    if not Path(fileName).suffix:
+                        fileName += PROJECT_SUFFIX
+                    if self.project is not None:
+                        self.project.close()
+                        self.project = None
+                    with profiler.operation('save.project') as stage:
+                        self.project = ProjectFile.create(fileName, self.markers)
+                        stage.bytes = Path(fileName).stat().st_size
+                if len(self.markers) >= self.pyramid_threshold:
+                    self.cluster_pyramid().save_for(fileName)
                 self.last_file = fileName
                 self.save_last_file(fileName)
                 QMessageBox.information(self, "Saved", f"Locations saved to {fileName}!")
             except Exception as e:
                 QMessageBox.critical(self, "Save Error", f"Couldn’t save: {str(e)}")
 
-    def exportKML(self):
+    def exportData(self):
         if not self.markers:
             QMessageBox.warning(self, "Oops", "No locations to export!")
             return
-        fileName, _ = QFileDialog.getSaveFileName(self, "Export to KML", "", "KML Files (*.kml)")
-        if fileName:
-            try:
-                kml = simplekml.Kml()
-                for loc, name, timestamp, altitude, exif_data in self.markers:
-                    pnt = kml.newpoint(name=name, coords=[(loc[1], loc[0], altitude or 0)])
-                    description = []
-                    if timestamp:
-                        try:
-                            date, time = timestamp.split(" ")
-                            description.append(f"Time: {time}\nDate: {date.replace(':', '-')}")
-                        except ValueError:
-                            description.append(f"Timestamp: {timestamp}")
-                    if altitude is not None:
-                        description.append(f"Altitude: {altitude:.1f} m")
-                    if exif_data:
-                        description.append(f"Camera: {exif_data['CameraModel']}\nExposure: {exif_data['Exposure']}")
-                    pnt.description = "\n".join(description)
-                kml.save(fileName)
-                QMessageBox.information(self, "Exported", f"Locations exported to {fileName}!")
-            except Exception as e:
-                QMessageBox.critical(self, "Export Error", f"Couldn’t export: {str(e)}")
+        filters = [f"{label} (*{ext})" for ext, label in EXPORT_FORMATS.items()]
+        filters.insert(2, f"{TILED_KMZ} (*.kmz)")
+        fileName, selected = QFileDialog.getSaveFileName(self, "Export Locations", "", ";;".join(filters))
+        if not fileName:
+            return
+        tiled = selected.startswith(TILED_KMZ)
+        if Path(fileName).suffix.lower() not in EXPORT_FORMATS:
+            fileName += selected[selected.index('(*') + 2:-1] if selected else '.kml'
+        # A snapshot, so the list can't change under the export thread.
+        worker = ExportWorker(fileName, self.markers.copy(), tiled=tiled, parent=self)
+        self.ingest_throughput = Throughput("location(s)")
+        self.startWorker(worker, "Exporting", f"Writing {Path(fileName).name}...", worker.total)
+        worker.finished.connect(self.onExportFinished)
+        worker.start()
+
+    def onExportFinished(self):
+        worker, self.ingest_worker = self.ingest_worker, None
+        self.ingest_progress.close()
+        worker.deleteLater()
+        if worker.error is not None:
+            QMessageBox.critical(self, "Export Error", f"Couldn’t export: {str(worker.error)}")
+        elif worker.cancelled:
+            QMessageBox.information(self, "Cancelled", "Export cancelled; nothing was written.")
+        else:
+            QMessageBox.information(self, "Exported", f"{worker.done} location(s) exported to {worker.path}!")
 
     def loadSavedData(self, fileName=None):
-        self.undo_stack.append(self.markers.copy())
-        self.redo_stack.clear()
+        """Read a saved project or JSON file in the background, merging it with one duplicate policy."""
         if not fileName:
-            fileName, _ = QFileDialog.getOpenFileName(self, "Load Saved Locations", "", "JSON Files (*.json)")
-        if fileName:
-            try:
-                with open(fileName, 'r') as f:
-                    new_markers = json.load(f)
-                new_locations = 0
-                for marker in new_markers:
-                    if not isinstance(marker, list) or len(marker) < 2:
-                        continue
-                    loc, name = marker[0], marker[1]
-                    timestamp = marker[2] if len(marker) > 2 else None
-                    altitude = marker[3] if len(marker) > 3 else None
-                    exif_data = marker[4] if len(marker) > 4 else None
-                    if not isinstance(loc, list) or len(loc) != 2:
-                        continue
-                    if not self.is_duplicate(loc, name):
-                        self.markers.append((loc, name, timestamp, altitude, exif_data))
-                        self.fileList.addItem(name)
-                        new_locations += 1
-                    else:
-                        reply = QMessageBox.question(self, "Duplicate Found", 
-                                                    f"'{name}' already exists. Overwrite?", 
-                                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, 
-                                                    QMessageBox.StandardButton.No)
-                        if reply == QMessageBox.StandardButton.Yes:
-                            self.removeMarkerByName(name)
-                            self.markers.append((loc, name, timestamp, altitude, exif_data))
-                            self.fileList.addItem(name)
-                            new_locations += 1
-                self.updateStatus()
-                self.last_file = fileName
-                self.save_last_file(fileName)
-                QMessageBox.information(self, "Loaded", f"Added {new_locations} location(s) from {fileName}!")
-            except json.JSONDecodeError:
+            fileName, _ = QFileDialog.getOpenFileName(
+                self, "Load Saved Locations", "",
+                f"Saved Locations (*{PROJECT_SUFFIX} *.json);;ExifMapper Projects (*{PROJECT_SUFFIX});;JSON Files (*.json)")
+        if not fileName:
+            return
+        if self.ingest_worker is not None:
+            QMessageBox.warning(self, "Busy", "Wait for the current load to finish first.")
+            return
+        policy = self.duplicate_policy or self.askDuplicatePolicy()
+        if policy is None:
+            return
+        try:
+            if is_project(fileName):
+                project = ProjectFile(fileName)
+                markers, total = project.read(), len(project)
+            else:
+                project = None
+                markers, total = read_json(fileName), 0
+        except Exception as e:
+            QMessageBox.critical(self, "Load Error", f"Couldn’t load: {str(e)}")
+            return
+        self.load_file, self.load_project, self.load_policy = fileName, project, policy
+        self.load_was_empty = not self.markers
+        self.load_counts = [0, 0, 0]  # added, replaced, skipped
+        self.journal.begin("Load Saved Locations")
+        self.ingest_throughput = Throughput("location(s)")
+        worker = LoadWorker(markers, total, parent=self)
+        self.startWorker(worker, "Loading Saved Locations", f"Reading {Path(fileName).name}...", total)
+        worker.batchReady.connect(self.onLoadBatch)
+        worker.finished.connect(self.onLoadFinished)
+        worker.start()
+
+    def onLoadBatch(self, batch):
+        counts = self.mergeMarkers(self.with_places(batch), self.load_policy)
+        self.load_counts = [total + count for total, count in zip(self.load_counts, counts)]
+        self.updateStatus()
+
+    def onLoadFinished(self):
+        worker, self.ingest_worker = self.ingest_worker, None
+        self.ingest_progress.close()
+        worker.deleteLater()
+        self.journal.commit()
+        fileName, project = self.load_file, self.load_project
+        added, replaced, skipped = self.load_counts
+        if worker.error is not None:
+            if added or replaced:
+                self.journal.undo()  # nothing from a file that failed to load
+            self.updateStatus()
+            if project is not None:
+                project.close()
+            if isinstance(worker.error, json.JSONDecodeError):
                 QMessageBox.critical(self, "Load Error", f"Invalid JSON format in {fileName}")
-            except Exception as e:
-                QMessageBox.critical(self, "Load Error", f"Couldn’t load: {str(e)}")
+            else:
+                QMessageBox.critical(self, "Load Error", f"Couldn’t load: {str(worker.error)}")
+            return
+        complete = self.load_was_empty and not worker.cancelled and added == len(self.markers)
+        if complete:
+            # Same markers in the same order as when saved, so the saved index still applies.
+            pyramid = ClusterPyramid.load_for(fileName)
+            if pyramid is not None and pyramid.size == len(self.markers):
+                self.pyramid = pyramid
+                self.pyramid_version = self.markers.version
+        if project is not None and complete and added == worker.done:
+            if self.project is not None:
+                self.project.close()
+            project.attach(self.markers)
+            self.project = project
+        elif project is not None:
+            project.close()
+        self.updateStatus()
+        self.last_file = fileName
+        self.save_last_file(fileName)
+        summary = f"Added {added} location(s) from {fileName}!"
+        if replaced or skipped:
+            summary += f"\n{replaced} duplicate(s) overwritten, {skipped} skipped."
+        if worker.cancelled:
+            QMessageBox.information(self, "Cancelled", f"Loading cancelled. {summary}")
+        else:
+            QMessageBox.information(self, "Loaded", summary)
+
+    def askDuplicatePolicy(self):
+        """Ask once how a load treats locations already in the list; None if cancelled."""
+        if not self.markers:
+            return 'keep'
+        box = QMessageBox(self)
+        box.setWindowTitle("Duplicates")
+        box.setText("Some locations may already be in the list. What should happen to those?")
+        policies = {box.addButton("Skip Them", QMessageBox.ButtonRole.AcceptRole): 'skip',
+                    box.addButton("Overwrite", QMessageBox.ButtonRole.AcceptRole): 'overwrite',
+                    box.addButton("Keep Both", QMessageBox.ButtonRole.AcceptRole): 'keep'}
+        box.addButton(QMessageBox.StandardButton.Cancel)
+        box.exec()
+        return policies.get(box.clickedButton())
+
+    @profiler.timed('markers.merge')
+    def mergeMarkers(self, markers, policy):
+        """Add markers in bulk with one duplicate policy; return (added, replaced, skipped)."""
+        return self.markers.merge(markers, policy)
 
-    def editMarker(self, item):
-        self.undo_stack.append(self.markers.copy())
-        self.redo_stack.clear()
-        current_name = item.text()
+    def editMarker(self, index):
+        position = self.markerFilter.mapToSource(index).row()
+        loc, current_name, timestamp, altitude, exif_data = self.markers[position]
         new_name, ok = QInputDialog.getText(self, 'Rename Location', 'New name:', text=current_name)
         if ok and new_name:
             try:
-                for i, (loc, name, timestamp, altitude, exif_data) in enumerate(self.markers):
-                    if name == current_name:
-                        self.markers[i] = (loc, new_name, timestamp, altitude, exif_data)
-                        break
-                self.fileList.item(self.fileList.row(item)).setText(new_name)
+                with self.journal.record("Rename"):
+                    self.markers[position] = (loc, new_name, timestamp, altitude, exif_data)
                 self.updateStatus()
                 QMessageBox.information(self, "Renamed", f"Changed to '{new_name}'!")
             except Exception as e:
                 QMessageBox.critical(self, "Rename Error", f"Failed to rename: {str(e)}")
 
     def addMarker(self):
-        self.undo_stack.append(self.markers.copy())
-        self.redo_stack.clear()
         dialog = QInputDialog(self)
         dialog.setLabelText("Location name:")
         dialog.setTextValue("New Place")
@@ -617,8 +1049,8 @@ class MapUI(QWidget):
                             raise ValueError("Longitude must be between -180 and 180.")
                         loc = [lat, lon]
                         if not self.is_duplicate(loc, name):
-                            self.markers.append((loc, name, None, None, None))
-                            self.fileList.addItem(name)
+                            with self.journal.record("Add Location"):
+                                self.markers.append(self.with_places([(loc, name, None, None, None)])[0])
                             self.updateStatus()
                             QMessageBox.information(self, "Added", f"Added '{name}' at {lat}, {lon}!")
                         else:
@@ -627,45 +1059,130 @@ class MapUI(QWidget):
                         QMessageBox.warning(self, "Invalid Input", f"Bad longitude: {str(e)}")
 
     def addGeocodedLocation(self):
-        self.undo_stack.append(self.markers.copy())
-        self.redo_stack.clear()
-        geolocator = Nominatim(user_agent="MapUI")
         address, ok = QInputDialog.getText(self, "Geocode", "Enter an address:")
-        if ok and address:
-            try:
-                location = geolocator.geocode(address, timeout=5)
-                if location:
-                    loc = [location.latitude, location.longitude]
-                    if not self.is_duplicate(loc, address):
-                        self.markers.append((loc, address, None, None, None))
-                        self.fileList.addItem(address)
-                        self.updateStatus()
-                        QMessageBox.information(self, "Added", f"Added '{address}' at {loc[0]}, {loc[1]}!")
-                    else:
-                        QMessageBox.warning(self, "Duplicate", f"'{address}' already exists!")
-                else:
-                    QMessageBox.warning(self, "Error", "Address not found!")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Geocoding failed: {str(e)}")
+        if not (ok and address):
+            return
+        if self.ingest_worker is not None:
+            QMessageBox.warning(self, "Busy", "Wait for the current load to finish first.")
+            return
+        try:
+            geocoder = self.geocoding()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Geocoding failed: {str(e)}")
+            return
+        # In the background like an import: a lookup can wait on the rate limit, retries or a slow server.
+        self.geocode_answer = None
+        self.ingest_throughput = Throughput("address(es)")
+        worker = GeocodeWorker(geocoder, [(address, address)], 1, parent=self)
+        self.startWorker(worker, "Geocoding", f"Looking up {address}...", 1)
+        worker.batchReady.connect(self.onGeocodeAddressBatch)
+        worker.finished.connect(self.onGeocodeAddressFinished)
+        worker.start()
+
+    def onGeocodeAddressBatch(self, batch):
+        self.geocode_answer = batch[0]
+
+    def onGeocodeAddressFinished(self):
+        worker, self.ingest_worker = self.ingest_worker, None
+        self.ingest_progress.close()
+        worker.deleteLater()
+        if self.geocode_answer is None:
+            return  # cancelled before an answer came
+        (_, address), location, error = self.geocode_answer
+        if error is not None:
+            QMessageBox.critical(self, "Error", f"Geocoding failed: {str(error)}")
+        elif location is None:
+            QMessageBox.warning(self, "Error", "Address not found!")
+        else:
+            loc = [location[0], location[1]]
+            if not self.is_duplicate(loc, address):
+                with self.journal.record("Add Location"):
+                    self.markers.append(self.with_places([(loc, address, None, None, None)])[0])
+                self.updateStatus()
+                QMessageBox.information(self, "Added", f"Added '{address}' at {loc[0]}, {loc[1]}!")
+            else:
+                QMessageBox.warning(self, "Duplicate", f"'{address}' already exists!")
+
+    def importAddresses(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, "Import Addresses", "", "CSV Files (*.csv *.tsv *.txt)")
+        if not fileName:
+            return
+        try:
+            rows = list(read_addresses(fileName))
+            geocoder = self.geocoding()
+        except Exception as e:
+            QMessageBox.critical(self, "Import Error", f"Couldn’t read addresses: {str(e)}")
+            return
+        if not rows:
+            QMessageBox.warning(self, "No Addresses", "No addresses found in that file!")
+            return
+        self.journal.begin("Import Addresses")
+        geocoder.cache.reset_stats()
+        self.ingest_new = 0
+        self.geocode_missing = 0
+        self.ingest_throughput = Throughput("address(es)")
+        worker = GeocodeWorker(geocoder, rows, len(rows), parent=self)
+        self.startWorker(worker, "Importing Addresses", "Geocoding addresses...", len(rows))
+        worker.batchReady.connect(self.onGeocodeBatch)
+        worker.finished.connect(self.onGeocodeFinished)
+        worker.start()
+
+    def onGeocodeBatch(self, batch):
+        found = iter(self.with_places([([answer[0], answer[1]], name, None, None, None)
+                                       for (name, _), answer, error in batch if error is None and answer is not None]))
+        problems = []
+        for (name, address), answer, error in batch:
+            if error is not None:
+                problems.append((name, f"Geocoding Error: {str(error)}"))
+            elif answer is None:
+                self.geocode_missing += 1
+                problems.append((name, "Address not found"))
+            else:
+                marker = next(found)
+                loc = marker[0]
+                # Thousands of rows can't each ask about a duplicate; they are skipped.
+                if not self.is_duplicate(loc, name):
+                    self.markers.append(marker)
+                    self.ingest_new += 1
+        self.errorModel.add(problems)
+        self.updateStatus()
+
+    def onGeocodeFinished(self):
+        worker, self.ingest_worker = self.ingest_worker, None
+        self.ingest_progress.close()
+        worker.deleteLater()
+        self.journal.commit()
+        self.updateStatus()
+        self.statusLabel.setText(f"{self.statusLabel.text()} | {self.geocoder.cache.summary()}")
+        summary = f"Added {self.ingest_new} new location(s); {self.geocode_missing} address(es) not found."
+        if worker.cancelled:
+            QMessageBox.information(self, "Cancelled", f"Import cancelled. {summary}\n"
+                                    "Importing the same file again skips what was already looked up.")
+        else:
+            QMessageBox.information(self, "Imported", summary)
+
+    def geocoding(self):
+        """The shared Geocoder, created on first use."""
+        if self.geocoder is None:
+            self.geocoder = Geocoder(self.geocode_backend, GeocodeCache())
+        return self.geocoder
 
     def removeMarker(self):
-        self.undo_stack.append(self.markers.copy())
-        self.redo_stack.clear()
-        item = self.fileList.currentItem()
-        if not item:
+        positions = self.markerFilter.source_rows(self.locationTable.selectionModel().selectedRows())
+        if not positions:
             QMessageBox.warning(self, "Oops", "Select a location to remove!")
             return
-        name = item.text()
-        self.removeMarkerByName(name)
-        self.fileList.takeItem(self.fileList.row(item))
+        name = self.markers[positions[0]][1]
+        with self.journal.record("Remove"):
+            self.markers.remove_positions(positions)
         self.updateStatus()
-        QMessageBox.information(self, "Removed", f"Removed '{name}'!")
+        if len(positions) == 1:
+            QMessageBox.information(self, "Removed", f"Removed '{name}'!")
+        else:
+            QMessageBox.information(self, "Removed", f"Removed {len(positions)} locations!")
 
     def removeMarkerByName(self, name):
-        for i, (_, marker_name, _, _, _) in enumerate(self.markers):
-            if marker_name == name:
-                del self.markers[i]
-                break
+        self.markers.remove_name(name)
 
     def clearAll(self):
         if not self.markers:
@@ -675,95 +1192,135 @@ class MapUI(QWidget):
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, 
                                      QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            self.undo_stack.append(self.markers.copy())
-            self.redo_stack.clear()
-            self.markers = []
-            self.fileList.clear()
+            with self.journal.record("Clear All"):
+                self.markers.clear()
+            self.errorModel.clear()
             self.updateStatus()
             QMessageBox.information(self, "Cleared", "All locations removed!")
 
     def undo(self):
-        if not self.undo_stack:
+        changes = self.journal.undo()
+        if changes is None:
             QMessageBox.information(self, "Nothing to Undo", "No actions to undo!")
             return
-        self.redo_stack.append(self.markers.copy())
-        self.markers = self.undo_stack.pop()
-        self.fileList.clear()
-        for _, name, _, _, _ in self.markers:
-            self.fileList.addItem(name)
         self.updateStatus()
         QMessageBox.information(self, "Undo", "Last action undone!")
 
     def redo(self):
-        if not self.redo_stack:
+        changes = self.journal.redo()
+        if changes is None:
             QMessageBox.information(self, "Nothing to Redo", "No actions to redo!")
             return
-        self.undo_stack.append(self.markers.copy())
-        self.markers = self.redo_stack.pop()
-        self.fileList.clear()
-        for _, name, _, _, _ in self.markers:
-            self.fileList.addItem(name)
         self.updateStatus()
         QMessageBox.information(self, "Redo", "Last undone action redone!")
 
+    def tableView(self, model):
+        """A read-only table of ``model`` with fixed-height rows, so long lists scroll without measuring."""
+        view = QTableView(self)
+        view.setModel(model)
+        view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        view.setWordWrap(False)
+        view.verticalHeader().hide()
+        view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        view.verticalHeader().setDefaultSectionSize(view.fontMetrics().height() + 6)
+        view.horizontalHeader().setStretchLastSection(True)
+        return view
+
+    def applyFilter(self):
+        self.markerFilter.setFilterText(self.locationFilter.text().strip())
+
+    def updateErrorTab(self):
+        count = self.errorModel.rowCount()
+        self.listTabs.setTabText(1, f"Problems ({count})" if count else "Problems")
+
     def calculateDistance(self):
         if len(self.markers) < 2:
             QMessageBox.warning(self, "Oops", "Need at least 2 locations to calculate distance!")
             return
         try:
-            total_distance = 0
-            for i in range(len(self.markers) - 1):
-                lat1, lon1 = map(radians, self.markers[i][0])
-                lat2, lon2 = map(radians, self.markers[i + 1][0])
-                dlat, dlon = lat2 - lat1, lon2 - lon1
-                a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                c = 2 * atan2(sqrt(a), sqrt(1-a))
-                distance_km = 6371 * c
-                distance_miles = distance_km * 0.621371
-                total_distance += distance_miles
-            QMessageBox.information(self, "Distance", f"Total distance: {total_distance:.2f} miles")
+            total_distance = track_length(*self.markers.coordinates(), unit=self.distance_unit)
+            QMessageBox.information(self, "Distance", f"Total distance: {total_distance:.2f} {UNIT_NAMES[self.distance_unit]}")
         except Exception as e:
             QMessageBox.critical(self, "Distance Error", f"Failed to calculate distance: {str(e)}")
 
     def toggleDistanceLines(self):
         self.show_distance_lines = not self.show_distance_lines
-        self.displayMap()
         state = "on" if self.show_distance_lines else "off"
-        QMessageBox.information(self, "Distance Lines", f"Distance lines turned {state}")
+        self.refreshOverlays("Distance Lines", f"Distance lines turned {state}")
 
     def toggleHeatmap(self):
         self.show_heatmap = not self.show_heatmap
-        self.displayMap()
         state = "on" if self.show_heatmap else "off"
-        QMessageBox.information(self, "Heatmap", f"Heatmap turned {state}")
+        self.refreshOverlays("Heatmap", f"Heatmap turned {state}")
 
+    def refreshOverlays(self, title, message):
+        """Apply an overlay toggle to an open served or bundle map in place, or open a map if none is current."""
+        if self.serve_map and self.markers:
+            self.serveMap()  # an open page reloads itself with the new overlays
+        elif self.map_bundle and self.markers and self.map_shown == self.markers.version:
+            self.renderMap(open_browser=False)
+            message += "\nReload the map page, or switch it from the map's layer control."
+        else:
+            self.displayMap()
+        QMessageBox.information(self, title, message)
+
+    def cluster_pyramid(self):
+        """Zoom-level cluster index of the current markers, rebuilt only after they change."""
+        if self.pyramid is None or self.pyramid_version != self.markers.version:
+            self.pyramid = ClusterPyramid.from_store(self.markers)
+            self.pyramid_version = self.markers.version
+        return self.pyramid
+
+    @profiler.timed('markers.duplicate_check')
     def is_duplicate(self, loc, name):
-        for existing_loc, existing_name, _, _, _ in self.markers:
-            if (abs(existing_loc[0] - loc[0]) < 0.0001 and 
-                abs(existing_loc[1] - loc[1]) < 0.0001 and 
-                existing_name == name):
-                return True
-        return False
+        return self.markers.is_duplicate(loc, name)
+
+    def with_places(self, markers):
+        """Markers with City/Region/Country from the offline gazetteer, when there is one."""
+        if self.gazetteer is None or not markers:
+            return markers
+        try:
+            return self.gazetteer.annotate(markers)
+        except (OSError, ValueError) as e:
+            self.gazetteer = None  # unreadable gazetteer; stop trying for this session
+            QMessageBox.warning(self, "Gazetteer", f"Place names are unavailable: {str(e)}")
+            return markers
 
     def updateStatus(self):
-        self.statusLabel.setText(f"Loaded Locations: {len(self.markers)}")
+        text = f"Loaded Locations: {len(self.markers)}"
+        if self.watch_worker is not None:
+            watcher = self.watch_worker.watcher
+            text += f" | Watching {watcher.root}"
+            text += f" ({watcher.backend}): {self.watch_last}" if self.watch_last else " (scanning...)"
+        self.statusLabel.setText(text)
+        if self.watch_worker is not None and self.watch_worker.watcher.fallback:
+            self.statusLabel.setToolTip(self.watch_worker.watcher.fallback)
 
     def showHelp(self):
         help_text = (
             "Welcome to ExifMapper!\n\n"
             "1. **Load Locations**: Enter image URLs/paths, drag-and-drop images, process a folder, or click 'Load Location'.\n"
             "2. **View Map**: See locations with time/date, altitude, camera info, and previews.\n"
-            "3. **Add Custom**: Add via coordinates or address (geocoding).\n"
+            "3. **Add Custom**: Add via coordinates or address (geocoding), or import a CSV of addresses.\n"
             "4. **Edit**: Double-click to rename.\n"
-            "5. **Save/Load/Export**: Save to JSON, load, or export to KML.\n"
+            "5. **Save/Load/Export**: Save to a project (only changes are written) or JSON, load, or export to KML/KMZ, GeoJSON, GPX or CSV.\n"
             "6. **Remove/Clear**: Remove one or all locations.\n"
             "7. **Undo/Redo**: Undo or redo actions.\n"
             "8. **Distance**: Calculate distance in miles or toggle lines.\n"
             "9. **Heatmap**: Toggle heatmap overlay.\n"
+            "10. **Watch Folder**: Add new and changed images from a folder as they arrive, and drop deleted ones.\n"
+            "11. **Stats**: Time loads, maps, saves and exports, or profile the next one.\n"
             "Tip: Images need GPS EXIF data."
         )
         QMessageBox.information(self, "How to Use", help_text)
 
+    def showStats(self):
+        if self.stats_dialog is None:
+            self.stats_dialog = StatsDialog(self)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+
     def load_last_file(self):
         last_file = Path('last_file.txt')
         if last_file.exists():
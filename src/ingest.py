@@ -0,0 +1,228 @@
+"""Background ingest for the GUI.
+
+Extraction runs on an ExtractionPool, address imports on a Geocoder and
+saved-file loads on a reader, inside a QThread; results are handed back to
+the GUI thread in batches through Qt signals. Exports run the same way and
+only report progress. A watched folder's changes are extracted the same way
+for as long as the watch runs.
+"""
+import os
+import threading
+import time
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from .export import Cancelled, export_markers
+from .extract import ExtractionPool
+from .profiling import profiler
+
+BATCH_SIZE = 250
+BATCH_INTERVAL = 0.2  # seconds
+
+
+class IngestWorker(QThread):
+    batchReady = pyqtSignal(list)  # [(input, result, error), ...]
+    progress = pyqtSignal(int, int)  # done, total (0 when unknown)
+
+    def __init__(self, extractor, inputs, total=0, jobs=None, processes=False, parent=None):
+        super().__init__(parent)
+        self.inputs = inputs
+        self.total = total
+        self.pool = ExtractionPool(extractor, jobs=jobs, processes=processes)
+        self.done = 0
+
+    def results(self):
+        return self.pool.run(self.inputs)
+
+    def run(self):
+        batch = []
+        last_emit = time.monotonic()
+        for result in self.results():
+            batch.append(result)
+            self.done += 1
+            now = time.monotonic()
+            if len(batch) >= BATCH_SIZE or now - last_emit >= BATCH_INTERVAL:
+                self.batchReady.emit(batch)
+                self.progress.emit(self.done, self.total)
+                batch = []
+                last_emit = now
+        if batch:
+            self.batchReady.emit(batch)
+        self.progress.emit(self.done, self.total)
+
+    def cancel(self):
+        self.pool.cancel()
+
+    @property
+    def cancelled(self):
+        return self.pool.cancelled
+
+
+class GeocodeWorker(IngestWorker):
+    """Geocodes ``(name, address)`` rows; batches hold ``((name, address), answer, error)``."""
+
+    def __init__(self, geocoder, rows, total=0, parent=None):
+        QThread.__init__(self, parent)
+        self.inputs = rows
+        self.total = total
+        self.pool = geocoder
+        self.done = 0
+
+    def results(self):
+        rows = {}
+
+        def addresses():
+            for name, address in self.inputs:
+                rows.setdefault(address, []).append(name)
+                yield address
+
+        for address, answer, error in self.pool.run(addresses()):
+            yield (rows[address].pop(0), address), answer, error
+
+
+class LoadWorker(IngestWorker):
+    """Reads saved markers; batches hold marker tuples. A read error ends the load and is kept in ``error``."""
+
+    def __init__(self, markers, total=0, parent=None):
+        QThread.__init__(self, parent)
+        self.inputs = markers
+        self.total = total
+        self.done = 0
+        self.error = None
+        self._cancelled = threading.Event()
+
+    def results(self):
+        try:
+            for marker in self.inputs:
+                if self._cancelled.is_set():
+                    return
+                yield marker
+        except Exception as e:
+            self.error = e
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+class WatchWorker(QThread):
+    """Extracts the images a FolderWatcher reports until stop(); a failure is kept in ``error``.
+
+    Each set of changes arrives as batchReady calls, holding extraction
+    results like IngestWorker's and the paths removed, then one changesDone.
+    The first set also extracts images the index has seen under the folder
+    but that aren't in ``known`` (the names already listed), so the list
+    ends up matching the folder.
+    """
+
+    batchReady = pyqtSignal(list, list)  # [(input, result, error), ...], removed paths
+    changesDone = pyqtSignal(int, int, int)  # added, changed, removed
+
+    def __init__(self, extractor, watcher, known=(), jobs=None, parent=None):
+        super().__init__(parent)
+        self.extractor = extractor
+        self.watcher = watcher
+        self.known = known
+        self.jobs = jobs
+        self.pool = None
+        self.error = None
+
+    def run(self):
+        try:
+            for changes in self.watcher.changes():
+                paths = changes.added + changes.changed
+                if self.known is not None:
+                    queued = set(paths)
+                    paths += [path for path in self.watcher.index.pending(self.watcher.root)
+                              if path not in queued and path not in self.known]
+                    self.known = None
+                self.extract(paths, changes.removed)
+                if self.watcher.stopped:
+                    break
+                self.changesDone.emit(len(changes.added), len(changes.changed), len(changes.removed))
+        except Exception as e:
+            self.error = e
+
+    def extract(self, paths, removed):
+        self.pool = ExtractionPool(self.extractor, jobs=self.jobs)
+        batch = []
+        last_emit = time.monotonic()
+        for result in self.pool.run(paths):
+            batch.append(result)
+            now = time.monotonic()
+            if len(batch) >= BATCH_SIZE or now - last_emit >= BATCH_INTERVAL:
+                self.emit(batch, removed)
+                batch, removed = [], []
+                last_emit = now
+        if batch or removed:
+            self.emit(batch, removed)
+        self.pool = None
+
+    def emit(self, batch, removed):
+        # Images that turn out to have no GPS data aren't extracted again when the watch restarts.
+        self.watcher.index.set_located((item, error is None and result is not None and result[0])
+                                       for item, result, error in batch)
+        self.batchReady.emit(batch, removed)
+
+    def stop(self):
+        self.watcher.stop()
+        if self.pool is not None:
+            self.pool.cancel()
+
+
+class ExportWorker(QThread):
+    """Writes markers to a file; a failure is kept in ``error``."""
+
+    progress = pyqtSignal(int, int)  # done, total
+
+    def __init__(self, path, markers, fmt=None, tiled=False, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.markers = markers
+        self.fmt = fmt
+        self.tiled = tiled
+        self.total = len(markers)
+        self.done = 0
+        self.error = None
+        self._cancelled = threading.Event()
+
+    def run(self):
+        def progress(done):
+            self.progress.emit(done, self.total)
+            if self._cancelled.is_set():
+                raise Cancelled()
+
+        try:
+            with profiler.operation('export') as stage:
+                self.done = export_markers(self.path, self.markers, self.fmt, self.tiled, progress)
+                stage.bytes = os.path.getsize(self.path)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.error = e
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+
+class Throughput:
+    """Rate and ETA for a progress dialog label."""
+
+    def __init__(self, noun="image(s)"):
+        self.started = time.monotonic()
+        self.noun = noun
+
+    def describe(self, done, total):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = done / elapsed
+        text = f"Processed {done}" + (f" of {total}" if total else "") + f" {self.noun} - {rate:.0f}/s"
+        if total and rate > 0:
+            text += f", about {int((total - done) / rate)}s left"
+        return text
@@ -0,0 +1,205 @@
+"""Delta-based undo/redo for a MarkerStore.
+
+Each action records only the markers it added, removed or changed, so
+undoing a rename doesn't keep a copy of every marker around.
+"""
+from collections import deque
+from contextlib import contextmanager
+
+MAX_DEPTH = 100
+MAX_MARKERS = 1_000_000  # markers held across all recorded deltas
+
+
+class Delta:
+    """The store changes made by one user action, in the order they happened."""
+
+    __slots__ = ('label', 'ops', 'size')
+
+    def __init__(self, label):
+        self.label = label
+        self.ops = []
+        self.size = 0
+
+    def add(self, op, *args):
+        self.ops.append((op,) + args)
+        if op in ('add', 'clear'):
+            self.size += len(args[0])
+        else:
+            self.size += 1
+
+
+def _inverse(op):
+    kind = op[0]
+    if kind == 'add':
+        return [('pop', len(op[1]))]
+    if kind == 'remove':
+        return [('insert', op[1], op[2])]
+    if kind == 'insert':
+        return [('remove', op[1], op[2])]
+    if kind == 'set':
+        return [('set', op[1], op[3], op[2])]
+    if kind == 'clear':
+        return [('restore', op[1])]
+    if kind == 'restore':
+        return [('clear',)]
+    raise ValueError(f"Unknown change: {kind}")
+
+
+def _monotone(run, rising):
+    """Split a run of ops into chunks whose positions keep moving one way; yield ``(up, chunk)``.
+
+    ``rising(previous, position)`` tells whether a step goes up; ``up`` is
+    None for a chunk of one op.
+    """
+    chunk, up = [run[0]], None
+    for op in run[1:]:
+        step = rising(chunk[-1][1], op[1])
+        if up is None or step == up:
+            chunk.append(op)
+            up = step
+        else:
+            yield up, chunk
+            chunk, up = [op], None
+    yield up, chunk
+
+
+def _removals(run):
+    """Positions, counted before any of them went, removed by a run of 'remove' ops."""
+    for up, chunk in _monotone(run, lambda previous, position: position >= previous):
+        # Rising positions are each counted after the earlier removals, like a bulk removal reports
+        # them; falling ones are already where they were.
+        yield [op[1] + k if up else op[1] for k, op in enumerate(chunk)]
+
+
+def _insertions(run):
+    """``(position, marker)`` pairs, counted after all of them went in, for a run of 'insert' ops."""
+    for up, chunk in _monotone(run, lambda previous, position: position > previous):
+        # Each insert at or before the one before it pushes that one down a row.
+        yield [(op[1], op[2]) if up else (op[1] + len(chunk) - 1 - k, op[2]) for k, op in enumerate(chunk)]
+
+
+class UndoJournal:
+    """Undo/redo stacks of Deltas recorded from a MarkerStore's change feed.
+
+    Depth and the total number of markers held are both bounded; the oldest
+    deltas are dropped first.
+    """
+
+    def __init__(self, store, max_depth=MAX_DEPTH, max_markers=MAX_MARKERS):
+        self.store = store
+        self.max_depth = max_depth
+        self.max_markers = max_markers
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self._current = None
+        self._depth = 0
+        self._replaying = False
+        store.subscribe(self._on_change)
+
+    def _on_change(self, op, *args):
+        if self._current is not None and not self._replaying:
+            self._current.add(op, *args)
+
+    def begin(self, label):
+        if self._depth == 0:
+            self._current = Delta(label)
+        self._depth += 1
+
+    def commit(self):
+        self._depth = max(self._depth - 1, 0)
+        if self._depth:
+            return
+        delta, self._current = self._current, None
+        if delta is not None and delta.ops:
+            self.undo_stack.append(delta)
+            self.redo_stack.clear()
+            self._trim()
+
+    @contextmanager
+    def record(self, label):
+        """Group every store change made inside the block into one undo step."""
+        self.begin(label)
+        try:
+            yield
+        finally:
+            self.commit()
+
+    @property
+    def recording(self):
+        return self._current is not None
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """Revert the last delta; return the store changes applied, or None."""
+        if not self.undo_stack:
+            return None
+        delta = self.undo_stack.pop()
+        applied = self._apply([inv for op in reversed(delta.ops) for inv in _inverse(op)])
+        self.redo_stack.append(delta)
+        return applied
+
+    def redo(self):
+        """Re-apply the last undone delta; return the store changes applied, or None."""
+        if not self.redo_stack:
+            return None
+        delta = self.redo_stack.pop()
+        applied = self._apply(delta.ops, redo=True)
+        self.undo_stack.append(delta)
+        return applied
+
+    def _apply(self, ops, redo=False):
+        """Apply ops to the store and return them as change-feed entries."""
+        applied = []
+        collect = lambda op, *args: applied.append((op,) + args)
+        self._replaying = True
+        self.store.subscribe(collect)
+        try:
+            i = 0
+            while i < len(ops):
+                op = ops[i]
+                kind = op[0]
+                if kind in ('remove', 'insert'):
+                    # A bulk removal is recorded one row at a time; replay runs in as few store calls.
+                    end = i + 1
+                    while end < len(ops) and ops[end][0] == kind:
+                        end += 1
+                    if kind == 'remove':
+                        for positions in _removals(ops[i:end]):
+                            self.store.remove_positions(positions)
+                    else:
+                        for markers in _insertions(ops[i:end]):
+                            self.store.insert_many(markers)
+                    i = end
+                    continue
+                if kind == 'pop':
+                    self.store.truncate(op[1])
+                elif kind == 'add':
+                    self.store.extend(op[1])
+                elif kind == 'set':
+                    self.store[op[1]] = op[3]
+                elif kind == 'clear':
+                    detached = self.store.clear()
+                    if redo:
+                        # Keep the freshly detached markers so the next undo can restore them.
+                        ops[i] = ('clear', detached)
+                elif kind == 'restore':
+                    self.store.restore(op[1])
+                i += 1
+        finally:
+            self.store.unsubscribe(collect)
+            self._replaying = False
+        return applied
+
+    def _trim(self):
+        total = sum(delta.size for delta in self.undo_stack) + sum(delta.size for delta in self.redo_stack)
+        while self.undo_stack and (len(self.undo_stack) > self.max_depth or total > self.max_markers):
+            total -= self.undo_stack.popleft().size
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
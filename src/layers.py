@@ -0,0 +1,198 @@
+"""Folium map elements that fill their layers in the browser.
+
+MarkerLayer adds every marker from flat column arrays, inlined or read
+from a bundle's markers.js; ViewportLayer asks a MapServer for what is in
+view. They are kept apart from mapbundle and server so that folium is only
+imported once a map is drawn.
+"""
+from branca.element import MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import AntPath, MarkerCluster
+from jinja2 import Template
+
+from .mapbundle import PATH_OPTIONS, dump_payload
+
+
+class MarkerLayer(JSCSSMixin, MacroElement):
+    """Adds every marker to one cluster layer from flat column arrays.
+
+    The columns come from markers.js in a bundle, or are inlined when
+    ``payload`` (a dict, or one already passed through dump_payload) is
+    given. Popups are built in the browser when opened. The heatmap and the
+    distance path, when given, are filled from the same arrays; ``path`` is
+    the layer the path is added to.
+    """
+
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.payload if this.payload else 'window.EXIFMAPPER_MARKERS' }};
+            function esc(value) {
+                return String(value).replace(/[&<>"']/g, function(c) {
+                    return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+                });
+            }
+            function stamp(epoch) {
+                var d = new Date(epoch * 1000).toISOString();
+                return d.slice(0, 4) + ':' + d.slice(5, 7) + ':' + d.slice(8, 10) + ' ' + d.slice(11, 19);
+            }
+            function popup(i) {
+                var name = data.name[i], html = '<b>' + esc(name) + '</b>';
+                var timestamp = data.raw_times[i] || (data.time[i] !== null ? stamp(data.time[i]) : null);
+                if (timestamp) {
+                    var parts = timestamp.split(' ');
+                    html += parts.length == 2
+                        ? '<br>Time: ' + esc(parts[1]) + '<br>Date: ' + esc(parts[0].replace(/:/g, '-'))
+                        : '<br>Timestamp: ' + esc(timestamp);
+                }
+                if (data.alt[i] !== null) html += '<br>Altitude: ' + data.alt[i].toFixed(1) + ' m';
+                var camera = data.camera[i], exif = null;
+                if (camera >= 0) exif = [data.cameras[camera], data.exposure[i] === null ? 'N/A' : data.exposure[i]];
+                else if (camera == -2) exif = data.extra[i];
+                if (exif) html += '<br>Camera: ' + esc(exif[0]) + '<br>Exposure: ' + esc(exif[1]);
+                if (data.place && data.place[i] >= 0) html += '<br>Place: ' + esc(data.places[data.place[i]]);
+                var src = /^https?:\/\//.test(name) ? name : data.thumb[i] && 'thumbs/' + data.thumb[i];
+                if (src) html += "<br><img src='" + esc(src) + "' width='100'>";
+                return html;
+            }
+            function bind(i) {
+                return function() { return popup(i); };
+            }
+            var layers = new Array(data.lat.length);
+            for (var i = 0; i < layers.length; i++) {
+                layers[i] = L.marker([data.lat[i], data.lon[i]]).bindPopup(bind(i), {maxWidth: 300});
+            }
+            {{ this.cluster.get_name() }}.addLayers(layers);
+            {% if this.heatmap or this.path %}
+            var latlngs = data.lat.map(function(lat, i) { return [lat, data.lon[i]]; });
+            {% endif %}
+            {% if this.heatmap %}
+            {{ this.heatmap.get_name() }}.setLatLngs(latlngs);
+            {% endif %}
+            {% if this.path %}
+            L.polyline.antPath(latlngs, {{ this.path_options|tojson }})
+                .bindTooltip({{ this.path_tooltip|tojson }}).addTo({{ this.path.get_name() }});
+            {% endif %}
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = AntPath.default_js
+
+    def __init__(self, cluster, payload=None, heatmap=None, path=None, path_tooltip=None, path_options=None):
+        super().__init__()
+        self._name = 'MarkerLayer'
+        self.cluster = cluster
+        if payload is not None and not isinstance(payload, str):
+            payload = dump_payload(payload)
+        # '</' would end the inline <script> early
+        self.payload = payload.replace('</', '<\\/') if payload is not None else None
+        self.heatmap = heatmap
+        self.path = path
+        self.path_tooltip = path_tooltip or ''
+        self.path_options = path_options or PATH_OPTIONS
+
+
+class ViewportLayer(JSCSSMixin, MacroElement):
+    """Keeps the markers, heatmap and path layers filled for the current viewport from a MapServer."""
+
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }}, markers = {{ this.markers.get_name() }};
+            var heat = {{ this.heatmap.get_name() }}, path = {{ this.path.get_name() }};
+            var version = null, page = null, range = {start: '', end: ''}, request = 0;
+            function get(url) {
+                return fetch(url).then(function(response) {
+                    if (!response.ok) throw new Error(response.status);
+                    return response.json();
+                });
+            }
+            function wrap(lon) { return ((lon + 180) % 360 + 360) % 360 - 180; }
+            function query() {
+                var b = map.getBounds(), west = b.getWest(), east = b.getEast();
+                if (east - west >= 360) { west = -180; east = 180; } else { west = wrap(west); east = wrap(east); }
+                var box = [west, Math.max(b.getSouth(), -85), east, Math.min(b.getNorth(), 85)];
+                return 'bbox=' + box.map(function(v) { return v.toFixed(6); }).join(',') + '&zoom=' + map.getZoom()
+                    + '&start=' + range.start + '&end=' + range.end + '&version=' + version;
+            }
+            function single(lat, lon, row) {
+                var v = version;
+                return L.marker([lat, lon]).bindPopup('Loading...', {maxWidth: 300}).on('popupopen', function(e) {
+                    get('marker/' + row + '?version=' + v).then(function(data) { e.popup.setContent(data.html); },
+                        function() { e.popup.setContent('This marker has changed; move the map to refresh.'); });
+                });
+            }
+            function cluster(lat, lon, count) {
+                var size = count < 100 ? 'small' : count < 10000 ? 'medium' : 'large';
+                var icon = L.divIcon({html: '<div><span>' + count + '</span></div>', iconSize: L.point(40, 40),
+                                      className: 'marker-cluster marker-cluster-' + size});
+                return L.marker([lat, lon], {icon: icon}).on('click', function() {
+                    map.setView([lat, lon], Math.min(map.getZoom() + 2, map.getMaxZoom()));
+                });
+            }
+            function load() {
+                var id = ++request, q = query();
+                get('markers?' + q).then(function(data) {
+                    if (id !== request) return;
+                    markers.clearLayers();
+                    for (var i = 0; i < data.lat.length; i++) {
+                        markers.addLayer(data.count[i] > 1 ? cluster(data.lat[i], data.lon[i], data.count[i])
+                                                           : single(data.lat[i], data.lon[i], data.row[i]));
+                    }
+                });
+                if (map.hasLayer(heat)) {
+                    get('heat?' + q).then(function(data) { if (id === request) heat.setLatLngs(data.points); });
+                }
+                if (map.hasLayer(path)) {
+                    get('path?' + q + '&unit={{ this.unit }}').then(function(data) {
+                        if (id !== request) return;
+                        path.clearLayers();
+                        if (data.points.length > 1) {
+                            L.polyline.antPath(data.points, {{ this.path_options|tojson }})
+                                .bindTooltip(data.tooltip).addTo(path);
+                        }
+                    });
+                }
+            }
+            function watch() {
+                get('changes?version=' + (version === null ? '' : version) + '&page=' + (page === null ? '' : page))
+                    .then(function(data) {
+                        if (page !== null && data.page !== page) { location.reload(); return; }
+                        page = data.page;
+                        if (data.version !== version) { version = data.version; load(); }
+                        watch();
+                    }, function() { setTimeout(watch, 5000); });
+            }
+            var times = L.control({position: 'bottomleft'});
+            times.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.background = 'white';
+                div.style.padding = '4px 6px';
+                div.innerHTML = 'From <input type="date" name="start"> to <input type="date" name="end">';
+                L.DomEvent.disableClickPropagation(div);
+                div.addEventListener('change', function(e) {
+                    var day = e.target.value ? Date.parse(e.target.value) / 1000 : '';
+                    range[e.target.name] = day !== '' && e.target.name == 'end' ? day + 86400 : day;
+                    load();
+                });
+                return div;
+            };
+            times.addTo(map);
+            map.on('moveend overlayadd', function() { if (version !== null) load(); });
+            watch();
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = AntPath.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, markers, heatmap, path, unit='km'):
+        super().__init__()
+        self._name = 'ViewportLayer'
+        self.markers = markers
+        self.heatmap = heatmap
+        self.path = path
+        self.unit = unit
+        self.path_options = PATH_OPTIONS
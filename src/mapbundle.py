@@ -0,0 +1,198 @@
+"""Write a map as a bundle directory instead of one self-contained HTML file.
+
+The bundle holds ``index.html`` (the folium map without any marker data),
+``markers.js`` with the markers as flat column arrays, and a
+``thumbs/`` folder of popup thumbnails. Popups are built in the browser when
+opened, so a thumbnail is only fetched when its popup is shown. The distance
+path and heatmap are drawn from the same arrays, so switching an overlay
+only rewrites ``index.html``.
+"""
+import hashlib
+import html
+import json
+import os
+import time
+from pathlib import Path
+
+from .fetch import format_bytes
+from .profiling import profiler
+from .store import PLACE_KEYS
+
+BUNDLE_DIR = 'map_bundle'
+FAST_THRESHOLD = 20_000  # above this many markers the inline map uses MarkerLayer too
+# folium's AntPath defaults, for paths drawn by MarkerLayer
+PATH_OPTIONS = {'color': 'red', 'weight': 5, 'opacity': 0.5, 'delay': 400,
+                'dashArray': [10, 20], 'pulseColor': '#FFFFFF'}
+
+
+def _optional(values, digits):
+    return [None if v != v else round(v, digits) for v in values]
+
+
+@profiler.timed('map.payload')
+def marker_payload(store, thumb_files=None):
+    """Return the markers of a MarkerStore as flat, JSON-ready column arrays.
+
+    ``lat``/``lon`` are rounded to 6 decimals (about 10 cm), ``time`` is
+    epoch seconds and missing values are null. ``camera`` indexes into
+    ``cameras`` and ``place`` into ``places``; ``raw_times``, ``extra`` and ``thumb`` are sparse maps from
+    position to an odd timestamp, a ``[camera, exposure]`` pair and a
+    thumbnail file name. ``extra`` only holds exif_data dicts with a
+    CameraModel; popups show no camera for anything else.
+    """
+    columns = store.columns()
+    names = columns['name']
+    thumb_files = thumb_files or {}
+    return {
+        'lat': [round(v, 6) for v in columns['lat']],
+        'lon': [round(v, 6) for v in columns['lon']],
+        'name': names,
+        'time': _optional(columns['time'], 0),
+        'alt': _optional(columns['alt'], 1),
+        'camera': columns['camera'].tolist(),
+        'exposure': _optional(columns['exposure'], 6),
+        'cameras': columns['cameras'],
+        'place': columns['place'].tolist(),
+        'places': [', '.join(part for part in place if part) for place in columns['places']],
+        'raw_times': columns['raw_times'],
+        'extra': {pos: [data['CameraModel'], data.get('Exposure', 'N/A')]
+                  for pos, data in columns['extra'].items() if isinstance(data, dict) and 'CameraModel' in data},
+        'thumb': {pos: thumb_files[name] for pos, name in enumerate(names) if name in thumb_files}
+                 if thumb_files else {},
+    }
+
+
+def popup_html(name, timestamp, altitude, exif_data, image=None):
+    """Popup HTML for one marker; ``image`` is the src of its thumbnail, if any.
+
+    Every value is escaped, as in the popups markers.js builds, since names
+    and EXIF fields come from the images themselves.
+    """
+    popup_text = f"<b>{_escape(name)}</b>"
+    if timestamp:
+        try:
+            date, time = str(timestamp).split(" ")
+            popup_text += f"<br>Time: {_escape(time)}<br>Date: {_escape(date.replace(':', '-'))}"
+        except ValueError:
+            popup_text += f"<br>Timestamp: {_escape(timestamp)}"
+    if altitude is not None:
+        popup_text += f"<br>Altitude: {altitude:.1f} m"
+    if isinstance(exif_data, dict) and 'CameraModel' in exif_data:
+        popup_text += (f"<br>Camera: {_escape(exif_data['CameraModel'])}"
+                       f"<br>Exposure: {_escape(exif_data.get('Exposure', 'N/A'))}")
+    place = place_label(exif_data)
+    if place:
+        popup_text += f"<br>Place: {_escape(place)}"
+    if image:
+        popup_text += f"<br><img src='{_escape(image)}' width='100'>"
+    return popup_text
+
+
+def _escape(value):
+    return html.escape(str(value), quote=True)
+
+
+def place_label(exif_data):
+    """'City, Region, Country' from the gazetteer's keys in exif_data, or ''."""
+    if not isinstance(exif_data, dict):
+        return ''
+    return ', '.join(exif_data[key] for key in PLACE_KEYS if exif_data.get(key))
+
+
+def write_html(m, path):
+    """Save a folium map like ``m.save(path)``, timing the render and the write apart."""
+    with profiler.stage('map.serialise'):
+        html = m.get_root().render().encode('utf-8')
+    with profiler.stage('map.write') as stage:
+        with open(path, 'wb') as f:
+            f.write(html)
+        stage.bytes = len(html)
+
+
+def dump_payload(payload):
+    return json.dumps(payload, separators=(',', ':'), default=str)
+
+
+class LayerCache:
+    """Map layer data derived from a MarkerStore, kept until its version changes.
+
+    Re-rendering a map for an overlay toggle reuses the thumbnails, payload
+    and track length computed for the last one instead of redoing them.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._items = {}
+
+    def get(self, store, key, build):
+        """Return the item cached under ``key``, calling ``build()`` if the store changed."""
+        if self.version != store.version:
+            self._items.clear()
+            self.version = store.version
+        if key not in self._items:
+            self._items[key] = build()
+        return self._items[key]
+
+    def clear(self):
+        self._items.clear()
+        self.version = None
+
+
+class MapBundle:
+    """A bundle directory that is reused, so unchanged thumbnails aren't rewritten."""
+
+    def __init__(self, directory=BUNDLE_DIR):
+        self.directory = Path(directory)
+        self.thumbs = self.directory / 'thumbs'
+        self.started = time.perf_counter()
+
+    def write_thumbnails(self, thumbnails):
+        """Write ``{name: jpeg bytes}`` as content-named files; return ``{name: file name}``."""
+        self.thumbs.mkdir(parents=True, exist_ok=True)
+        files = {}
+        for name, data in thumbnails.items():
+            filename = hashlib.sha1(data).hexdigest()[:20] + '.jpg'
+            path = self.thumbs / filename
+            if not path.exists():
+                path.write_bytes(data)
+            files[name] = filename
+        keep = set(files.values())
+        for entry in os.scandir(self.thumbs):
+            if entry.name not in keep:
+                os.unlink(entry.path)
+        return files
+
+    def write_markers(self, payload):
+        """Write markers.js from a marker_payload dict or its dump_payload string."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not isinstance(payload, str):
+            payload = dump_payload(payload)
+        (self.directory / 'markers.js').write_text(f"window.EXIFMAPPER_MARKERS={payload};\n", encoding='utf-8')
+
+    def save(self, m, cluster, heatmap=None, path=None, path_tooltip=None):
+        """Write index.html for a folium map whose markers live in ``cluster``.
+
+        The map reads its markers from the markers.js last written by
+        write_markers, so this alone is enough when only the overlays change.
+        """
+        import folium
+        from .layers import MarkerLayer
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        m.get_root().header.add_child(folium.JavascriptLink('markers.js'))
+        MarkerLayer(cluster, heatmap=heatmap, path=path, path_tooltip=path_tooltip).add_to(m)
+        write_html(m, self.index)
+        return self.report()
+
+    @property
+    def index(self):
+        return self.directory / 'index.html'
+
+    def report(self):
+        html = self.index.stat().st_size
+        data = (self.directory / 'markers.js').stat().st_size
+        thumbs = [entry.stat().st_size for entry in os.scandir(self.thumbs)] if self.thumbs.exists() else []
+        elapsed = time.perf_counter() - self.started
+        return (f"HTML {format_bytes(html)}, markers {format_bytes(data)}, "
+                f"{len(thumbs)} thumbnail(s) {format_bytes(sum(thumbs))}, built in {elapsed:.2f} s")
+
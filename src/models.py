@@ -0,0 +1,394 @@
+"""Qt item models for the location list.
+
+MarkerTableModel shows a MarkerStore as a table and follows its change
+feed. Changes are collected and announced once control returns to the
+event loop, so a load adding thousands of markers one at a time reaches the
+view as one row insertion. MarkerFilterModel sorts and filters it with
+whole-column passes over the store's arrays instead of a callback per row
+or per comparison, which keeps both fast with hundreds of thousands of
+rows. InputErrorModel lists the inputs that couldn't be added.
+"""
+import math
+from array import array
+
+from PyQt6.QtCore import QAbstractProxyModel, QAbstractTableModel, QModelIndex, Qt, QTimer, pyqtSignal
+
+from .store import format_timestamp
+
+COLUMNS = ('Name', 'Latitude', 'Longitude', 'Time', 'Altitude', 'Camera', 'Place')
+NAME, LATITUDE, LONGITUDE, TIME, ALTITUDE, CAMERA, PLACE = range(len(COLUMNS))
+MAX_SIGNALS = 100  # a flush needing more row signals than this resets the views instead
+
+_RIGHT = Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+_LAST = '\uffff'  # sorts after any label
+
+
+class MarkerTableModel(QAbstractTableModel):
+    """A MarkerStore as a table, one row per marker in store order."""
+
+    # A flush removing several blocks of rows sends this after the last one; until then
+    # rowCount() is somewhere between the old and new counts while the store has lost every row.
+    removalsFinished = pyqtSignal()
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._count = len(store)  # rows the views have been told about
+        self._pending = []  # (op, position or None) since the last flush
+        self._columns = None
+        self._columns_version = None
+        self._folded = None
+        self._folded_version = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.flush)
+        store.subscribe(self._on_change)
+
+    def detach(self):
+        self.store.unsubscribe(self._on_change)
+
+    def _on_change(self, op, *args):
+        self._pending.append((op, args[0] if op in ('insert', 'remove', 'set') else None))
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """Announce the store changes since the last flush in as few signals as possible."""
+        self._timer.stop()
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        ops = {op for op, _ in pending}
+        count = len(self.store)
+        if ops <= {'add', 'set'}:
+            # Appends don't move earlier rows, so edits can be reported where they landed.
+            old = self._count
+            if count > old:
+                self.beginInsertRows(QModelIndex(), old, count - 1)
+                self._count = count
+                self.endInsertRows()
+            edited = [position for op, position in pending if op == 'set' and position < old]
+            if edited:
+                self.dataChanged.emit(self.index(min(edited), 0), self.index(max(edited), len(COLUMNS) - 1))
+            return
+        if ops == {'remove'}:
+            # A bulk removal reports each row at its position after the ones before it went,
+            # so a block of neighbouring rows arrives as one position repeated.
+            blocks = []
+            for _, position in pending:
+                if blocks and blocks[-1][0] == position:
+                    blocks[-1][1] += 1
+                else:
+                    blocks.append([position, 1])
+            if len(blocks) <= MAX_SIGNALS:
+                for position, size in blocks:
+                    self.beginRemoveRows(QModelIndex(), position, position + size - 1)
+                    self._count -= size
+                    self.endRemoveRows()
+                self.removalsFinished.emit()
+                return
+        elif ops == {'insert'} and len(pending) == 1:
+            position = pending[0][1]
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._count += 1
+            self.endInsertRows()
+            return
+        self.beginResetModel()
+        self._count = count
+        self.endResetModel()
+
+    # -- QAbstractTableModel ---------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        row, column = index.row(), index.column()
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return _RIGHT if column in (LATITUDE, LONGITUDE, ALTITUDE) else None
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        columns = self.columns()
+        if row >= len(columns['name']):
+            return None  # removed since the last flush
+        if column == NAME:
+            return columns['name'][row]
+        if column == LATITUDE:
+            return f"{columns['lat'][row]:.6f}"
+        if column == LONGITUDE:
+            return f"{columns['lon'][row]:.6f}"
+        if column == TIME:
+            return self._time_text(columns, row)
+        if column == ALTITUDE:
+            altitude = columns['alt'][row]
+            return f"{altitude:.1f} m" if altitude == altitude else ""
+        if column == CAMERA:
+            return self._camera_text(columns, row)
+        if column == PLACE:
+            place = columns['place'][row]
+            return ', '.join(part for part in columns['places'][place] if part) if place >= 0 else ""
+        return None
+
+    # -- column access -----------------------------------------------------------
+
+    def columns(self):
+        """The store's columns, fetched again only after it changes."""
+        if self._columns_version != self.store.version:
+            self._columns = self.store.columns()
+            self._columns_version = self.store.version
+        return self._columns
+
+    def _time_text(self, columns, row):
+        raw = columns['raw_times'].get(row)
+        if raw is not None:
+            return raw
+        epoch = columns['time'][row]
+        return format_timestamp(epoch) if epoch == epoch else ""
+
+    def _camera_text(self, columns, row):
+        camera = columns['camera'][row]
+        if camera >= 0:
+            return columns['cameras'][camera]
+        if camera == -2 and isinstance(columns['extra'].get(row), dict):
+            return str(columns['extra'][row].get('CameraModel', ''))
+        return ""
+
+    def _folded_names(self):
+        if self._folded_version != self.store.version:
+            self._folded = [name.casefold() for name in self.columns()['name']]
+            self._folded_version = self.store.version
+        return self._folded
+
+    def sort_keys(self, column):
+        """A key per row for sorting by ``column``; missing values sort last."""
+        columns = self.columns()
+        count = min(self._count, len(columns['name']))
+        if column == NAME:
+            return self._folded_names()
+        if column in (LATITUDE, LONGITUDE):
+            return columns['lat' if column == LATITUDE else 'lon']
+        if column in (TIME, ALTITUDE):
+            values = columns['time' if column == TIME else 'alt']
+            return [value if value == value else math.inf for value in values]
+        if column == CAMERA:
+            labels = [camera.casefold() for camera in columns['cameras']]
+            camera = columns['camera']
+            return [labels[camera[row]] if camera[row] >= 0 else self._camera_text(columns, row).casefold() or _LAST
+                    for row in range(count)]
+        if column == PLACE:
+            labels = [', '.join(part for part in place if part).casefold() for place in columns['places']]
+            place = columns['place']
+            return [labels[place[row]] if place[row] >= 0 else _LAST for row in range(count)]
+        raise ValueError(f"No column {column}")
+
+    def matching(self, text):
+        """Rows whose name, camera or place contains ``text``, ignoring case."""
+        needle = text.casefold()
+        columns = self.columns()
+        count = min(self._count, len(columns['name']))
+        cameras = {i for i, camera in enumerate(columns['cameras']) if needle in camera.casefold()}
+        places = {i for i, place in enumerate(columns['places'])
+                  if needle in ', '.join(part for part in place if part).casefold()}
+        names, camera, place = self._folded_names(), columns['camera'], columns['place']
+        rows = [row for row in range(count)
+                if needle in names[row] or camera[row] in cameras or place[row] in places]
+        extra = [row for row in columns['extra'] if row < count and row not in rows
+                 and needle in self._camera_text(columns, row).casefold()]
+        return sorted(rows + extra) if extra else rows
+
+
+class MarkerFilterModel(QAbstractProxyModel):
+    """Sorts and filters a MarkerTableModel.
+
+    The view order is computed in one pass over a column (Python's sort on
+    a key list, a comprehension for the filter) and kept as an array of
+    source rows. Without a sort column or filter text the source rows show
+    through unchanged and its row signals are passed on as they are;
+    otherwise any change to the source recomputes the order.
+    """
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self._rows = None  # source rows in view order; None shows the source as it is
+        self._view_rows = None  # source row -> view row, built on first use
+        self._column = -1
+        self._order = Qt.SortOrder.AscendingOrder
+        self._text = ''
+        self._removing = False  # a reset is open until the source's removals are finished
+        self.setSourceModel(source)
+        source.rowsAboutToBeInserted.connect(self._before_rows_inserted)
+        source.rowsInserted.connect(self._after_rows_inserted)
+        source.rowsAboutToBeRemoved.connect(self._before_rows_removed)
+        source.rowsRemoved.connect(self._after_rows_removed)
+        source.removalsFinished.connect(self._after_removals)
+        source.modelAboutToBeReset.connect(self.beginResetModel)
+        source.modelReset.connect(self._after_reset)
+        source.dataChanged.connect(self._on_data_changed)
+
+    @property
+    def filter_text(self):
+        return self._text
+
+    def setFilterText(self, text):
+        if text == self._text:
+            return
+        self.sourceModel().flush()
+        self.beginResetModel()
+        self._text = text
+        self._rebuild()
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Sort by ``column``; -1 restores the store order."""
+        self.sourceModel().flush()
+        self.beginResetModel()
+        self._column, self._order = column, order
+        self._rebuild()
+        self.endResetModel()
+
+    def _rebuild(self):
+        source = self.sourceModel()
+        self._view_rows = None
+        if self._column < 0 and not self._text:
+            self._rows = None
+            return
+        rows = source.matching(self._text) if self._text else range(source.rowCount())
+        if self._column >= 0:
+            keys = source.sort_keys(self._column)
+            rows = sorted(rows, key=keys.__getitem__, reverse=self._order == Qt.SortOrder.DescendingOrder)
+        self._rows = array('q', rows)
+
+    # -- source signals ------------------------------------------------------------
+
+    def _before_rows_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QModelIndex(), first, last)
+        else:
+            self.beginResetModel()
+
+    def _before_rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QModelIndex(), first, last)
+        elif not self._removing:
+            self._removing = True
+            self.beginResetModel()
+
+    def _after_rows_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.endInsertRows()
+        else:
+            self._rebuild()
+            self.endResetModel()
+
+    def _after_rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self.endRemoveRows()
+
+    def _after_removals(self):
+        if self._removing:
+            self._removing = False
+            self._rebuild()
+            self.endResetModel()
+
+    def _after_reset(self):
+        self._rebuild()
+        self.endResetModel()
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        if self._rows is None:
+            self.dataChanged.emit(self.index(top_left.row(), top_left.column()),
+                                  self.index(bottom_right.row(), bottom_right.column()), roles)
+        else:
+            self.beginResetModel()
+            self._rebuild()
+            self.endResetModel()
+
+    # -- QAbstractProxyModel ---------------------------------------------------------
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().rowCount() if self._rows is None else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.sourceModel().columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < self.rowCount() and 0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        return self.sourceModel().headerData(section, orientation, role)
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        row = index.row() if self._rows is None else self._rows[index.row()]
+        return self.sourceModel().index(row, index.column())
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        if self._rows is None:
+            return self.index(index.row(), index.column())
+        if self._view_rows is None:
+            self._view_rows = {row: i for i, row in enumerate(self._rows)}
+        row = self._view_rows.get(index.row())
+        return QModelIndex() if row is None else self.index(row, index.column())
+
+    def source_rows(self, indexes):
+        """Sorted store positions of the rows under ``indexes`` of this model."""
+        return sorted({self.mapToSource(index).row() for index in indexes})
+
+
+class InputErrorModel(QAbstractTableModel):
+    """Inputs that couldn't be added, each with the reason, appended in batches."""
+
+    HEADERS = ('Input', 'Problem')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+
+    def add(self, rows):
+        """Append ``(input, problem)`` pairs."""
+        rows = list(rows)
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self._rows[index.row()][index.column()]
+        return None
@@ -0,0 +1,286 @@
+"""Opt-in timing of ExifMapper's stages, with one-off cProfile/tracemalloc captures.
+
+Code marks its stages with the shared ``profiler``: ``@profiler.timed(name)``
+around a function, ``with profiler.stage(name) as stage:`` around a block
+(setting ``stage.bytes`` for what it read or wrote), and
+``with profiler.operation(name):`` around a whole user action such as a
+map render, save or export. Each stage keeps a call count, failures, total
+time, a latency histogram and bytes.
+
+Recording is off unless ``profiler.enabled`` is set (the EXIFMAPPER_PROFILE
+environment variable sets it at startup). While it is off a timed call costs
+one flag check and a stage one no-op context manager. ``arm(kind)`` profiles
+the next operation with cProfile or tracemalloc, whether or not recording is
+on. Stages run in a process pool's workers aren't seen.
+"""
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Histogram bucket upper bounds in seconds; the last bucket holds anything slower.
+BUCKETS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 0.1, 0.3, 1.0, 3.0, 10.0)
+CAPTURES = ('cprofile', 'tracemalloc')
+REPORT_LINES = 25  # functions or allocation sites listed in a capture report
+
+
+class StageStats:
+    """Counters and a latency histogram for one stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.bytes = 0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, nbytes=0, failed=False):
+        self.count += 1
+        self.errors += failed
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.bytes += nbytes
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls (the max for the last one)."""
+        wanted = fraction * self.count
+        seen = 0
+        for i, calls in enumerate(self.histogram):
+            seen += calls
+            if calls and seen >= wanted:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self):
+        ms = lambda seconds: round(seconds * 1000, 4)
+        return {'name': self.name, 'count': self.count, 'errors': self.errors,
+                'total_seconds': round(self.total, 6), 'mean_ms': ms(self.mean), 'min_ms': ms(self.min or 0.0),
+                'max_ms': ms(self.max), 'p50_ms': ms(self.percentile(0.5)), 'p95_ms': ms(self.percentile(0.95)),
+                'p99_ms': ms(self.percentile(0.99)), 'bytes': self.bytes, 'histogram': list(self.histogram)}
+
+
+class Capture:
+    """The cProfile or tracemalloc report of one operation."""
+
+    def __init__(self, name, kind, seconds, report, peak=None):
+        self.name = name
+        self.kind = kind
+        self.seconds = seconds
+        self.report = report
+        self.peak = peak  # tracemalloc: most bytes traced at once
+        self.finished = time.time()
+
+    def title(self):
+        peak = f", peak {_size(self.peak)}" if self.peak is not None else ""
+        return f"{self.kind} of {self.name}: {self.seconds:.3f} s{peak}"
+
+    def to_dict(self):
+        return {'name': self.name, 'kind': self.kind, 'seconds': round(self.seconds, 6), 'peak_bytes': self.peak,
+                'finished': _iso(self.finished), 'report': self.report}
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.bytes = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.profiler.record(self.name, time.perf_counter() - self.started, self.bytes, kind is not None)
+        return False
+
+
+class _NoStage:
+    """What stage() returns while recording is off; bytes set on it go nowhere."""
+
+    bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Operation:
+    """A stage that also runs an armed capture."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.stage = profiler.stage(name)
+
+    def __enter__(self):
+        self.kind = self.profiler._take_armed()
+        if self.kind == 'tracemalloc':
+            self.tracing = tracemalloc.is_tracing()
+            if self.tracing:
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+        elif self.kind == 'cprofile':
+            self.cprofile = cProfile.Profile()
+        self.started = time.perf_counter()
+        if self.kind == 'cprofile':
+            self.cprofile.enable()
+        return self.stage.__enter__()
+
+    def __exit__(self, kind, value, traceback):
+        self.stage.__exit__(kind, value, traceback)
+        if self.kind == 'cprofile':
+            self.cprofile.disable()
+        seconds = time.perf_counter() - self.started
+        if self.kind == 'cprofile':
+            out = io.StringIO()
+            pstats.Stats(self.cprofile, stream=out).sort_stats('cumulative').print_stats(REPORT_LINES)
+            self.profiler._add_capture(Capture(self.name, self.kind, seconds, out.getvalue()))
+        elif self.kind == 'tracemalloc':
+            peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)))
+            top = snapshot.statistics('lineno')[:REPORT_LINES]
+            if not self.tracing:
+                tracemalloc.stop()
+            report = "Still allocated when it finished, by line:\n" + "\n".join(str(stat) for stat in top)
+            self.profiler._add_capture(Capture(self.name, self.kind, seconds, report, peak))
+        return False
+
+
+class Profiler:
+    """Stage counters shared by every thread; see the module docstring."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.time()
+        self.captures = []  # finished captures, oldest first
+        self._stages = {}
+        self._armed = None
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, nbytes=0, failed=False):
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = StageStats(name)
+            stats.add(seconds, nbytes, failed)
+
+    def stage(self, name):
+        """A context manager timing its block as ``name`` while recording is on."""
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def operation(self, name):
+        """Like stage(), for a whole user action; it also runs a capture armed with arm()."""
+        if self._armed is None:
+            return self.stage(name)
+        return _Operation(self, name)
+
+    def timed(self, name):
+        """Decorator recording every call of the function as stage ``name``."""
+        def decorate(function):
+            @functools.wraps(function)
+            def timed_call(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    result = function(*args, **kwargs)
+                except BaseException:
+                    self.record(name, time.perf_counter() - started, failed=True)
+                    raise
+                self.record(name, time.perf_counter() - started)
+                return result
+            return timed_call
+        return decorate
+
+    # -- captures ---------------------------------------------------------------
+
+    def arm(self, kind):
+        """Capture the next operation with ``kind`` ('cprofile' or 'tracemalloc'); None disarms."""
+        if kind is not None and kind not in CAPTURES:
+            raise ValueError(f"Unknown capture {kind!r}; expected one of {', '.join(CAPTURES)}")
+        with self._lock:
+            self._armed = kind
+
+    @property
+    def armed(self):
+        return self._armed
+
+    def _take_armed(self):
+        with self._lock:
+            kind, self._armed = self._armed, None
+            return kind
+
+    def _add_capture(self, capture):
+        with self._lock:
+            self.captures.append(capture)
+            del self.captures[:-10]
+
+    # -- reports ----------------------------------------------------------------
+
+    def stages(self):
+        """Copies of every stage's stats, slowest in total first."""
+        with self._lock:
+            stages = [self._copy(stats) for stats in self._stages.values()]
+        return sorted(stages, key=lambda stats: -stats.total)
+
+    @staticmethod
+    def _copy(stats):
+        copy = StageStats(stats.name)
+        copy.__dict__.update(stats.__dict__)
+        copy.histogram = list(stats.histogram)
+        return copy
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self.captures = []
+            self.started = time.time()
+
+    def to_dict(self):
+        return {'started': _iso(self.started), 'exported': _iso(time.time()), 'enabled': self.enabled,
+                'buckets_ms': [bound * 1000 for bound in BUCKETS],
+                'stages': [stats.to_dict() for stats in self.stages()],
+                'captures': [capture.to_dict() for capture in list(self.captures)]}
+
+    def save(self, path):
+        """Write to_dict() as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+def _size(nbytes):
+    return f"{nbytes / 1e6:.1f} MB" if nbytes >= 1e6 else f"{nbytes / 1e3:.1f} KB"
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='seconds')
+
+
+profiler = Profiler(enabled=bool(os.environ.get('EXIFMAPPER_PROFILE')))
@@ -0,0 +1,326 @@
+"""Saved-locations files: SQLite projects and the original JSON format.
+
+A project is an SQLite file with one row per marker, ordered by a ``pos``
+column. Once a project is attached to a MarkerStore it follows the store's
+change feed, so saving it again writes only the rows added, changed or
+removed since the last save, in one transaction. Both formats are read
+incrementally, so loading a big file never holds it in memory twice.
+"""
+import codecs
+import json
+import os
+import sqlite3
+from array import array
+
+PROJECT_SUFFIX = '.exifmap'
+FORMAT_VERSION = 1
+READ_BATCH = 5000
+JSON_CHUNK = 1 << 20  # characters read at a time
+
+_dump_exif = json.JSONEncoder(default=str).encode
+
+
+def is_project(path):
+    """True if ``path`` is an SQLite file rather than a JSON one."""
+    with open(path, 'rb') as f:
+        return f.read(16) == b'SQLite format 3\x00'
+
+
+def _marker(row):
+    """Validate one saved row as a ``(loc, name, timestamp, altitude, exif_data)`` tuple, or None."""
+    if not isinstance(row, list) or len(row) < 2:
+        return None
+    loc = row[0]
+    if not isinstance(loc, list) or len(loc) != 2:
+        return None
+    return (loc, row[1], row[2] if len(row) > 2 else None, row[3] if len(row) > 3 else None,
+            row[4] if len(row) > 4 else None)
+
+
+def read_json(path, chunk_size=JSON_CHUNK):
+    """Yield the markers of a saved-locations JSON file one at a time, skipping malformed rows.
+
+    Raises json.JSONDecodeError if the file isn't a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    with open(path, 'rb') as f:
+        buffer, pos, eof = '', 0, False
+        started = False
+
+        def more():
+            nonlocal buffer, pos, eof
+            data = f.read(chunk_size)
+            eof = not data
+            buffer = buffer[pos:] + text.decode(data, final=eof)
+            pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n' + (',' if started else ''):
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise json.JSONDecodeError("Unexpected end of file", buffer, pos)
+                more()
+                continue
+            if not started:
+                if buffer[pos] != '[':
+                    raise json.JSONDecodeError("Expected a list of locations", buffer, pos)
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                row, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more()
+                continue
+            if end == len(buffer) and not eof:
+                more()  # a number or literal may continue in the next chunk
+                continue
+            pos = end
+            marker = _marker(row)
+            if marker is not None:
+                yield marker
+
+
+def write_json(path, markers):
+    """Write markers in the saved-locations JSON format, one row at a time."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, marker in enumerate(markers):
+            if i:
+                f.write(', ')
+            f.write(json.dumps(list(marker)))
+        f.write(']')
+    os.replace(tmp, path)
+
+
+class ProjectFile:
+    """An SQLite project that records a MarkerStore's changes for incremental saves.
+
+    ``read()`` streams the saved markers; ``attach(store)`` then ties the
+    file to a store holding exactly those markers, and ``save()`` writes
+    whatever changed since. ``create()`` writes a whole store to a new file.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)  # read from a loader thread
+        self.db.execute("""CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS markers (
+            id INTEGER PRIMARY KEY,
+            pos REAL NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            name TEXT,
+            timestamp TEXT,
+            altitude REAL,
+            exif TEXT)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS markers_pos ON markers (pos)")
+        version = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None:
+            self.db.execute("INSERT INTO meta VALUES ('version', ?)", (str(FORMAT_VERSION),))
+            self.db.commit()
+        elif int(version[0]) > FORMAT_VERSION:
+            self.db.close()
+            raise ValueError(f"{self.path} was saved by a newer version of ExifMapper")
+        self.store = None
+        self._ids = array('q')  # row id of each marker, in store order
+        self._pos = array('d')  # its pos column
+        self._next_id = 1
+        self._dirty = {}  # row id -> (pos, marker) to write, or None to delete
+        self._removed = []  # pending removal positions, see _on_change
+        self._inserted = []  # pending (position, marker) inserts, likewise
+        self._cleared = False
+        self._renumber = False
+
+    @classmethod
+    def create(cls, path, store):
+        """Write every marker of ``store`` to a new project at ``path`` and attach it."""
+        tmp = f"{path}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        project = cls(tmp)
+        try:
+            with project.db:
+                project.db.executemany("INSERT INTO markers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                       (_columns(row, float(row), marker) for row, marker in enumerate(store, 1)))
+        finally:
+            project.close()
+        os.replace(tmp, path)
+        project = cls(path)
+        project.attach(store)
+        return project
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM markers").fetchone()[0]
+
+    def read(self, batch=READ_BATCH):
+        """Yield the saved markers in order."""
+        cursor = self.db.execute("SELECT lat, lon, name, timestamp, altitude, exif FROM markers ORDER BY pos")
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                return
+            for lat, lon, name, timestamp, altitude, exif in rows:
+                yield [lat, lon], name, timestamp, altitude, json.loads(exif) if exif is not None else None
+
+    # -- change tracking -----------------------------------------------------
+
+    def attach(self, store):
+        """Follow ``store``, which must hold the saved markers in order, from now on."""
+        self.detach()
+        self._ids, self._pos = array('q'), array('d')
+        for row_id, pos in self.db.execute("SELECT id, pos FROM markers ORDER BY pos"):
+            self._ids.append(row_id)
+            self._pos.append(pos)
+        self._next_id = (self.db.execute("SELECT MAX(id) FROM markers").fetchone()[0] or 0) + 1
+        self._dirty, self._removed, self._inserted = {}, [], []
+        self._cleared = self._renumber = False
+        self.store = store
+        store.subscribe(self._on_change)
+
+    def detach(self):
+        if self.store is not None:
+            self.store.unsubscribe(self._on_change)
+            self.store = None
+
+    @property
+    def dirty(self):
+        return bool(self._dirty or self._removed or self._inserted or self._cleared or self._renumber)
+
+    def _on_change(self, op, *args):
+        if op == 'remove' and not self._inserted and (not self._removed or args[0] >= self._removed[-1]):
+            # A bulk removal reports rising positions; drop them from the id columns in one pass later.
+            self._removed.append(args[0])
+            return
+        if op == 'insert' and not self._removed and (not self._inserted or args[0] > self._inserted[-1][0]):
+            # So does a bulk insert; splice them into the id columns in one pass later.
+            self._inserted.append(args)
+            return
+        self._flush()
+        if op == 'add':
+            last = self._pos[-1] if self._pos else 0.0
+            for i, marker in enumerate(args[0], 1):
+                self._append(last + i, marker)
+        elif op == 'remove':
+            self._removed.append(args[0])
+        elif op == 'insert':
+            self._inserted.append(args)
+        elif op == 'set':
+            position, _, marker = args
+            self._dirty[self._ids[position]] = (self._pos[position], marker)
+        elif op in ('clear', 'restore'):
+            self._cleared = True
+            self._ids, self._pos = array('q'), array('d')
+            self._dirty = {}
+            if op == 'restore':
+                for i, marker in enumerate(args[0]):
+                    self._append(float(i), marker)
+
+    def _append(self, pos, marker):
+        row_id = self._new_id()
+        self._ids.append(row_id)
+        self._pos.append(pos)
+        self._dirty[row_id] = (pos, marker)
+
+    def _new_id(self):
+        row_id = self._next_id
+        self._next_id += 1
+        return row_id
+
+    def _flush(self):
+        self._flush_removed()
+        self._flush_inserted()
+
+    def _flush_removed(self):
+        if not self._removed:
+            return
+        # The k-th position of a rising run was counted after the k earlier removals.
+        gone = {position + k for k, position in enumerate(self._removed)}
+        self._removed = []
+        keep = [i for i in range(len(self._ids)) if i not in gone]
+        for i in gone:
+            self._dirty[self._ids[i]] = None
+        self._ids = array('q', (self._ids[i] for i in keep))
+        self._pos = array('d', (self._pos[i] for i in keep))
+
+    def _flush_inserted(self):
+        if not self._inserted:
+            return
+        # Positions of a rising run are counted with every insert of the run already in.
+        inserted, self._inserted = self._inserted, []
+        ids, pos = array('q'), array('d')
+        old = 0  # next row of the current columns to copy
+        renumber = False
+        k = 0
+        while k < len(inserted):
+            # New rows at neighbouring positions share the gap between the same two old rows.
+            end = k + 1
+            while end < len(inserted) and inserted[end][0] == inserted[end - 1][0] + 1:
+                end += 1
+            gap = min(inserted[k][0] - k, len(self._ids))
+            ids.extend(self._ids[old:gap])
+            pos.extend(self._pos[old:gap])
+            old = gap
+            count = end - k
+            if gap < len(self._pos):
+                after = self._pos[gap]
+                before = pos[-1] if pos else after - 2
+                values = [before + (after - before) * (i + 1) / (count + 1) for i in range(count)]
+                # Out of room between the neighbours; number every row afresh on the next save.
+                renumber = renumber or not all(a < b for a, b in zip([before] + values, values + [after]))
+            else:
+                last = pos[-1] if pos else 0.0
+                values = [last + i + 1 for i in range(count)]
+            for (_, marker), value in zip(inserted[k:end], values):
+                row_id = self._new_id()
+                ids.append(row_id)
+                pos.append(value)
+                self._dirty[row_id] = (value, marker)
+            k = end
+        ids.extend(self._ids[old:])
+        pos.extend(self._pos[old:])
+        if renumber:
+            pos = array('d', range(len(pos)))
+            self._renumber = True
+        self._ids, self._pos = ids, pos
+
+    # -- saving ----------------------------------------------------------------
+
+    def save(self):
+        """Write the changes since the last save in one transaction; return how many rows changed."""
+        self._flush()
+        dirty = self._dirty
+        with self.db:
+            if self._cleared:
+                self.db.execute("DELETE FROM markers")
+            self.db.executemany("DELETE FROM markers WHERE id = ?",
+                                [(row_id,) for row_id, row in dirty.items() if row is None])
+            self.db.executemany("INSERT OR REPLACE INTO markers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                (_columns(row_id, *row) for row_id, row in dirty.items() if row is not None))
+            if self._renumber:
+                self.db.executemany("UPDATE markers SET pos = ? WHERE id = ?", zip(self._pos, self._ids))
+        changed = len(dirty) + (len(self._ids) if self._renumber else 0)
+        self._dirty = {}
+        self._cleared = self._renumber = False
+        return changed
+
+    def close(self):
+        self.detach()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def _columns(row_id, pos, marker):
+    loc, name, timestamp, altitude, exif_data = (tuple(marker) + (None, None, None))[:5]
+    return (row_id, pos, float(loc[0]), float(loc[1]), name, timestamp, altitude,
+            _dump_exif(exif_data) if exif_data is not None else None)
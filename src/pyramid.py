@@ -0,0 +1,367 @@
+"""Zoom-level cluster index over marker coordinates.
+
+Points are projected to Web Mercator and counted into a grid at every zoom
+level from 0 to MAX_ZOOM, 2 ** CELL_BITS cells across each map tile. Each
+cell keeps its point count, centroid and lowest marker row, so a map only
+needs the cells inside its viewport at its current zoom, however many
+points there are. Parents are built from children, which keeps a million
+points to a few seconds. PointIndex answers the exact markers in a
+viewport, optionally within a time range, for when few enough are in view.
+"""
+import json
+import math
+import os
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # optional; the index builds with plain dicts without it
+    np = None
+
+from .cache import file_identity
+
+MAX_ZOOM = 16
+CELL_BITS = 3  # 8 cells per tile side, about 32 px on 256 px tiles
+MAX_LAT = 85.05112878
+FORMAT_VERSION = 1
+SUFFIX = '.pyramid'
+# float32 centroids are still within a few metres at MAX_ZOOM
+_FIELDS = (('keys', 'q'), ('count', 'I'), ('x', 'f'), ('y', 'f'), ('row', 'I'))
+
+
+def project(lat, lon):
+    """Web Mercator position of a point, scaled to [0, 1] on both axes."""
+    lat = min(max(lat, -MAX_LAT), MAX_LAT)
+    sin = math.sin(math.radians(lat))
+    return lon / 360 + 0.5, 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+
+
+def unproject(x, y):
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, (x - 0.5) * 360
+
+
+def project_all(lats, lons):
+    """``(x, y)`` columns of many points: numpy arrays when numpy is there, else lists."""
+    if np is not None:
+        return _project_np(lats, lons)
+    xs, ys = [], []
+    for lat, lon in zip(lats, lons):
+        x, y = project(lat, lon)
+        xs.append(x)
+        ys.append(y)
+    return xs, ys
+
+
+def pyramid_path(saved_file):
+    """Where the index for a saved-locations file lives."""
+    return str(saved_file) + SUFFIX
+
+
+class Level:
+    """One zoom level: cells sorted by key, where key = ix << bits | iy."""
+
+    __slots__ = ('bits', 'keys', 'count', 'x', 'y', 'row')
+
+    def __init__(self, bits, keys, count, x, y, row):
+        self.bits = bits
+        self.keys = keys
+        self.count = count
+        self.x = x
+        self.y = y
+        self.row = row
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class ClusterPyramid:
+    """Per-zoom grid clusters with counts, centroids and representative rows."""
+
+    def __init__(self, levels, size, max_zoom=MAX_ZOOM, cell_bits=CELL_BITS, source=None):
+        self.levels = levels
+        self.size = size
+        self.max_zoom = max_zoom
+        self.cell_bits = cell_bits
+        self.source = source  # identity of the saved file this index was built for
+
+    @classmethod
+    def from_store(cls, store, max_zoom=MAX_ZOOM, cell_bits=CELL_BITS):
+        lats, lons = store.coordinates()
+        return cls.build(lats, lons, max_zoom, cell_bits)
+
+    @classmethod
+    def build(cls, lats, lons, max_zoom=MAX_ZOOM, cell_bits=CELL_BITS):
+        build = _build_numpy if np is not None else _build_python
+        levels = build(lats, lons, max_zoom, cell_bits)
+        return cls(levels, len(lats), max_zoom, cell_bits)
+
+    @property
+    def nbytes(self):
+        return sum(len(level) * 24 for level in self.levels)
+
+    def query(self, zoom, west, south, east, north):
+        """Return ``(lat, lon, count, row)`` for the clusters in a viewport.
+
+        ``row`` is the first marker in the cluster; when count is 1 it is the
+        marker itself. A viewport crossing the antimeridian has west > east.
+        """
+        zoom = min(max(int(zoom), 0), self.max_zoom)
+        level = self.levels[zoom]
+        side = 1 << level.bits
+        x0, y0 = project(north, west)
+        x1, y1 = project(south, east)
+        iy0, iy1 = _cell(y0, side), _cell(y1, side)
+        if west <= east:
+            spans = [(_cell(x0, side), _cell(x1, side))]
+        else:
+            spans = [(_cell(x0, side), side - 1), (0, _cell(x1, side))]
+        find_left, find_right = _searchers(level.keys)
+        found = []
+        for ix0, ix1 in spans:
+            if ix1 - ix0 >= len(level):
+                # More columns than cells (a wide view at a deep zoom): scan the cells once instead.
+                start, stop = find_left(ix0 << level.bits), find_left((ix1 + 1) << level.bits)
+                cells = (i for i in range(start, stop) if iy0 <= int(level.keys[i]) & (side - 1) <= iy1)
+            else:
+                cells = (i for ix in range(ix0, ix1 + 1)
+                         for i in range(find_left(ix << level.bits | iy0), find_right(ix << level.bits | iy1)))
+            for i in cells:
+                lat, lon = unproject(float(level.x[i]), float(level.y[i]))
+                found.append((lat, lon, int(level.count[i]), int(level.row[i])))
+        return found
+
+    # -- persistence ---------------------------------------------------------
+
+    def save(self, path, source=None):
+        """Write the index as a JSON header line followed by raw little-endian arrays."""
+        header = {'version': FORMAT_VERSION, 'size': self.size, 'max_zoom': self.max_zoom,
+                  'cell_bits': self.cell_bits, 'source': source or self.source,
+                  'levels': [len(level) for level in self.levels]}
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            for level in self.levels:
+                for name, typecode in _FIELDS:
+                    column = getattr(level, name)
+                    if np is not None:
+                        f.write(np.asarray(column, dtype='<' + typecode).tobytes())
+                        continue
+                    column = array(typecode, column)
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    column.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported cluster index version in {path}")
+            levels = []
+            for zoom, length in enumerate(header['levels']):
+                columns = {}
+                for name, typecode in _FIELDS:
+                    if np is not None:
+                        columns[name] = np.fromfile(f, dtype='<' + typecode, count=length)
+                        if len(columns[name]) != length:
+                            raise EOFError(f"Truncated cluster index {path}")
+                        continue
+                    column = array(typecode)
+                    column.fromfile(f, length)
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    columns[name] = column
+                levels.append(Level(zoom + header['cell_bits'], **columns))
+        return cls(levels, header['size'], header['max_zoom'], header['cell_bits'], header.get('source'))
+
+    @classmethod
+    def load_for(cls, saved_file):
+        """Load the index saved next to ``saved_file`` if it was built from its current contents."""
+        path = pyramid_path(saved_file)
+        try:
+            pyramid = cls.load(path)
+            return pyramid if pyramid.source == file_identity(saved_file) else None
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+
+    def save_for(self, saved_file):
+        self.save(pyramid_path(saved_file), file_identity(saved_file))
+
+
+class PointIndex:
+    """Marker rows sorted by projected x, for exact viewport and time queries.
+
+    A viewport is one contiguous slice of that order (two across the
+    antimeridian); y and time are only compared inside it, so a query costs
+    about the number of markers in the viewport's longitude band.
+    """
+
+    def __init__(self, lats, lons, times=None):
+        if np is not None:
+            x, y = _project_np(lats, lons)
+            order = np.argsort(x, kind='stable')
+            self.x, self.y, self.rows = x[order], y[order], order
+            self.time = np.asarray(times, dtype=float)[order] if times is not None else None
+        else:
+            points = sorted((*project(lat, lon), row) for row, (lat, lon) in enumerate(zip(lats, lons)))
+            self.x = [point[0] for point in points]
+            self.y = [point[1] for point in points]
+            self.rows = [point[2] for point in points]
+            self.time = [times[row] for row in self.rows] if times is not None else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query(self, west, south, east, north, start=None, end=None):
+        """Sorted rows inside the bounding box, with a time in [start, end) when those are given."""
+        rows, _, _ = self._select(west, south, east, north, start, end)
+        return np.sort(rows) if np is not None else sorted(rows)
+
+    def clusters(self, zoom, west, south, east, north, start=None, end=None, cell_bits=CELL_BITS):
+        """Like ClusterPyramid.query, but over the markers matching a time range."""
+        rows, xs, ys = self._select(west, south, east, north, start, end)
+        bits = zoom + cell_bits
+        side = 1 << bits
+        if np is not None:
+            keys = (np.clip((xs * side).astype(np.int64), 0, side - 1) << bits) | \
+                np.clip((ys * side).astype(np.int64), 0, side - 1)
+            keys, inverse = np.unique(keys, return_inverse=True)
+            count = np.bincount(inverse, minlength=len(keys))
+            sx = np.bincount(inverse, xs, minlength=len(keys)) / np.maximum(count, 1)
+            sy = np.bincount(inverse, ys, minlength=len(keys)) / np.maximum(count, 1)
+            first = np.full(len(keys), np.iinfo(np.int64).max)
+            np.minimum.at(first, inverse, rows)
+            cells = zip(sx.tolist(), sy.tolist(), count.tolist(), first.tolist())
+        else:
+            grouped = {}
+            for row, x, y in zip(rows, xs, ys):
+                key = (_cell(x, side) << bits) | _cell(y, side)
+                cell = grouped.setdefault(key, [0, 0.0, 0.0, row])
+                cell[0] += 1
+                cell[1] += x
+                cell[2] += y
+                cell[3] = min(cell[3], row)
+            cells = ((sx / n, sy / n, n, row) for n, sx, sy, row in grouped.values())
+        return [(*unproject(x, y), n, row) for x, y, n, row in cells]
+
+    def _select(self, west, south, east, north, start, end):
+        x0, y0 = project(north, west)
+        x1, y1 = project(south, east)
+        spans = [(x0, x1)] if west <= east else [(x0, 1.0), (0.0, x1)]
+        parts = []
+        for lo, hi in spans:
+            if np is not None:
+                i, j = np.searchsorted(self.x, lo, 'left'), np.searchsorted(self.x, hi, 'right')
+                ys = self.y[i:j]
+                keep = (ys >= y0) & (ys <= y1)
+                if start is not None:
+                    keep &= self.time[i:j] >= start
+                if end is not None:
+                    keep &= self.time[i:j] < end
+                parts.append((self.rows[i:j][keep], self.x[i:j][keep], ys[keep]))
+                continue
+            i, j = bisect_left(self.x, lo), bisect_right(self.x, hi)
+            part = ([], [], [])
+            for k in range(i, j):
+                if not y0 <= self.y[k] <= y1:
+                    continue
+                # NaN (unknown) times compare False, so they never match a time range
+                if (start is not None and not self.time[k] >= start) or (end is not None and not self.time[k] < end):
+                    continue
+                part[0].append(self.rows[k])
+                part[1].append(self.x[k])
+                part[2].append(self.y[k])
+            parts.append(part)
+        if np is not None:
+            return tuple(np.concatenate(column) for column in zip(*parts))
+        return tuple([value for part in parts for value in part[column]] for column in range(3))
+
+
+def _cell(value, side):
+    return min(max(int(value * side), 0), side - 1)
+
+
+def _searchers(keys):
+    if np is not None:
+        return (lambda v: int(np.searchsorted(keys, v, 'left')),
+                lambda v: int(np.searchsorted(keys, v, 'right')))
+    return (lambda v: bisect_left(keys, v)), (lambda v: bisect_right(keys, v))
+
+
+def _project_np(lats, lons):
+    lat = np.clip(np.asarray(lats, dtype=float), -MAX_LAT, MAX_LAT)
+    sin = np.sin(np.radians(lat))
+    return np.asarray(lons, dtype=float) / 360 + 0.5, 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / np.pi
+
+
+def _build_numpy(lats, lons, max_zoom, cell_bits):
+    x, y = _project_np(lats, lons)
+    bits = max_zoom + cell_bits
+    side = 1 << bits
+    ix = np.clip((x * side).astype(np.int64), 0, side - 1)
+    iy = np.clip((y * side).astype(np.int64), 0, side - 1)
+    keys, count = (ix << bits) | iy, np.ones(len(x), dtype=np.int64)
+    sx, sy, row = x, y, np.arange(len(x), dtype=np.int64)
+
+    levels = [None] * (max_zoom + 1)
+    for zoom in range(max_zoom, -1, -1):
+        if len(keys):
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+            count = np.add.reduceat(count[order], starts)
+            sx = np.add.reduceat(sx[order], starts)
+            sy = np.add.reduceat(sy[order], starts)
+            row = np.minimum.reduceat(row[order], starts)
+            keys = keys[starts]
+        levels[zoom] = Level(zoom + cell_bits, keys, count.astype(np.uint32), (sx / count).astype(np.float32),
+                             (sy / count).astype(np.float32), row.astype(np.uint32))
+        # Sums carry up to the parent level; centroids are divided out per level.
+        bits = zoom + cell_bits
+        mask = (1 << bits) - 1
+        keys = ((keys >> bits) >> 1 << (bits - 1)) | ((keys & mask) >> 1)
+    return levels
+
+
+def _build_python(lats, lons, max_zoom, cell_bits):
+    bits = max_zoom + cell_bits
+    side = 1 << bits
+    cells = {}
+    for row, (lat, lon) in enumerate(zip(lats, lons)):
+        x, y = project(lat, lon)
+        key = (_cell(x, side) << bits) | _cell(y, side)
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [1, x, y, row]
+        else:
+            cell[0] += 1
+            cell[1] += x
+            cell[2] += y
+
+    levels = [None] * (max_zoom + 1)
+    for zoom in range(max_zoom, -1, -1):
+        bits = zoom + cell_bits
+        keys = sorted(cells)
+        levels[zoom] = Level(bits, array('q', keys), array('I', (cells[k][0] for k in keys)),
+                             array('f', (cells[k][1] / cells[k][0] for k in keys)),
+                             array('f', (cells[k][2] / cells[k][0] for k in keys)),
+                             array('I', (cells[k][3] for k in keys)))
+        mask = (1 << bits) - 1
+        parents = {}
+        for key in keys:
+            count, sx, sy, row = cells[key]
+            parent_key = ((key >> bits) >> 1 << (bits - 1)) | ((key & mask) >> 1)
+            parent = parents.get(parent_key)
+            if parent is None:
+                parents[parent_key] = [count, sx, sy, row]
+            else:
+                parent[0] += count
+                parent[1] += sx
+                parent[2] += sy
+                parent[3] = min(parent[3], row)
+        cells = parents
+    return levels
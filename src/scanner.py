@@ -0,0 +1,71 @@
+"""Single-pass folder scanner.
+
+Walks a tree once with ``os.scandir`` and yields matching image paths as it
+goes, so extraction can start before the scan finishes.
+"""
+import os
+from fnmatch import fnmatch
+
+from .extract import IMAGE_EXTENSIONS
+
+SYMLINK_POLICIES = ('skip', 'files', 'follow')
+
+
+def scan_images(root, extensions=IMAGE_EXTENSIONS, include=None, exclude=None,
+                max_depth=None, symlinks='files'):
+    """Yield image paths under ``root``.
+
+    Extensions are matched case-insensitively. ``include``/``exclude`` are glob
+    patterns checked against the path relative to ``root`` and against the bare
+    name; excluded directories are not entered. ``max_depth`` 0 scans only
+    ``root`` itself. ``symlinks`` is 'skip' (ignore links), 'files' (keep
+    linked files but don't enter linked folders) or 'follow' (enter linked
+    folders too, once each).
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"symlinks must be one of {', '.join(SYMLINK_POLICIES)}")
+    extensions = tuple(ext.lower() for ext in extensions)
+    include = list(include or [])
+    exclude = list(exclude or [])
+    seen = set()
+    if symlinks == 'follow':
+        st = os.stat(root)
+        seen.add((st.st_dev, st.st_ino))
+
+    stack = [(os.fspath(root), '', 0)]
+    while stack:
+        path, rel, depth = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            entry_rel = f"{rel}/{entry.name}" if rel else entry.name
+            if exclude and _matches(entry_rel, entry.name, exclude):
+                continue
+            try:
+                is_link = entry.is_symlink()
+                if is_link and symlinks == 'skip':
+                    continue
+                if entry.is_dir(follow_symlinks=symlinks == 'follow'):
+                    if max_depth is not None and depth >= max_depth:
+                        continue
+                    if symlinks == 'follow':
+                        st = entry.stat()
+                        if (st.st_dev, st.st_ino) in seen:
+                            continue
+                        seen.add((st.st_dev, st.st_ino))
+                    subdirs.append((entry.path, entry_rel, depth + 1))
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    if include and not _matches(entry_rel, entry.name, include):
+                        continue
+                    yield entry.path
+            except OSError:
+                continue
+        stack.extend(reversed(subdirs))
+
+
+def _matches(rel, name, patterns):
+    return any(fnmatch(rel, pattern) or fnmatch(name, pattern) for pattern in patterns)
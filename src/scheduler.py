@@ -0,0 +1,233 @@
+"""Per-host scheduling of remote image fetches.
+
+Every fetch goes through one pooled keep-alive session. A fetch first takes
+one of its host's ``per_host`` slots and then one of ``max_connections``
+global slots, so a long list of URLs on one CDN can't take every
+connection, and no host is asked harder than ``per_host`` allows.
+Connection errors, timeouts and 429/5xx answers are retried with
+exponential backoff and jitter. A Retry-After header holds back every
+fetch to that host until it has passed. Counters per host feed the summary
+shown after an ingest.
+
+The scheduler doesn't own any threads: callers wait for slots in their own
+threads, so it works under the ExtractionPool's thread pool.
+"""
+import email.utils
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+PER_HOST = 6
+MAX_CONNECTIONS = 16
+RETRIES = 3
+BACKOFF = 0.5  # seconds before the first retry; doubled for each one after
+MAX_DELAY = 60  # longest wait before a retry, Retry-After included
+POOLED_HOSTS = 32  # hosts whose keep-alive connections are kept open
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def host_of(url):
+    """The ``host[:port]`` a URL's fetches are counted and limited under."""
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class HostStats:
+    """Counters for one host."""
+
+    def __init__(self):
+        self.requests = 0  # HTTP responses received, range requests and retries included
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.waited = 0.0  # seconds spent waiting to retry
+        self.active = 0
+        self.peak = 0  # most fetches in flight at once
+        self.started = None
+        self.finished = None
+
+    @property
+    def rate(self):
+        """Finished fetches per second between the first start and the last finish."""
+        if self.started is None or self.finished is None or self.finished <= self.started:
+            return 0.0
+        return (self.done + self.failed) / (self.finished - self.started)
+
+    def summary(self):
+        return (f"{self.done} fetched, {self.failed} failed, {self.retries} retried, "
+                f"{self.requests} request(s), {self.rate:.1f}/s, at most {self.peak} at once")
+
+
+class _Host:
+    def __init__(self, slots):
+        self.slots = threading.BoundedSemaphore(slots)
+        self.resume_at = 0.0  # monotonic time before which nothing is sent, from Retry-After
+        self.stats = HostStats()
+
+
+class FetchScheduler:
+    """Runs fetches through a shared session within per-host and global connection limits.
+
+    ``call(url, fetch)`` runs ``fetch(session)`` once slots for the URL's
+    host are free, retrying it on transient errors. It may be called from
+    any number of threads; a call given a ``stop`` event gives up its
+    waiting retries once the event is set, without affecting other calls.
+    """
+
+    def __init__(self, per_host=PER_HOST, max_connections=MAX_CONNECTIONS, retries=RETRIES,
+                 backoff=BACKOFF, max_delay=MAX_DELAY):
+        self.per_host = per_host
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._session = None
+
+    def settings(self):
+        """Keyword arguments that make an equivalent scheduler, e.g. in a worker process."""
+        return {'per_host': self.per_host, 'max_connections': self.max_connections, 'retries': self.retries,
+                'backoff': self.backoff, 'max_delay': self.max_delay}
+
+    @property
+    def session(self):
+        """The pooled keep-alive session, made on first use so requests is only imported then."""
+        with self._lock:
+            if self._session is None:
+                import requests
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=POOLED_HOSTS, pool_maxsize=self.per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.hooks['response'].append(self._count_request)
+                self._session = session
+            return self._session
+
+    def call(self, url, fetch, stop=None):
+        """Return ``fetch(session)`` for ``url``, retried on transient errors; raise the last error."""
+        stop = stop if stop is not None else threading.Event()
+        host = self._host(host_of(url))
+        stats = host.stats
+        for attempt in range(self.retries + 1):
+            with host.slots:
+                pause = host.resume_at - time.monotonic()
+                if pause > 0:
+                    stop.wait(pause)
+                with self._slots:
+                    self._begin(stats)
+                    try:
+                        result = fetch(self.session)
+                    except Exception as e:
+                        error = e
+                    else:
+                        self._end(stats, failed=False)
+                        return result
+            delay = self._retry_delay(error, attempt, host)
+            if delay is None or attempt == self.retries or stop.is_set():
+                self._end(stats, failed=True)
+                raise error
+            with self._lock:
+                stats.active -= 1
+                stats.retries += 1
+                stats.waited += delay
+            stop.wait(delay)
+
+    def _retry_delay(self, error, attempt, host):
+        if not _transient(error):
+            return None
+        delay = min(self.max_delay, self.backoff * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)  # so fetches that failed together don't retry together
+        retry_after = _retry_after(getattr(error, 'response', None))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+            with self._lock:
+                host.resume_at = max(host.resume_at, time.monotonic() + delay)
+        return delay
+
+    def _host(self, name):
+        with self._lock:
+            host = self._hosts.get(name)
+            if host is None:
+                host = self._hosts[name] = _Host(self.per_host)
+            return host
+
+    def _begin(self, stats):
+        with self._lock:
+            stats.active += 1
+            stats.peak = max(stats.peak, stats.active)
+            if stats.started is None:
+                stats.started = time.monotonic()
+
+    def _end(self, stats, failed):
+        with self._lock:
+            stats.active -= 1
+            stats.finished = time.monotonic()
+            if failed:
+                stats.failed += 1
+            else:
+                stats.done += 1
+
+    def _count_request(self, response, *args, **kwargs):
+        host = self._host(host_of(response.request.url))
+        with self._lock:
+            host.stats.requests += 1
+
+    # -- stats -----------------------------------------------------------------
+
+    def stats(self):
+        """``{host: HostStats}`` for every host fetched from since the last reset."""
+        with self._lock:
+            return {name: host.stats for name, host in self._hosts.items() if host.stats.started is not None}
+
+    def reset_stats(self):
+        with self._lock:
+            for host in self._hosts.values():
+                active = host.stats.active
+                host.stats = HostStats()
+                host.stats.active = active
+
+    def summary(self):
+        stats = self.stats().values()
+        if not stats:
+            return ""
+        return (f"{len(stats)} host(s): {sum(s.done for s in stats)} fetched, "
+                f"{sum(s.failed for s in stats)} failed, {sum(s.retries for s in stats)} retried")
+
+    def report(self):
+        """One line per host, busiest first."""
+        stats = sorted(self.stats().items(), key=lambda item: -(item[1].done + item[1].failed))
+        return "\n".join(f"{name}: {host.summary()}" for name, host in stats)
+
+    def close(self):
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+
+def _transient(error):
+    """True for errors worth retrying: lost connections, timeouts and 408/429/5xx answers."""
+    exceptions = sys.modules.get('requests.exceptions')
+    if exceptions is None:
+        return False
+    if isinstance(error, exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (exceptions.ConnectionError, exceptions.Timeout, exceptions.ChunkedEncodingError))
+
+
+def _retry_after(response):
+    """Seconds a response's Retry-After header asks to wait, or None."""
+    value = response.headers.get('Retry-After', '').strip() if response is not None else ''
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
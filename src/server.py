@@ -0,0 +1,272 @@
+"""Local HTTP server for the map.
+
+The page holds no marker data. It asks for what is inside its viewport,
+and for the time range picked on the map, from JSON endpoints:
+
+    /markers  clusters from the pyramid, or single markers once few enough are in view
+    /heat     cell counts for the heatmap
+    /path     the distance path, thinned to one point per cell at the zoom
+    /marker/<row>, /thumb/<row>  popup text and thumbnail of one marker
+    /changes  long-polled; answers when the markers or the page change
+
+The GUI publishes a copy of its markers with MapServer.publish; an open page
+hears about it on /changes and only re-requests its viewport.
+"""
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .geodesy import UNIT_NAMES, track_length
+from .mapbundle import popup_html
+from .pyramid import CELL_BITS, ClusterPyramid, PointIndex, project_all
+
+try:
+    import numpy as np
+except ImportError:  # optional; paths are filtered and thinned in plain Python without it
+    np = None
+
+HOST = '127.0.0.1'
+MAX_MARKERS = 2000  # viewports holding more markers than this get clusters
+MAX_PATH_POINTS = 5000
+POLL_TIMEOUT = 20  # seconds a /changes request is held open
+CONNECTED_FOR = POLL_TIMEOUT + 10  # a page that polled this recently counts as open
+
+
+class MapView:
+    """One published version of the markers, with indexes built on first use."""
+
+    def __init__(self, store, pyramid=None):
+        self.store = store  # a private copy; nothing writes to it
+        self.version = store.version
+        self._pyramid = pyramid
+        self._index = None
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pyramid(self):
+        with self._lock:
+            if self._pyramid is None:
+                self._pyramid = ClusterPyramid.from_store(self.store)
+            return self._pyramid
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = PointIndex(*self.store.coordinates(), self.store.times())
+            return self._index
+
+    def markers(self, zoom, bbox, start=None, end=None):
+        """``(lat, lon, count, row)`` for a viewport; count is 1 for a single marker."""
+        if start is None and end is None:
+            cells = self.pyramid.query(zoom, *bbox)
+            if sum(cell[2] for cell in cells) > MAX_MARKERS:
+                return cells
+        rows = self.index.query(*bbox, start, end)
+        if len(rows) > MAX_MARKERS:
+            return self.index.clusters(zoom, *bbox, start, end)
+        lats, lons = self.store.coordinates()
+        return [(lats[row], lons[row], 1, row) for row in map(int, rows)]
+
+    def heat(self, zoom, bbox, start=None, end=None):
+        if start is None and end is None:
+            return self.pyramid.query(zoom, *bbox)
+        return self.index.clusters(zoom, *bbox, start, end)
+
+    def path(self, zoom, start=None, end=None, unit='km'):
+        """Return ``(points, total distance)`` of the track through the markers in a time range."""
+        key = (zoom, start, end, unit)
+        if key not in self._paths:
+            lats, lons = self.store.coordinates()
+            if start is not None or end is not None:
+                times = self.store.times()
+                if np is not None:
+                    times, keep = np.asarray(times), True
+                    if start is not None:
+                        keep = keep & (times >= start)
+                    if end is not None:
+                        keep = keep & (times < end)
+                    lats, lons = np.asarray(lats)[keep], np.asarray(lons)[keep]
+                else:
+                    rows = [row for row, t in enumerate(times)
+                            if (start is None or t >= start) and (end is None or t < end)]
+                    lats, lons = [lats[row] for row in rows], [lons[row] for row in rows]
+            total = track_length(lats, lons, unit=unit) if len(lats) >= 2 else 0.0
+            self._paths[key] = (_thin(lats, lons, zoom), total)
+        return self._paths[key]
+
+    def popup(self, row, thumbnail):
+        loc, name, timestamp, altitude, exif_data = self.store[row]
+        image = name if name.startswith(('http://', 'https://')) else thumbnail
+        return popup_html(name, timestamp, altitude, exif_data, image)
+
+
+def _thin(lats, lons, zoom, cell_bits=CELL_BITS):
+    """Drop points in the same map cell as the one before, then stride down to MAX_PATH_POINTS."""
+    side = 1 << (zoom + cell_bits)
+    xs, ys = project_all(lats, lons)
+    if np is not None:
+        cells = (xs * side).astype(np.int64) * side + (ys * side).astype(np.int64)
+        keep = np.concatenate(([True], cells[1:] != cells[:-1])) if len(cells) else cells.astype(bool)
+        if len(keep):
+            keep[-1] = True
+        rows = np.flatnonzero(keep).tolist()
+    else:
+        cells = [int(x * side) * side + int(y * side) for x, y in zip(xs, ys)]
+        rows = [i for i, cell in enumerate(cells) if i == 0 or i == len(cells) - 1 or cell != cells[i - 1]]
+    step = -(-len(rows) // MAX_PATH_POINTS)
+    if step > 1:
+        rows = rows[::step] + rows[-1:]
+    return [[round(float(lats[i]), 6), round(float(lons[i]), 6)] for i in rows]
+
+
+class MapServer:
+    """Serves the map page and its viewport queries on localhost from a background thread."""
+
+    def __init__(self, thumbnailer=None, host=HOST, port=0):
+        self.thumbnailer = thumbnailer
+        self.host = host
+        self.port = port
+        self.view = None
+        self.page = b''
+        self.page_id = 0
+        self.last_seen = 0.0
+        self.httpd = None
+        self._changed = threading.Condition()
+
+    def start(self):
+        if self.httpd is None:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+            self.httpd.daemon_threads = True
+            self.httpd.map_server = self
+            self.port = self.httpd.server_address[1]
+            threading.Thread(target=self.httpd.serve_forever, name='map-server', daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    def publish(self, store=None, page=None, pyramid=None):
+        """Serve ``store`` (a copy the caller won't touch again) and/or a new page to open maps."""
+        with self._changed:
+            if store is not None:
+                self.view = MapView(store, pyramid)
+            if page is not None:
+                self.page = page.encode('utf-8')
+                self.page_id += 1
+            self._changed.notify_all()
+
+    def connected(self):
+        """True while a map page is polling for changes."""
+        return time.monotonic() - self.last_seen < CONNECTED_FOR
+
+    def wait(self, version, page, timeout=POLL_TIMEOUT):
+        """Block until the version or page differs from the client's; return the current ones."""
+        def current():
+            return (str(self.view.version) if self.view is not None else '', str(self.page_id))
+
+        self.last_seen = time.monotonic()
+        with self._changed:
+            self._changed.wait_for(lambda: current() != (version, page), timeout)
+            state = current()
+        self.last_seen = time.monotonic()
+        return state
+
+    def thumbnail(self, name):
+        if self.thumbnailer is None or name.startswith(('http://', 'https://')):
+            return None
+        return self.thumbnailer.thumbnails([name]).get(name)
+
+    def stop(self):
+        if self.httpd is not None:
+            with self._changed:
+                self.page_id += 1  # release held /changes requests
+                self._changed.notify_all()
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server.map_server
+        url = urllib.parse.urlsplit(self.path)
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+        try:
+            if url.path == '/':
+                return self._send(server.page, 'text/html; charset=utf-8')
+            if parts[0] == 'changes':
+                version, page = server.wait(params.get('version', ''), params.get('page', ''))
+                return self._json({'version': int(version) if version else None, 'page': page})
+            view = server.view
+            if view is None:
+                return self._error(404, "No markers published")
+            if 'version' in params and params['version'] != str(view.version):
+                return self._error(409, "Markers changed")
+            if parts[0] in ('markers', 'heat', 'path'):
+                zoom = int(params.get('zoom', 0))
+                start, end = _number(params.get('start')), _number(params.get('end'))
+                if parts[0] == 'path':
+                    unit = params.get('unit', 'km')
+                    points, total = view.path(zoom, start, end, unit)
+                    return self._json({'points': points,
+                                       'tooltip': f"Total Distance: {total:.2f} {UNIT_NAMES.get(unit, unit)}"})
+                bbox = _bbox(params.get('bbox'))
+                if parts[0] == 'heat':
+                    cells = view.heat(zoom, bbox, start, end)
+                    top = max((cell[2] for cell in cells), default=1)
+                    return self._json({'points': [[round(lat, 6), round(lon, 6), round(count / top, 4)]
+                                                  for lat, lon, count, _ in cells]})
+                cells = view.markers(zoom, bbox, start, end)
+                return self._json({'version': view.version,
+                                   'lat': [round(float(cell[0]), 6) for cell in cells],
+                                   'lon': [round(float(cell[1]), 6) for cell in cells],
+                                   'count': [int(cell[2]) for cell in cells],
+                                   'row': [int(cell[3]) for cell in cells]})
+            if parts[0] in ('marker', 'thumb') and len(parts) == 2:
+                row = int(parts[1])
+                if not 0 <= row < len(view.store):
+                    return self._error(404, "No such marker")
+                if parts[0] == 'marker':
+                    thumbnail = f"/thumb/{row}?version={view.version}"
+                    return self._json({'html': view.popup(row, thumbnail)})
+                data = server.thumbnail(view.store[row][1])
+                if data is None:
+                    return self._error(404, "No thumbnail")
+                return self._send(data, 'image/jpeg', cache=True)
+            return self._error(404, "Not found")
+        except (ValueError, IndexError) as e:
+            return self._error(400, str(e))
+
+    def _json(self, payload):
+        self._send(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 'application/json')
+
+    def _send(self, body, content_type, status=200, cache=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'max-age=86400' if cache else 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(json.dumps({'error': message}).encode('utf-8'), 'application/json', status)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _number(value):
+    return float(value) if value not in (None, '') else None
+
+
+def _bbox(value):
+    west, south, east, north = (float(v) for v in (value or '-180,-85,180,85').split(','))
+    return west, south, east, north
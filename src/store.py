@@ -0,0 +1,570 @@
+"""Column-oriented marker storage.
+
+MarkerStore keeps coordinates, altitude and time in ``array`` columns and
+indexes rows by name, while still behaving like the old list of
+``(loc, name, timestamp, altitude, exif_data)`` tuples for callers that
+iterate, index or append.
+"""
+import math
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+DUPLICATE_TOLERANCE = 0.0001  # degrees
+GRID_CELL = 0.01  # degrees per spatial grid cell
+DUPLICATE_POLICIES = ('skip', 'overwrite', 'keep')  # see MarkerStore.merge
+PLACE_KEYS = ('City', 'Region', 'Country')  # exif_data keys filled in by the gazetteer
+
+_NAN = float('nan')
+_EPOCH = datetime(1970, 1, 1)
+
+
+def parse_timestamp(timestamp):
+    """Return EXIF 'YYYY:MM:DD HH:MM:SS' as UTC epoch seconds, or None.
+
+    Only strings that format back identically are accepted.
+    """
+    if (not isinstance(timestamp, str) or len(timestamp) != 19 or timestamp[4] != ':' or timestamp[7] != ':'
+            or timestamp[10] != ' ' or timestamp[13] != ':' or timestamp[16] != ':'):
+        return None
+    digits = timestamp[0:4] + timestamp[5:7] + timestamp[8:10] + timestamp[11:13] + timestamp[14:16] + timestamp[17:19]
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    try:
+        return (datetime(int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                         int(digits[8:10]), int(digits[10:12]), int(digits[12:14])) - _EPOCH).total_seconds()
+    except ValueError:
+        return None
+
+
+def format_timestamp(epoch):
+    return (_EPOCH + timedelta(seconds=epoch)).strftime('%Y:%m:%d %H:%M:%S')
+
+
+class MarkerStore:
+    """Marker table with array-backed columns and a name -> row index.
+
+    Removed rows are tombstoned and compacted lazily, so single removals
+    don't shift every later row. Subscribers are told about every change as
+    ``(op, *args)`` where op is 'add' (markers), 'remove' (position, marker),
+    'set' (position, old, new), 'insert' (position, marker) or 'clear'
+    (a MarkerStore holding the removed markers).
+    """
+
+    _COLUMNS = ('_lat', '_lon', '_alt', '_time', '_camera', '_exposure', '_place')
+
+    def __init__(self, markers=()):
+        self._lat = array('d')
+        self._lon = array('d')
+        self._alt = array('d')
+        self._time = array('d')
+        self._names = []
+        self._camera = array('i')
+        self._exposure = array('d')
+        self._place = array('i')  # index into _places, -1 when not labelled
+        self._alive = bytearray()
+        self._raw_times = {}  # row -> timestamp that doesn't round-trip through epoch seconds
+        self._extra = {}  # row -> exif_data that doesn't fit the camera/exposure columns
+        self._cameras = []
+        self._camera_ids = {}
+        self._places = []  # (city, region, country) labels
+        self._place_ids = {}
+        self._index = {}  # name -> row, or list of rows when a name repeats; None when stale
+        self._dead = 0
+        self._grid = None
+        self._observers = []
+        self.version = 0
+        if markers:
+            self.extend(markers)
+
+    # -- list compatibility -------------------------------------------------
+
+    def __len__(self):
+        return len(self._names) - self._dead
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        alive = self._alive
+        for row in range(len(self._names)):
+            if alive[row]:
+                yield self._row(row)
+
+    def __getitem__(self, i):
+        self._compact()
+        if isinstance(i, slice):
+            return [self._row(row) for row in range(len(self._names))[i]]
+        return self._row(range(len(self._names))[i])
+
+    def __setitem__(self, i, marker):
+        self._compact()
+        row = range(len(self._names))[i]
+        old = self._row(row) if self._observers else None
+        self._unindex(row)
+        self._write(row, marker)
+        self._index_row(row)
+        self.version += 1
+        self._notify('set', row, old, self._row(row))
+
+    def __delitem__(self, i):
+        self._compact()
+        self.remove_rows([range(len(self._names))[i]])
+
+    def __repr__(self):
+        return f"MarkerStore({len(self)} markers)"
+
+    def append(self, marker):
+        self._write(len(self._names), marker)
+        self._index_row(len(self._names) - 1)
+        self.version += 1
+        if self._observers:
+            self._notify('add', [self._row(len(self._names) - 1)])
+
+    def extend(self, markers):
+        """Bulk insert markers."""
+        start = len(self._names)
+        for marker in markers:
+            self._write(len(self._names), marker)
+        for row in range(start, len(self._names)):
+            self._index_row(row)
+        self.version += 1
+        if self._observers and len(self._names) > start:
+            self._notify('add', [self._row(row) for row in range(start, len(self._names))])
+
+    def merge(self, markers, policy='skip', tolerance=DUPLICATE_TOLERANCE):
+        """Bulk add markers, treating every duplicate (same name and place) the same way.
+
+        ``policy`` is 'skip' (keep the marker already there), 'overwrite'
+        (replace it with the new one) or 'keep' (keep both). Duplicates within
+        ``markers`` count too. Returns ``(added, replaced, skipped)``.
+        """
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        if policy == 'keep':
+            markers = list(markers)
+            self.extend(markers)
+            return len(markers), 0, 0
+        incoming = []
+        taken = {}  # name -> positions in incoming
+        stale = set()
+        replacing = set()  # positions in incoming that replace a marker
+        skipped = 0
+        for marker in markers:
+            loc, name = marker[0], sys.intern(str(marker[1]))
+            rows = [row for row in self.rows_named(name)
+                    if abs(self._lat[row] - loc[0]) < tolerance and abs(self._lon[row] - loc[1]) < tolerance]
+            earlier = [i for i in taken.get(name, ()) if incoming[i] is not None
+                       and abs(incoming[i][0][0] - loc[0]) < tolerance and abs(incoming[i][0][1] - loc[1]) < tolerance]
+            if rows or earlier:
+                if policy == 'skip':
+                    skipped += 1
+                    continue
+                stale.update(rows)
+                for i in earlier:
+                    incoming[i] = None
+                    replacing.discard(i)
+                replacing.add(len(incoming))
+            taken.setdefault(name, []).append(len(incoming))
+            incoming.append(marker)
+        if stale:
+            self.remove_rows(stale)
+        incoming = [marker for marker in incoming if marker is not None]
+        self.extend(incoming)
+        return len(incoming) - len(replacing), len(replacing), skipped
+
+    def insert(self, position, marker):
+        """Insert a marker before ``position``; later rows shift by one."""
+        self._compact()
+        if position >= len(self._names):
+            return self.append(marker)
+        self._write(len(self._names), marker)
+        for attr in self._COLUMNS:
+            column = getattr(self, attr)
+            column.insert(position, column.pop())
+        self._names.insert(position, self._names.pop())
+        self._raw_times = self._shift_sparse(self._raw_times, position)
+        self._extra = self._shift_sparse(self._extra, position)
+        self._index = None  # rebuilt on the next lookup
+        self._grid = None
+        self.version += 1
+        if self._observers:
+            self._notify('insert', position, self._row(position))
+
+    def insert_many(self, markers):
+        """Bulk insert ``(position, marker)`` pairs, each position counted in the list after the insert.
+
+        The columns are rebuilt once; subscribers get one 'insert' per marker,
+        in rising position order.
+        """
+        markers = sorted(markers, key=lambda item: item[0])
+        if not markers:
+            return
+        self._compact()
+        start = len(self._names)
+        for _, marker in markers:
+            self._write(len(self._names), marker)
+        order = []  # old physical row for every new one
+        old, new = 0, start
+        for position in range(len(self._names)):
+            if new < len(self._names) and (markers[new - start][0] <= position or old == start):
+                order.append(new)
+                new += 1
+            else:
+                order.append(old)
+                old += 1
+        for attr in self._COLUMNS:
+            column = getattr(self, attr)
+            setattr(self, attr, array(column.typecode, (column[row] for row in order)))
+        names = self._names
+        self._names = [names[row] for row in order]
+        moved = array('q', bytes(8 * len(order)))
+        for position, row in enumerate(order):
+            moved[row] = position
+        self._raw_times = {moved[row]: value for row, value in self._raw_times.items()}
+        self._extra = {moved[row]: value for row, value in self._extra.items()}
+        self._index = None  # rebuilt on the next lookup
+        self._grid = None
+        self.version += 1
+        if self._observers:
+            for row in range(start, len(self._names)):
+                self._notify('insert', moved[row], self._row(moved[row]))
+
+    def _shift_sparse(self, values, position):
+        """Re-key a row -> value side table after the last row moved to ``position``."""
+        moved = values.pop(len(self._names) - 1, None)
+        values = {(row + 1 if row >= position else row): value for row, value in values.items()}
+        if moved is not None:
+            values[position] = moved
+        return values
+
+    def truncate(self, count):
+        """Remove the last ``count`` markers."""
+        self._compact()
+        total = len(self._names)
+        self.remove_rows(range(max(total - count, 0), total))
+
+    def pop(self):
+        """Remove and return the last marker."""
+        self._compact()
+        if not self._names:
+            raise IndexError("pop from empty MarkerStore")
+        marker = self._row(len(self._names) - 1)
+        self.remove_rows([len(self._names) - 1])
+        return marker
+
+    def copy(self):
+        other = MarkerStore.__new__(MarkerStore)
+        self._compact()
+        for attr in self._COLUMNS:
+            setattr(other, attr, array(getattr(self, attr).typecode, getattr(self, attr)))
+        other._names = list(self._names)
+        other._alive = bytearray(self._alive)
+        other._raw_times = dict(self._raw_times)
+        other._extra = dict(self._extra)
+        other._cameras = list(self._cameras)
+        other._camera_ids = dict(self._camera_ids)
+        other._places = list(self._places)
+        other._place_ids = dict(self._place_ids)
+        other._index = None
+        other._dead = 0
+        other._grid = None
+        other._observers = []
+        other.version = self.version
+        return other
+
+    def clear(self):
+        """Remove every marker; subscribers get the old contents without copying them."""
+        old = MarkerStore.__new__(MarkerStore)
+        old.__dict__.update(self.__dict__)
+        old._observers = []
+        observers, version = self._observers, self.version
+        self.__init__()
+        self._observers = observers
+        self.version = version + 1
+        self._notify('clear', old)
+        return old
+
+    def restore(self, other):
+        """Replace the contents with those of ``other`` (which must not be used afterwards)."""
+        observers, version = self._observers, self.version
+        self.__dict__.update(other.__dict__)
+        self._observers = observers
+        self.version = version + 1
+        self._notify('restore', self)
+
+    def subscribe(self, callback):
+        self._observers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._observers:
+            self._observers.remove(callback)
+
+    def _notify(self, op, *args):
+        for callback in list(self._observers):
+            callback(op, *args)
+
+    # -- lookups -------------------------------------------------------------
+
+    def rows_named(self, name):
+        rows = self._name_index().get(name)
+        if rows is None:
+            return []
+        return rows if isinstance(rows, list) else [rows]
+
+    def is_duplicate(self, loc, name, tolerance=DUPLICATE_TOLERANCE):
+        """True if a marker with this name lies within ``tolerance`` degrees of loc."""
+        for row in self.rows_named(name):
+            if abs(self._lat[row] - loc[0]) < tolerance and abs(self._lon[row] - loc[1]) < tolerance:
+                return True
+        return False
+
+    def near(self, lat, lon, radius):
+        """Yield markers within ``radius`` degrees (per axis) of a point."""
+        grid = self._spatial_grid()
+        span = int(radius // GRID_CELL) + 1
+        cx, cy = int(math.floor(lat / GRID_CELL)), int(math.floor(lon / GRID_CELL))
+        for x in range(cx - span, cx + span + 1):
+            for y in range(cy - span, cy + span + 1):
+                for row in grid.get((x, y), ()):
+                    if (self._alive[row] and abs(self._lat[row] - lat) <= radius
+                            and abs(self._lon[row] - lon) <= radius):
+                        yield self._row(row)
+
+    def coordinates(self):
+        """Return (lat, lon) arrays of the live markers."""
+        self._compact()
+        return self._lat, self._lon
+
+    def altitudes(self):
+        """Altitude column of the live markers; NaN where unknown."""
+        self._compact()
+        return self._alt
+
+    def times(self):
+        """Epoch-seconds column of the live markers; NaN where unknown."""
+        self._compact()
+        return self._time
+
+    def names(self):
+        self._compact()
+        return self._names
+
+    def columns(self):
+        """Return the live markers as parallel columns for bulk export.
+
+        ``camera`` indexes into ``cameras`` (-1: no EXIF, -2: see ``extra``)
+        and ``place`` into ``places`` (-1: none); NaN marks a missing
+        altitude, time or exposure. ``raw_times`` and ``extra`` map positions
+        to the timestamps and exif_data the columns can't hold.
+        """
+        self._compact()
+        return {'lat': self._lat, 'lon': self._lon, 'alt': self._alt, 'time': self._time,
+                'name': self._names, 'camera': self._camera, 'exposure': self._exposure,
+                'cameras': self._cameras, 'raw_times': self._raw_times, 'extra': self._extra,
+                'place': self._place, 'places': self._places}
+
+    # -- removal / edits -----------------------------------------------------
+
+    def remove_name(self, name):
+        """Remove the first marker called ``name``; return True if one was removed."""
+        rows = self.rows_named(name)
+        if not rows:
+            return False
+        self.remove_rows([min(rows)])
+        return True
+
+    def remove_names(self, names):
+        """Bulk remove the first marker of each given name."""
+        rows = []
+        for name in names:
+            named = self.rows_named(name)
+            if named:
+                rows.append(min(named))
+        self.remove_rows(rows)
+
+    def remove_rows(self, rows):
+        rows = sorted(set(rows))
+        removed = []
+        dead_before = 0
+        previous = 0
+        for row in rows:
+            if self._alive[row]:
+                if self._observers:
+                    # Logical position at the time of removal, counting earlier removals in this batch.
+                    dead_before += self._alive.count(0, previous, row)
+                    previous = row
+                    removed.append((row - dead_before, self._row(row)))
+                self._unindex(row)
+                self._alive[row] = 0
+                self._dead += 1
+        self.version += 1
+        for position, marker in removed:
+            self._notify('remove', position, marker)
+        if self._dead > 1024 and self._dead * 2 > len(self._names):
+            self._compact()
+
+    def remove_positions(self, positions):
+        """Bulk remove markers by their index in the list."""
+        self._compact()
+        self.remove_rows(positions)
+
+    def rename(self, old_name, new_name):
+        """Rename the first marker called ``old_name``; return True on success."""
+        rows = self.rows_named(old_name)
+        if not rows:
+            return False
+        row = min(rows)
+        old = self._row(row) if self._observers else None
+        self._unindex(row)
+        self._names[row] = sys.intern(new_name)
+        self._index_row(row)
+        self.version += 1
+        if self._observers:
+            self._notify('set', self.position(row), old, self._row(row))
+        return True
+
+    def position(self, row):
+        """Logical index of a physical row."""
+        return row - self._alive.count(0, 0, row)
+
+    # -- internals ------------------------------------------------------------
+
+    def _write(self, row, marker):
+        loc, name, timestamp, altitude, exif_data = (tuple(marker) + (None, None, None))[:5]
+        epoch = parse_timestamp(timestamp)
+        camera, exposure, place, extra = self._split_exif(exif_data)
+        values = (float(loc[0]), float(loc[1]), _NAN if altitude is None else float(altitude),
+                  _NAN if epoch is None else epoch, sys.intern(str(name)), camera, exposure, place)
+        columns = (self._lat, self._lon, self._alt, self._time, self._names, self._camera, self._exposure,
+                   self._place)
+        if row == len(self._names):
+            for column, value in zip(columns, values):
+                column.append(value)
+            self._alive.append(1)
+        else:
+            for column, value in zip(columns, values):
+                column[row] = value
+        self._raw_times.pop(row, None)
+        self._extra.pop(row, None)
+        if timestamp is not None and epoch is None:
+            self._raw_times[row] = timestamp
+        if extra is not None:
+            self._extra[row] = extra
+
+    def _split_exif(self, exif_data):
+        """Map exif_data onto (camera id, exposure, place id, leftover dict)."""
+        place = -1
+        if isinstance(exif_data, dict) and all(isinstance(exif_data.get(key), str) for key in PLACE_KEYS):
+            label = tuple(sys.intern(exif_data[key]) for key in PLACE_KEYS)
+            place = self._place_ids.get(label)
+            if place is None:
+                place = self._place_ids[label] = len(self._places)
+                self._places.append(label)
+            exif_data = {key: value for key, value in exif_data.items() if key not in PLACE_KEYS} or None
+        camera, exposure, extra = self._split_camera(exif_data)
+        return camera, exposure, place, extra
+
+    def _split_camera(self, exif_data):
+        if exif_data is None:
+            return -1, _NAN, None
+        if isinstance(exif_data, dict) and set(exif_data) == {'CameraModel', 'Exposure'}:
+            model, exposure = exif_data['CameraModel'], exif_data['Exposure']
+            if exposure == 'N/A':
+                exposure = _NAN
+            if isinstance(model, str) and isinstance(exposure, float) and (
+                    exposure == exposure or exif_data['Exposure'] == 'N/A'):
+                camera = self._camera_ids.get(model)
+                if camera is None:
+                    camera = self._camera_ids[model] = len(self._cameras)
+                    self._cameras.append(sys.intern(model))
+                return camera, exposure, None
+        return -2, _NAN, exif_data
+
+    def _row(self, row):
+        alt = self._alt[row]
+        epoch = self._time[row]
+        timestamp = self._raw_times.get(row)
+        if timestamp is None and epoch == epoch:
+            timestamp = format_timestamp(epoch)
+        camera = self._camera[row]
+        if camera == -1:
+            exif_data = None
+        elif camera == -2:
+            exif_data = self._extra[row]
+        else:
+            exposure = self._exposure[row]
+            exif_data = {'CameraModel': self._cameras[camera], 'Exposure': 'N/A' if exposure != exposure else exposure}
+        place = self._place[row]
+        if place >= 0:
+            exif_data = dict(exif_data or {})
+            exif_data.update(zip(PLACE_KEYS, self._places[place]))
+        return ([self._lat[row], self._lon[row]], self._names[row], timestamp,
+                None if alt != alt else alt, exif_data)
+
+    def _name_index(self):
+        if self._index is None:
+            self._index = {}
+            for row in range(len(self._names)):
+                if self._alive[row]:
+                    self._index_name(row)
+        return self._index
+
+    def _index_row(self, row):
+        # The name index and the grid are each kept up to date only while built.
+        if self._index is not None:
+            self._index_name(row)
+        if self._grid is not None:
+            self._grid.setdefault(self._cell(row), []).append(row)
+
+    def _index_name(self, row):
+        name = self._names[row]
+        existing = self._index.get(name)
+        if existing is None:
+            self._index[name] = row
+        elif isinstance(existing, list):
+            existing.append(row)
+        else:
+            self._index[name] = [existing, row]
+
+    def _unindex(self, row):
+        name = self._names[row]
+        existing = self._index.get(name) if self._index is not None else None
+        if isinstance(existing, list):
+            existing.remove(row)
+            if len(existing) == 1:
+                self._index[name] = existing[0]
+        elif existing == row:
+            del self._index[name]
+        if self._grid is not None:
+            cell = self._grid.get(self._cell(row))
+            if cell and row in cell:
+                cell.remove(row)
+
+    def _cell(self, row):
+        return int(math.floor(self._lat[row] / GRID_CELL)), int(math.floor(self._lon[row] / GRID_CELL))
+
+    def _spatial_grid(self):
+        if self._grid is None:
+            self._compact()
+            grid = {}
+            for row in range(len(self._names)):
+                grid.setdefault(self._cell(row), []).append(row)
+            self._grid = grid
+        return self._grid
+
+    def _compact(self):
+        if not self._dead:
+            return
+        keep = [row for row in range(len(self._names)) if self._alive[row]]
+        remap = {old: new for new, old in enumerate(keep)}
+        for attr in self._COLUMNS:
+            column = getattr(self, attr)
+            setattr(self, attr, array(column.typecode, (column[row] for row in keep)))
+        self._names = [self._names[row] for row in keep]
+        self._raw_times = {remap[r]: v for r, v in self._raw_times.items() if r in remap}
+        self._extra = {remap[r]: v for r, v in self._extra.items() if r in remap}
+        self._alive = bytearray(b'\x01') * len(keep)
+        self._dead = 0
+        self._grid = None
+        self._index = None
@@ -0,0 +1,212 @@
+"""Popup thumbnails for local images.
+
+A thumbnail comes from the cheapest source available: the JPEG preview the
+camera embedded in the EXIF block, otherwise a DCT-scaled (draft mode)
+decode, and only for non-JPEG files a full decode. Results are kept in an
+SQLite cache keyed by a digest of the file's content, with a second table
+mapping each path's (size, mtime, inode) to that digest, so showing the same
+photos again costs one lookup each and no decoding.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from .cache import file_identity
+from .exif import read_thumbnail
+from .profiling import profiler
+
+THUMB_SIZE = 100
+THUMB_QUALITY = 75
+CACHE_FILE = 'thumb_cache.sqlite'
+MAX_BYTES = 256 * 1024 * 1024
+SAMPLE_SIZE = 64 * 1024
+POOL_THRESHOLD = 16  # fewer misses than this are rendered in-process
+
+
+def content_key(path, size=THUMB_SIZE):
+    """Digest of the file's size, first and last 64 KB, and the thumbnail size.
+
+    Reading two small samples instead of the whole file keeps this cheap;
+    together with the EXIF header at the start, they identify a photo.
+    """
+    digest = hashlib.sha1(f"{size}:".encode())
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        length = f.tell()
+        digest.update(str(length).encode())
+        f.seek(0)
+        digest.update(f.read(SAMPLE_SIZE))
+        if length > SAMPLE_SIZE:
+            f.seek(max(SAMPLE_SIZE, length - SAMPLE_SIZE))
+            digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+@profiler.timed('thumbnails.make')
+def make_thumbnail(path, size=THUMB_SIZE):
+    """Return JPEG bytes of a thumbnail at most ``size`` px on each side, or None."""
+    try:
+        embedded = read_thumbnail(path)
+    except OSError:
+        embedded = None
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(embedded) if embedded else path) as img:
+            if img.format == 'JPEG':
+                img.draft('RGB', (size, size))  # let libjpeg decode at 1/2, 1/4 or 1/8 scale
+            img.thumbnail((size, size))
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            buffer = BytesIO()
+            img.save(buffer, format='JPEG', quality=THUMB_QUALITY)
+            return buffer.getvalue()
+    except Exception:
+        return None
+
+
+class ThumbnailCache:
+    """SQLite store of thumbnail bytes, evicted least-recently-used past ``max_bytes``."""
+
+    def __init__(self, path=CACHE_FILE, max_bytes=MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        try:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS thumbs (
+                key TEXT PRIMARY KEY,
+                data BLOB,
+                size INTEGER,
+                last_used REAL)""")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS paths (
+                path TEXT PRIMARY KEY,
+                identity TEXT,
+                key TEXT)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS thumbs_last_used ON thumbs (last_used)")
+            self._bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM thumbs").fetchone()[0]
+        except sqlite3.Error:
+            self.db = None
+            self._bytes = 0
+
+    def get_many(self, paths):
+        """Return {path: bytes} for the paths whose cached thumbnail is still current."""
+        found = {}
+        if self.db is None:
+            return found
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                row = self.db.execute(
+                    "SELECT p.identity, t.data, t.key FROM paths p JOIN thumbs t ON t.key = p.key "
+                    "WHERE p.path = ?", (os.path.abspath(path),)).fetchone()
+                try:
+                    current = row is not None and row[0] == file_identity(path)
+                except OSError:
+                    current = False
+                if current:
+                    found[path] = row[1]
+                    self.db.execute("UPDATE thumbs SET last_used = ? WHERE key = ?", (now, row[2]))
+            self.hits += len(found)
+            self.misses += len(paths) - len(found)
+            self.db.commit()
+        return found
+
+    def get_key(self, key):
+        """Thumbnail bytes stored under a content key (a copy of a known photo), or None."""
+        if self.db is None:
+            return None
+        with self._lock:
+            row = self.db.execute("SELECT data FROM thumbs WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, entries):
+        """Store ``(path, identity, key, data)`` tuples and enforce the size cap."""
+        if self.db is None or not entries:
+            return
+        now = time.time()
+        with self._lock:
+            for path, identity, key, data in entries:
+                self.db.execute("INSERT OR REPLACE INTO paths VALUES (?, ?, ?)",
+                                (os.path.abspath(path), identity, key))
+                if self.db.execute("SELECT 1 FROM thumbs WHERE key = ?", (key,)).fetchone() is None:
+                    self.db.execute("INSERT INTO thumbs VALUES (?, ?, ?, ?)", (key, data, len(data), now))
+                    self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict_locked()
+            self.db.commit()
+
+    def _evict_locked(self):
+        target = self.max_bytes * 0.9  # leave some room so the next put doesn't evict again
+        rows = self.db.execute("SELECT key, size FROM thumbs ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            doomed.append((key,))
+            self._bytes -= size
+        self.db.executemany("DELETE FROM thumbs WHERE key = ?", doomed)
+        self.db.execute("DELETE FROM paths WHERE key NOT IN (SELECT key FROM thumbs)")
+
+    def summary(self):
+        return f"Thumbnails: {self.hits} cached, {self.misses} new"
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class Thumbnailer:
+    """Looks thumbnails up in the cache and renders the misses on a process pool."""
+
+    def __init__(self, cache=None, size=THUMB_SIZE, jobs=None):
+        self.cache = cache
+        self.size = size
+        self.jobs = jobs or os.cpu_count() or 1
+
+    @profiler.timed('thumbnails.batch')
+    def thumbnails(self, paths):
+        """Return {path: JPEG bytes} for every path that could be thumbnailed."""
+        paths = list(dict.fromkeys(paths))
+        found = self.cache.get_many(paths) if self.cache is not None else {}
+        stored, pending = [], []
+        for path in paths:
+            if path in found:
+                continue
+            try:
+                identity, key = file_identity(path), content_key(path, self.size)
+            except OSError:
+                continue
+            known = self.cache.get_key(key) if self.cache is not None else None
+            if known is not None:  # same photo under another path
+                found[path] = known
+                stored.append((path, identity, key, known))
+            else:
+                pending.append((path, identity, key))
+
+        for (path, identity, key), data in zip(pending, self._render([entry[0] for entry in pending])):
+            if data is not None:
+                found[path] = data
+                stored.append((path, identity, key, data))
+        if self.cache is not None:
+            self.cache.put_many(stored)
+        return found
+
+    def _render(self, paths):
+        if len(paths) < POOL_THRESHOLD or self.jobs == 1:
+            return [make_thumbnail(path, self.size) for path in paths]
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(paths))) as executor:
+            chunksize = max(1, len(paths) // (self.jobs * 4))
+            return list(executor.map(make_thumbnail, paths, [self.size] * len(paths), chunksize=chunksize))
+
+    def summary(self):
+        return self.cache.summary() if self.cache is not None else ""
@@ -0,0 +1,533 @@
+"""Watch a folder for new, changed and deleted images.
+
+A FileIndex keeps the size and mtime of every image a watch has seen in
+SQLite, so a watch started again only reports what changed while it
+wasn't running. FolderWatcher finds changes with inotify on Linux and by
+polling folder mtimes elsewhere, or when inotify runs out of watches. A
+folder's mtime moves whenever a file in it is added, removed or renamed,
+so polling a quiet tree costs one stat per folder and only folders that
+moved are listed again. Files rewritten in place don't move their folder;
+inotify still sees them, and polling catches them in a full sweep every
+VERIFY_INTERVAL seconds.
+
+Bursts of changes are debounced, and a file modified in the last SETTLE
+seconds is left for a later round so half-copied images aren't read.
+"""
+import ctypes
+import os
+import select
+import sqlite3
+import stat
+import struct
+import sys
+import threading
+import time
+
+from .extract import IMAGE_EXTENSIONS
+from .scanner import SYMLINK_POLICIES, _matches
+
+WATCH_INDEX = 'watch_index.sqlite'
+BACKENDS = ('auto', 'inotify', 'poll')
+DEBOUNCE = 0.5  # seconds without new events before a burst is handled
+MAX_DELAY = 5.0  # a steady stream of events is still handled this often
+SETTLE = 2.0  # files modified more recently than this are read later
+POLL_INTERVAL = 2.0
+VERIFY_INTERVAL = 3600.0  # full sweep when polling; None never sweeps
+
+# inotify(7)
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK)
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+class FileIndex:
+    """The images watches have seen: path, folder, size, mtime and whether it had GPS data.
+
+    ``located`` is None until the image has been extracted, then 1 or 0.
+    If the file can't be opened the index lives in memory for the session.
+    """
+
+    def __init__(self, path=WATCH_INDEX):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        try:
+            self.db = self._connect(self.path)
+        except sqlite3.Error:
+            self.db = self._connect(':memory:')
+
+    @staticmethod
+    def _connect(path):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            folder TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            located INTEGER)""")
+        db.execute("CREATE INDEX IF NOT EXISTS files_folder ON files (folder)")
+        return db
+
+    def get(self, path):
+        """``(size, mtime_ns)`` of a seen file, or None."""
+        with self._lock:
+            row = self.db.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        return tuple(row) if row else None
+
+    def folder(self, folder):
+        """``{path: (size, mtime_ns)}`` of the files seen directly in a folder."""
+        with self._lock:
+            rows = self.db.execute("SELECT path, size, mtime_ns FROM files WHERE folder = ?", (folder,)).fetchall()
+        return {path: (size, mtime_ns) for path, size, mtime_ns in rows}
+
+    def folders(self, root):
+        """Every folder at or under ``root`` that holds a seen file."""
+        with self._lock:
+            rows = self.db.execute("SELECT DISTINCT folder FROM files WHERE folder = ? OR (folder >= ? AND folder < ?)",
+                                   (root,) + _subtree(root)).fetchall()
+        return [row[0] for row in rows]
+
+    def pending(self, root):
+        """Paths under ``root`` that had GPS data or were never extracted."""
+        with self._lock:
+            rows = self.db.execute("SELECT path FROM files WHERE (folder = ? OR (folder >= ? AND folder < ?))"
+                                   " AND (located IS NULL OR located = 1)", (root,) + _subtree(root)).fetchall()
+        return [row[0] for row in rows]
+
+    def update(self, seen=(), gone=()):
+        """Record ``(path, folder, size, mtime_ns)`` of new or changed files and forget gone paths."""
+        with self._lock:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, NULL)", seen)
+            self.db.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in gone))
+            self.db.commit()
+
+    def set_located(self, results):
+        """Record ``(path, located)`` once files have been extracted."""
+        with self._lock:
+            self.db.executemany("UPDATE files SET located = ? WHERE path = ?",
+                                ((int(bool(located)), path) for path, located in results))
+            self.db.commit()
+
+    def close(self):
+        with self._lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+def _subtree(folder):
+    """Bounds of the paths strictly inside ``folder`` in sort order."""
+    prefix = folder.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+class Changes:
+    """Paths of the images added, changed and removed since the last report."""
+
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.seen = []  # (path, folder, size, mtime_ns) for the index
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+    def __repr__(self):
+        return f"Changes({len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed)"
+
+
+class Inotify:
+    """A Linux inotify instance watching folders, read through ctypes."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.folders = {}  # wd -> folder
+        self.wds = {}  # folder -> wd
+
+    @staticmethod
+    def available():
+        return sys.platform.startswith('linux')
+
+    def add(self, folder):
+        wd = self._add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), folder)
+        self.folders[wd] = folder
+        self.wds[folder] = wd
+
+    def remove(self, folder):
+        wd = self.wds.pop(folder, None)
+        if wd is not None and self.folders.get(wd) == folder:
+            del self.folders[wd]
+            self._rm_watch(self.fd, wd)
+
+    def read(self):
+        """Yield ``(folder, name, mask)`` for every queued event; folder is None after an overflow."""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_IGNORED:
+                    folder = self.folders.pop(wd, None)
+                    if self.wds.get(folder) == wd:
+                        del self.wds[folder]
+                elif mask & IN_Q_OVERFLOW:
+                    yield None, '', mask
+                elif wd in self.folders:  # not a folder removed while its events were queued
+                    yield self.folders[wd], name, mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Reports changes to the images under a folder; see the module docstring.
+
+    The filters are scan_images' (``include``/``exclude`` globs, ``max_depth``
+    and the ``symlinks`` policy). ``backend`` is 'inotify', 'poll' or 'auto'
+    (inotify where there is one); ``backend`` tells which one is in use.
+    """
+
+    def __init__(self, root, index, extensions=IMAGE_EXTENSIONS, include=None, exclude=None,
+                 max_depth=None, symlinks='files', backend='auto', poll_interval=POLL_INTERVAL,
+                 verify_interval=VERIFY_INTERVAL, debounce=DEBOUNCE, settle=SETTLE):
+        if symlinks not in SYMLINK_POLICIES:
+            raise ValueError(f"symlinks must be one of {', '.join(SYMLINK_POLICIES)}")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {', '.join(BACKENDS)}")
+        self.root = os.path.abspath(root)
+        self.index = index
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.max_depth = max_depth
+        self.symlinks = symlinks
+        self.backend = backend
+        self.fallback = None  # why inotify isn't used, when it was wanted
+        self.poll_interval = poll_interval
+        self.verify_interval = verify_interval
+        self.debounce = debounce
+        self.settle = settle
+        self.folders = {}  # folder -> (mtime_ns or None to list it again, set of subfolders)
+        self._real = {}  # realpath -> folder, to enter each linked folder once
+        self._dirty_folders = set()
+        self._dirty_files = set()
+        self._sweep_due = False
+        self._first_event = self._last_event = None
+        self._retry_at = None  # when files left to settle are looked at again
+        self._inotify = None
+        self._stopped = threading.Event()
+        self._wake = None
+
+    def stop(self):
+        """End changes() from any thread."""
+        self._stopped.set()
+        if self._wake is not None:
+            try:
+                os.write(self._wake[1], b'\0')
+            except OSError:
+                pass
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def changes(self):
+        """Yield Changes: first what differs from the index, then each burst of changes, until stop()."""
+        self._start_backend()
+        try:
+            changes = Changes()
+            self._sweep(changes)
+            self._record(changes)
+            yield changes
+            next_sweep = self._next_sweep()
+            while not self._stopped.is_set():
+                if self._inotify is not None:
+                    self._wait_for_events()
+                else:
+                    self._stopped.wait(self._poll_timeout())
+                    if self._stopped.is_set():
+                        break
+                    self._poll_folders()
+                    if next_sweep is None:  # inotify gave out part way
+                        next_sweep = self._next_sweep()
+                    elif time.monotonic() >= next_sweep:
+                        self._sweep_due = True
+                        next_sweep = self._next_sweep()
+                if self._stopped.is_set() or not self._due():
+                    continue
+                changes = self._flush()
+                if len(changes):
+                    yield changes
+        finally:
+            self._close_backend()
+
+    # -- backends -------------------------------------------------------------
+
+    def _start_backend(self):
+        if self.backend in ('auto', 'inotify'):
+            if Inotify.available():
+                try:
+                    self._inotify = Inotify()
+                    self._wake = os.pipe()
+                    self.backend = 'inotify'
+                    return
+                except (OSError, AttributeError) as e:
+                    self.fallback = f"inotify unavailable: {e}"
+            else:
+                self.fallback = "inotify needs Linux"
+        self.backend = 'poll'
+
+    def _fall_back(self, reason):
+        """Switch to polling, e.g. when the inotify watch limit is reached."""
+        self._close_backend()
+        self.backend = 'poll'
+        self.fallback = reason
+
+    def _close_backend(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        if self._wake is not None:
+            for fd in self._wake:
+                os.close(fd)
+            self._wake = None
+
+    def _next_sweep(self):
+        if self._inotify is not None or self.verify_interval is None:
+            return None
+        return time.monotonic() + self.verify_interval
+
+    def _poll_timeout(self):
+        if self._retry_at is not None:
+            return max(0.0, min(self.poll_interval, self._retry_at - time.monotonic()))
+        return self.poll_interval
+
+    def _wait_for_events(self):
+        timeout = self._timeout()
+        ready, _, _ = select.select([self._inotify.fd, self._wake[0]], [], [], timeout)
+        if self._inotify.fd in ready:
+            now = time.monotonic()
+            for folder, name, mask in self._inotify.read():
+                self._on_event(folder, name, mask)
+            if self._dirty_folders or self._dirty_files or self._sweep_due:
+                self._last_event = now
+                if self._first_event is None:
+                    self._first_event = now
+
+    def _timeout(self):
+        """Seconds until pending changes are due, or None to wait for the next event."""
+        now = time.monotonic()
+        due = []
+        if self._first_event is not None:
+            due.append(min(self._last_event + self.debounce, self._first_event + MAX_DELAY))
+        if self._retry_at is not None:
+            due.append(self._retry_at)
+        return max(0.0, min(due) - now) if due else None
+
+    def _on_event(self, folder, name, mask):
+        if mask & IN_Q_OVERFLOW:
+            self._sweep_due = True  # events were lost
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self._dirty_folders.add(os.path.dirname(folder) if folder != self.root else folder)
+        elif mask & IN_ISDIR:
+            self._dirty_folders.add(folder)  # a subfolder came or went
+        elif name.lower().endswith(self.extensions):
+            self._dirty_files.add(os.path.join(folder, name))
+
+    def _poll_folders(self):
+        for folder, (mtime, _) in list(self.folders.items()):
+            try:
+                current = os.stat(folder).st_mtime_ns
+            except OSError:
+                current = None
+            if current is None or current != mtime:
+                self._dirty_folders.add(folder)
+
+    def _due(self):
+        now = time.monotonic()
+        if self._retry_at is not None and now >= self._retry_at:
+            return True
+        if self._inotify is None:
+            return bool(self._dirty_folders or self._dirty_files or self._sweep_due)
+        return self._first_event is not None and (now - self._last_event >= self.debounce
+                                                  or now - self._first_event >= MAX_DELAY)
+
+    # -- listing ----------------------------------------------------------------
+
+    def _flush(self):
+        """Bring the index up to date with the dirty folders and files."""
+        changes = Changes()
+        folders, self._dirty_folders = self._dirty_folders, set()
+        files, self._dirty_files = self._dirty_files, set()
+        self._first_event = self._last_event = self._retry_at = None
+        if self._sweep_due:
+            self._sweep_due = False
+            self._sweep(changes)
+        else:
+            for folder in sorted(folders):
+                if folder in self.folders or folder == self.root:
+                    self._sync_folders([folder], changes)
+            for path in sorted(files):
+                if os.path.dirname(path) not in folders:
+                    self._sync_file(path, changes)
+        self._record(changes)
+        return changes
+
+    def _record(self, changes):
+        changes.removed = list(dict.fromkeys(changes.removed))
+        if changes.seen or changes.removed:
+            self.index.update(changes.seen, changes.removed)
+
+    def _sweep(self, changes):
+        """List the whole tree and report everything that differs from the index."""
+        visited = self._sync_folders([self.root], changes, everything=True)
+        for folder in self.index.folders(self.root):
+            if folder not in visited:
+                changes.removed.extend(self.index.folder(folder))
+
+    def _sync_folders(self, folders, changes, everything=False):
+        """List folders again; new subfolders are listed too, and all of them when ``everything``."""
+        visited = set()
+        stack = list(folders)
+        while stack:
+            folder = stack.pop()
+            visited.add(folder)
+            listing = self._list(folder)
+            old_subfolders = self.folders.get(folder, (None, set()))[1]
+            if listing is None:
+                self._forget(folder, changes)
+                continue
+            mtime, files, subfolders = listing
+            for gone in old_subfolders - subfolders:
+                self._forget(gone, changes)
+            for subfolder in subfolders:
+                if everything or subfolder not in self.folders:
+                    stack.append(subfolder)
+            self.folders[folder] = (mtime if not self._settling(mtime) else None, subfolders)
+            known = self.index.folder(folder)
+            for path, size_mtime in files.items():
+                old = known.pop(path, None)
+                if old != size_mtime:
+                    self._changed(path, folder, size_mtime, old is not None, changes)
+            changes.removed.extend(known)
+        return visited
+
+    def _sync_file(self, path, changes):
+        folder = os.path.dirname(path)
+        rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if folder not in self.folders or not self._wanted(rel, os.path.basename(path), file=True):
+            return
+        old = self.index.get(path)
+        try:
+            st = None if self.symlinks == 'skip' and os.path.islink(path) else os.stat(path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            if old is not None:
+                changes.removed.append(path)
+        elif old != (st.st_size, st.st_mtime_ns):
+            self._changed(path, folder, (st.st_size, st.st_mtime_ns), old is not None, changes)
+
+    def _changed(self, path, folder, size_mtime, known, changes):
+        if self._settling(size_mtime[1]):
+            self._dirty_files.add(path)
+            self._retry_at = min(self._retry_at or float('inf'), time.monotonic() + self.settle)
+            return
+        changes.seen.append((path, folder) + size_mtime)
+        (changes.changed if known else changes.added).append(path)
+
+    def _settling(self, mtime_ns):
+        return abs(time.time_ns() - mtime_ns) < self.settle * 1e9
+
+    def _forget(self, folder, changes):
+        """Drop a folder that is gone (or now excluded) and everything seen under it."""
+        _, subfolders = self.folders.pop(folder, (None, set()))
+        for subfolder in subfolders:
+            self._forget(subfolder, changes)
+        changes.removed.extend(self.index.folder(folder))
+        if self._real:
+            for real, known in list(self._real.items()):
+                if known == folder:
+                    del self._real[real]
+        if self._inotify is not None:
+            self._inotify.remove(folder)
+
+    def _list(self, folder):
+        """``(mtime_ns, {path: (size, mtime_ns)}, subfolders)`` of a folder, or None if it is gone."""
+        rel = '' if folder == self.root else os.path.relpath(folder, self.root).replace(os.sep, '/')
+        depth = rel.count('/') + 1 if rel else 0
+        if folder not in self.folders:
+            if self.symlinks == 'follow':
+                real = os.path.realpath(folder)
+                if self._real.setdefault(real, folder) != folder:
+                    return None  # a link back into the tree
+            if self._inotify is not None:
+                try:
+                    self._inotify.add(folder)  # before listing, so nothing lands unseen in between
+                except OSError as e:
+                    if not os.path.isdir(folder):
+                        return None
+                    self._fall_back(f"inotify: {e.strerror}; polling instead")
+        files = {}
+        subfolders = set()
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as it:
+                entries = list(it)
+        except OSError:
+            return None
+        for entry in entries:
+            entry_rel = f"{rel}/{entry.name}" if rel else entry.name
+            try:
+                if entry.is_symlink() and self.symlinks == 'skip':
+                    continue
+                if entry.is_dir(follow_symlinks=self.symlinks == 'follow'):
+                    if self._wanted(entry_rel, entry.name) and (self.max_depth is None or depth < self.max_depth):
+                        subfolders.add(entry.path)
+                elif self._wanted(entry_rel, entry.name, file=True) and entry.is_file():
+                    st = entry.stat()
+                    files[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        return mtime, files, subfolders
+
+    def _wanted(self, rel, name, file=False):
+        if self.exclude and _matches(rel, name, self.exclude):
+            return False
+        if not file:
+            return True
+        if not name.lower().endswith(self.extensions):
+            return False
+        return not self.include or _matches(rel, name, self.include)
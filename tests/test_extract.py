@@ -0,0 +1,40 @@
+import itertools
+import threading
+import time
+
+from exifmapper.extract import ExtractionPool
+
+
+class SlowExtractor:
+    """Stands in for Extractor: each image takes a moment, and the stop event it is given is recorded."""
+
+    def __init__(self):
+        self.stops = []
+
+    def get_loc(self, file_or_url, from_file=True, stop=None):
+        self.stops.append(stop)
+        time.sleep(0.01)
+        return [1.0, 2.0], None, None, None
+
+
+def test_cancel_from_another_thread_while_submitting():
+    extractor = SlowExtractor()
+    pool = ExtractionPool(extractor, jobs=4)
+    inputs = (f"img{i}.jpg" for i in itertools.count())
+    results = []
+    for item, result, error in pool.run(inputs):
+        assert error is None
+        results.append(item)
+        if len(results) == 5:
+            threading.Thread(target=pool.cancel).start()
+    assert pool.cancelled
+    assert len(results) >= 5
+
+
+def test_each_pool_has_its_own_stop_event():
+    extractor = SlowExtractor()
+    first, second = ExtractionPool(extractor, jobs=2), ExtractionPool(extractor, jobs=2)
+    first.cancel()
+    assert list(first.run(["a.jpg"])) == []
+    assert sorted(item for item, _, _ in second.run(["a.jpg", "b.jpg"])) == ["a.jpg", "b.jpg"]
+    assert extractor.stops and all(stop is second._cancelled and not stop.is_set() for stop in extractor.stops)
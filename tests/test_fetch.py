@@ -0,0 +1,136 @@
+import re
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from exifmapper.exif import read_exif
+from exifmapper.extract import Extractor
+from exifmapper.fetch import FetchStats, RANGE_SIZE, fetch_exif, not_modified
+
+ETAG = '"v1"'
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+def jpeg(app1_size, scan_size=1024 * 1024):
+    """A JPEG whose APP1 segment, padded to about ``app1_size`` bytes, places it at 48.5 N 2.25 E."""
+    def entry(tag, kind, count, value):
+        return struct.pack('>HHI', tag, kind, count) + value
+
+    # IFD0 at 8 (1 entry), the GPS IFD at 26 (4 entries), values from 80.
+    ifd0 = struct.pack('>H', 1) + entry(0x8825, 4, 1, struct.pack('>I', 26)) + b'\0\0\0\0'
+    gps = (struct.pack('>H', 4)
+           + entry(1, 2, 2, b'N\0\0\0') + entry(2, 5, 3, struct.pack('>I', 80))
+           + entry(3, 2, 2, b'E\0\0\0') + entry(4, 5, 3, struct.pack('>I', 104)) + b'\0\0\0\0')
+    values = struct.pack('>6I', 48, 1, 30, 1, 0, 1) + struct.pack('>6I', 2, 1, 15, 1, 0, 1)
+    tiff = b'MM\0*' + struct.pack('>I', 8) + ifd0 + gps + values
+    payload = b'Exif\0\0' + tiff.ljust(app1_size - 10, b'\0')
+    app0 = b'\xff\xe0' + struct.pack('>H', 2000) + b'\0' * 1998
+    app1 = b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+    return b'\xff\xd8' + app0 + app1 + b'\xff\xda' + b'\x55' * scan_size + b'\xff\xd9'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # the client hung up once it had the header
+
+    def do_GET(self):
+        server = self.server
+        body = server.images[self.path.split('/')[2]]
+        with server.lock:
+            server.ranges.append(self.headers.get('Range'))
+        if self.headers.get('If-None-Match') == ETAG:
+            return self.reply(304, b'')
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if self.path.startswith('/ranged/') and match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(body) - 1), len(body) - 1)
+            return self.reply(206, body[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+        self.reply(200, body)
+
+    def reply(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in {'ETag': ETAG, 'Last-Modified': LAST_MODIFIED, **dict(headers)}.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.ranges = []
+    server.images = {'short.jpg': jpeg(1000), 'long.jpg': jpeg(65000)}
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/'
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def session():
+    with requests.Session() as session:
+        yield session
+
+
+def location(data):
+    return Extractor().extract_location(read_exif(data))[0]
+
+
+def test_short_header_takes_one_range(server, session):
+    stats = FetchStats()
+    data, validators = fetch_exif(server.url + 'ranged/short.jpg', session, stats=stats)
+    assert len(data) == RANGE_SIZE
+    assert location(data) == [48.5, 2.25]
+    assert server.ranges == [f'bytes=0-{RANGE_SIZE - 1}']
+    assert (stats.requests, stats.full_downloads) == (1, 0)
+    assert stats.bytes_saved == len(server.images['short.jpg']) - RANGE_SIZE
+
+
+def test_range_grows_when_the_header_runs_past_it(server, session):
+    image = server.images['long.jpg']
+    stats = FetchStats()
+    data, validators = fetch_exif(server.url + 'ranged/long.jpg', session, stats=stats)
+    assert data == image[:2 * RANGE_SIZE]
+    assert location(data) == [48.5, 2.25]
+    assert server.ranges == [f'bytes=0-{RANGE_SIZE - 1}', f'bytes={RANGE_SIZE}-{2 * RANGE_SIZE - 1}']
+    assert (stats.files, stats.requests, stats.full_downloads) == (1, 2, 0)
+    assert stats.bytes_downloaded == 2 * RANGE_SIZE
+    assert stats.bytes_total == len(image)
+    assert stats.bytes_saved == len(image) - 2 * RANGE_SIZE
+
+
+def test_server_ignoring_range_is_streamed_until_the_header_is_in(server, session):
+    image = server.images['long.jpg']
+    stats = FetchStats()
+    data, validators = fetch_exif(server.url + 'plain/long.jpg', session, stats=stats)
+    assert 67000 < len(data) < 2 * RANGE_SIZE  # a few chunks past the APP1 segment, not the whole megabyte
+    assert data == image[:len(data)]
+    assert location(data) == [48.5, 2.25]
+    assert (stats.requests, stats.full_downloads) == (1, 0)
+    assert stats.bytes_total == len(image)
+    assert stats.bytes_saved == len(image) - len(data)
+
+
+@pytest.mark.parametrize('path', ['ranged/long.jpg', 'plain/long.jpg'])
+def test_validators_are_returned(server, session, path):
+    data, validators = fetch_exif(server.url + path, session)
+    assert validators == {'etag': ETAG, 'last_modified': LAST_MODIFIED}
+    assert not_modified(server.url + path, validators, session)
+    assert not not_modified(server.url + path, {'etag': '"v0"'}, session)
@@ -0,0 +1,62 @@
+import math
+import random
+from array import array
+
+import pytest
+
+from exifmapper import gazetteer
+from exifmapper.gazetteer import EARTH_RADIUS_KM, Gazetteer
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+@pytest.fixture
+def places(tmp_path):
+    rng = random.Random(7)
+    points = []
+    for _ in range(2000):
+        band = rng.random()
+        if band < 0.5:
+            lat = rng.uniform(60, 90) * rng.choice((1, -1))  # where a degree of longitude is short
+        elif band < 0.6:
+            lat = rng.uniform(-60, 60)
+        else:
+            lat = rng.uniform(-89.9, 89.9)
+        lon = rng.uniform(-180, 180)
+        if rng.random() < 0.1:
+            lon = rng.choice((1, -1)) * rng.uniform(178, 180)  # around the antimeridian
+        points.append((lat, lon))
+    path = tmp_path / 'cities500.txt'
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, (lat, lon) in enumerate(points):
+            f.write('\t'.join([str(i), f'P{i}', '', '', repr(lat), repr(lon), 'P', 'PPL', 'XX', '', '01']) + '\n')
+    # Compare against the coordinates as stored, in float32.
+    stored = [(a, b) for a, b in zip(array('f', (p[0] for p in points)), array('f', (p[1] for p in points)))]
+    return path, stored
+
+
+def brute_force(stored, lat, lon, max_km):
+    distance, index = min((haversine_km(lat, lon, a, b), i) for i, (a, b) in enumerate(stored))
+    return f'P{index}' if distance <= max_km else None
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+@pytest.mark.parametrize('max_km', [100.0, 400.0])
+def test_lookup_matches_brute_force(places, monkeypatch, numpy, max_km):
+    if numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(gazetteer, 'np', None)
+    path, stored = places
+    rng = random.Random(11)
+    queries = [(rng.uniform(55, 90) * rng.choice((1, -1)), rng.uniform(-180, 180)) for _ in range(200)]
+    queries += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(60)]
+    queries += [(89.99, 0.0), (-90.0, 123.0), (70.0, 179.99), (70.0, -180.0), (0.0, 180.0)]
+    found = Gazetteer(path, max_km=max_km).lookup([q[0] for q in queries], [q[1] for q in queries])
+    expected = [brute_force(stored, lat, lon, max_km) for lat, lon in queries]
+    assert [place[0] if place else None for place in found] == expected
@@ -0,0 +1,122 @@
+import collections
+import threading
+import time
+
+import pytest
+
+from exifmapper.geocode import MISS, GeocodeCache, Geocoder, RateLimiter, normalize
+
+
+class FakeBackend:
+    """Answers every address but ones containing 'nowhere', counting the lookups."""
+
+    name = 'fake'
+    max_workers = 4
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+
+    def geocode(self, query):
+        with self._lock:
+            self.calls[query] += 1
+        time.sleep(self.delay)
+        if 'nowhere' in query:
+            return None
+        return float(len(query)), 0.0, query.title()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = GeocodeCache(tmp_path / 'geocode.sqlite')
+    yield cache
+    cache.close()
+
+
+def test_repeated_addresses_are_looked_up_once():
+    backend = FakeBackend()
+    queries = ['1 Main St', '1  main st', '1 MAIN ST ', '2 Side Rd', 'nowhere', 'Nowhere']
+    results = list(Geocoder(backend).run(queries))
+    assert sorted(query for query, _, _ in results) == sorted(queries)
+    assert sorted(backend.calls) == ['1 main st', '2 side rd', 'nowhere']
+    assert set(backend.calls.values()) == {1}
+    answers = {query: answer for query, answer, _ in results}
+    assert answers['1 MAIN ST '] == answers['1 Main St'] == (9.0, 0.0, '1 Main St')
+    assert answers['Nowhere'] is None
+
+
+def test_answers_come_from_the_cache(cache):
+    backend = FakeBackend()
+    first = list(Geocoder(backend, cache).run(['1 Main St', 'nowhere']))
+    second = list(Geocoder(backend, cache).run(['1 main st', 'NOWHERE']))
+    assert [answer for _, answer, _ in second] == [answer for _, answer, _ in first]
+    assert sum(backend.calls.values()) == 2
+    assert cache.hits == 2
+    assert Geocoder(backend, cache).geocode('1 Main St') == (9.0, 0.0, '1 Main St')
+    assert sum(backend.calls.values()) == 2
+
+
+def test_not_found_answers_expire(cache):
+    backend = FakeBackend()
+    geocoder = Geocoder(backend, cache)
+    assert geocoder.geocode('nowhere') is None
+    assert geocoder.geocode('nowhere') is None
+    assert backend.calls['nowhere'] == 1
+    cache.db.execute("UPDATE answers SET created = created - ?", (cache.negative_ttl + 1,))
+    assert cache.get('fake', normalize('nowhere')) is MISS
+    assert geocoder.geocode('nowhere') is None
+    assert backend.calls['nowhere'] == 2
+    # Found addresses don't expire.
+    geocoder.geocode('1 Main St')
+    cache.db.execute("UPDATE answers SET created = created - ?", (cache.negative_ttl + 1,))
+    assert cache.get('fake', normalize('1 Main St')) == (9.0, 0.0, '1 Main St')
+
+
+def test_rate_limiter_spaces_calls_across_threads():
+    limiter = RateLimiter(rate=20)
+    times = []
+    lock = threading.Lock()
+
+    def call():
+        limiter.acquire()
+        with lock:
+            times.append(time.monotonic())
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    times.sort()
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.05 - 0.01
+    assert times[-1] - times[0] >= 5 * 0.05 - 0.01
+
+
+def test_rate_limiter_defer_holds_callers_back():
+    limiter = RateLimiter(rate=1000)
+    limiter.defer(0.2)
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.15
+
+
+def test_import_resumes_after_cancel(cache):
+    backend = FakeBackend(delay=0.01)
+    queries = [f"{i} Main St" for i in range(60)]
+    geocoder = Geocoder(backend, cache)
+    answered = []
+    for query, answer, error in geocoder.run(queries):
+        assert error is None
+        answered.append(query)
+        if len(answered) == 10:
+            geocoder.cancel()
+    assert geocoder.cancelled
+    assert 10 <= len(answered) < len(queries)
+
+    results = list(geocoder.run(queries))
+    assert not geocoder.cancelled
+    assert sorted(query for query, _, _ in results) == sorted(queries)
+    assert all(backend.calls[normalize(query)] == 1 for query in answered)
+    assert set(backend.calls) == {normalize(query) for query in queries}
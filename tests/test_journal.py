@@ -0,0 +1,172 @@
+import time
+
+import pytest
+
+from exifmapper.journal import UndoJournal
+from exifmapper.store import MarkerStore
+
+
+def marker(i, name=None):
+    return ([float(i), float(-i)], name or f"img{i:03d}.jpg", f"2024:01:01 00:{i % 60:02d}:00", None,
+            {'Lens': i} if i % 3 == 0 else None)
+
+
+@pytest.fixture
+def store():
+    return MarkerStore([marker(i) for i in range(30)])
+
+
+def round_trip(store, journal, action):
+    """Run action as one undo step; check undo and redo get back to each side of it."""
+    before = list(store)
+    with journal.record("Action"):
+        action()
+    after = list(store)
+    assert journal.undo() is not None
+    assert list(store) == before
+    assert journal.redo() is not None
+    assert list(store) == after
+    assert journal.undo() is not None
+    assert list(store) == before
+    journal.redo()
+    return after
+
+
+def test_add(store):
+    journal = UndoJournal(store)
+    round_trip(store, journal, lambda: store.extend([marker(100), marker(101)]))
+    round_trip(store, journal, lambda: store.append(marker(102)))
+
+
+@pytest.mark.parametrize('rows', [[0], [5, 6, 7], [1, 4, 5, 6, 20, 29], list(range(0, 30, 2)), list(range(30))])
+def test_remove(store, rows):
+    journal = UndoJournal(store)
+    after = round_trip(store, journal, lambda: store.remove_rows(rows))
+    assert len(after) == 30 - len(rows)
+
+
+def test_removals_in_any_order(store):
+    journal = UndoJournal(store)
+
+    def remove():
+        for position in (20, 3, 3, 10, 0, 22, 21):
+            del store[position]
+
+    round_trip(store, journal, remove)
+
+
+def test_set_and_rename(store):
+    journal = UndoJournal(store)
+
+    def edit():
+        store[4] = marker(4, "renamed.jpg")
+        store.rename("img010.jpg", "other.jpg")
+
+    round_trip(store, journal, edit)
+
+
+def test_insert(store):
+    journal = UndoJournal(store)
+
+    def insert():
+        for position in (0, 5, 5, 2, 40, 12, 13, 14):
+            store.insert(position, marker(200 + position))
+
+    round_trip(store, journal, insert)
+
+
+def test_mixed_changes(store):
+    journal = UndoJournal(store)
+
+    def change():
+        store.remove_rows([2, 3, 9])
+        store.insert(1, marker(300))
+        store[0] = marker(0, "first.jpg")
+        store.extend([marker(301)])
+        store.remove_positions([0, 5])
+
+    round_trip(store, journal, change)
+
+
+def test_clear_and_restore(store):
+    journal = UndoJournal(store)
+    before = list(store)
+    with journal.record("Clear"):
+        store.clear()
+    assert len(store) == 0
+    journal.undo()
+    assert list(store) == before
+    journal.redo()
+    assert len(store) == 0
+    journal.undo()
+    assert list(store) == before
+    # The restored markers are a live store again: later changes undo on top of them.
+    with journal.record("Remove"):
+        store.remove_rows([1, 2])
+    journal.undo()
+    assert list(store) == before
+    assert not journal.can_undo()
+
+
+def test_redo_is_dropped_by_a_new_action(store):
+    journal = UndoJournal(store)
+    with journal.record("Remove"):
+        store.remove_rows([0])
+    journal.undo()
+    assert journal.can_redo()
+    with journal.record("Add"):
+        store.append(marker(99))
+    assert not journal.can_redo()
+
+
+def test_nested_records_make_one_step(store):
+    journal = UndoJournal(store)
+    before = list(store)
+    with journal.record("Outer"):
+        store.remove_rows([0])
+        with journal.record("Inner"):
+            store.append(marker(99))
+    assert len(journal.undo_stack) == 1
+    journal.undo()
+    assert list(store) == before
+
+
+def test_depth_is_bounded(store):
+    journal = UndoJournal(store, max_depth=3)
+    for i in range(5):
+        with journal.record(f"Add {i}"):
+            store.append(marker(100 + i))
+    assert [delta.label for delta in journal.undo_stack] == ["Add 2", "Add 3", "Add 4"]
+    while journal.undo() is not None:
+        pass
+    assert len(store) == 32
+
+
+def test_markers_held_are_bounded(store):
+    journal = UndoJournal(store, max_markers=25)
+    with journal.record("Remove"):
+        store.remove_rows(range(10))
+    with journal.record("Add"):
+        store.extend([marker(100 + i) for i in range(10)])
+    assert len(journal.undo_stack) == 2
+    with journal.record("Remove more"):
+        store.remove_positions(range(10))
+    assert [delta.label for delta in journal.undo_stack] == ["Add", "Remove more"]
+
+
+def test_bulk_removal_undoes_and_redoes_quickly():
+    store = MarkerStore([marker(i) for i in range(40_000)])
+    journal = UndoJournal(store)
+    before = list(store)
+    with journal.record("Remove"):
+        store.remove_rows(range(0, len(store), 2))
+    after = list(store)
+    started = time.perf_counter()
+    journal.undo()
+    journal.redo()
+    journal.undo()
+    elapsed = time.perf_counter() - started
+    assert list(store) == before
+    journal.redo()
+    assert list(store) == after
+    assert elapsed < 5  # replaying 20,000 removals one row at a time took minutes
@@ -0,0 +1,21 @@
+from exifmapper.mapbundle import dump_payload, marker_payload, popup_html
+from exifmapper.store import MarkerStore
+
+
+def test_extra_only_holds_dicts_with_a_camera_model():
+    store = MarkerStore([
+        ([1.0, 1.0], "plain.jpg", None, None, {'CameraModel': 'Cam', 'Exposure': 0.01}),
+        ([2.0, 2.0], "string.jpg", None, None, "not a dict"),
+        ([3.0, 3.0], "list.jpg", None, None, ['Cam', 0.01]),
+        ([4.0, 4.0], "nocamera.jpg", None, None, {'Software': 'editor'}),
+        ([5.0, 5.0], "extended.jpg", None, None, {'CameraModel': 'Other', 'Lens': '50mm'}),
+    ])
+    payload = marker_payload(store)
+    assert payload['camera'] == [0, -2, -2, -2, -2]
+    assert payload['extra'] == {4: ['Other', 'N/A']}
+    dump_payload(payload)
+
+
+def test_popup_skips_exif_data_that_is_not_a_dict():
+    assert popup_html("a.jpg", None, None, "CameraModel") == "<b>a.jpg</b>"
+    assert popup_html("a.jpg", None, None, ['City']) == "<b>a.jpg</b>"
@@ -0,0 +1,56 @@
+import pytest
+from PyQt6.QtCore import Qt
+
+from exifmapper.models import NAME, LATITUDE, MarkerFilterModel, MarkerTableModel
+from exifmapper.store import MarkerStore
+
+
+@pytest.fixture
+def models(qapp):
+    store = MarkerStore([([float(i), float(-i)], f"img{i:02d}.jpg", None, None, None) for i in range(20)])
+    table = MarkerTableModel(store)
+    proxy = MarkerFilterModel(table)
+    yield store, table, proxy
+    table.detach()
+
+
+def names(proxy):
+    return [proxy.index(row, NAME).data() for row in range(proxy.rowCount())]
+
+
+@pytest.mark.parametrize('order', [Qt.SortOrder.AscendingOrder, Qt.SortOrder.DescendingOrder])
+def test_sorted_removal_of_separate_blocks(models, order):
+    store, table, proxy = models
+    proxy.sort(LATITUDE, order)
+    expected = [name for name in names(proxy) if name not in ('img02.jpg', 'img03.jpg', 'img04.jpg', 'img08.jpg')]
+    store.remove_positions([2, 3, 4, 8])
+    table.flush()
+    assert table.rowCount() == len(store) == 16
+    assert names(proxy) == expected
+
+
+def test_filtered_removal_of_separate_blocks(models):
+    store, table, proxy = models
+    proxy.setFilterText('img1')
+    store.remove_positions([0, 5, 11, 12, 17])
+    table.flush()
+    assert names(proxy) == ['img10.jpg', 'img13.jpg', 'img14.jpg', 'img15.jpg', 'img16.jpg', 'img18.jpg', 'img19.jpg']
+
+
+def test_unsorted_removal_passes_rows_through(models):
+    store, table, proxy = models
+    removed = []
+    proxy.rowsRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+    store.remove_positions([2, 3, 4, 8])
+    table.flush()
+    assert removed == [(2, 4), (5, 5)]
+    assert names(proxy) == [name for name in store.names()]
+
+
+def test_sort_after_appends(models):
+    store, table, proxy = models
+    proxy.sort(NAME, Qt.SortOrder.DescendingOrder)
+    store.append(([50.0, 1.0], 'zzz.jpg', None, None, None))
+    table.flush()
+    assert names(proxy)[0] == 'zzz.jpg'
+    assert proxy.rowCount() == 21
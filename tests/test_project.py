@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from exifmapper.project import ProjectFile, read_json, write_json
+from exifmapper.store import MarkerStore
+
+
+def marker(i, name=None):
+    return ([round(i * 0.37 - 40, 6), round(i * 1.3 - 170, 6)], name or f"img{i:04d}.jpg",
+            f"2024:01:01 00:{i % 60:02d}:00" if i % 4 else None, float(i) if i % 5 else None,
+            {'CameraModel': f"Cam {i % 3}", 'Exposure': '1/100'} if i % 2 else None)
+
+
+def saved(path):
+    project = ProjectFile(path)
+    try:
+        return list(project.read())
+    finally:
+        project.close()
+
+
+def save(project, store):
+    project.save()
+    assert not project.dirty
+    assert saved(project.path) == list(store)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "markers.exifmap"
+
+
+def test_create(path):
+    store = MarkerStore([marker(i) for i in range(50)])
+    project = ProjectFile.create(path, store)
+    assert len(project) == 50
+    assert saved(path) == list(store)
+    store.extend([marker(100), marker(101)])
+    save(project, store)
+    project.close()
+
+
+def test_mixed_changes(path):
+    rnd = random.Random(1)
+    store = MarkerStore([marker(i) for i in range(40)])
+    project = ProjectFile.create(path, store)
+    for step in range(300):
+        action = rnd.randrange(7)
+        new = marker(1000 + step)
+        if action == 0 and len(store):
+            store.remove_rows(rnd.sample(range(len(store)), min(len(store), rnd.randint(1, 5))))
+        elif action == 1:
+            for _ in range(rnd.randint(1, 4)):
+                store.insert(rnd.randint(0, len(store)), new)
+        elif action == 2 and len(store):
+            store[rnd.randrange(len(store))] = new
+        elif action == 3:
+            store.extend([new, marker(2000 + step)])
+        elif action == 4 and len(store):
+            store.remove_positions(sorted({rnd.randrange(len(store)) for _ in range(3)}))
+        elif action == 5 and rnd.random() < 0.1:
+            store.clear()
+        elif action == 6 and rnd.random() < 0.2:
+            store.restore(MarkerStore([marker(3000 + step + i) for i in range(rnd.randint(0, 20))]))
+        if rnd.random() < 0.5:
+            save(project, store)
+    save(project, store)
+    project.close()
+
+
+def test_reopened_project_keeps_following_the_store(path):
+    store = MarkerStore([marker(i) for i in range(10)])
+    ProjectFile.create(path, store).close()
+    project = ProjectFile(path)
+    store = MarkerStore(project.read())
+    project.attach(store)
+    store.insert(3, marker(50))
+    del store[0]
+    store[1] = marker(51)
+    save(project, store)
+    project.close()
+
+
+def test_repeated_inserts_at_one_position_renumber(path):
+    store = MarkerStore([marker(0), marker(1)])
+    project = ProjectFile.create(path, store)
+    renumbered = False
+    for i in range(80):
+        store.insert(1, marker(100 + i))
+        project._flush()
+        renumbered = renumbered or project._renumber
+        save(project, store)
+    assert renumbered  # halving the gap between the first two rows runs out of doubles
+    project.close()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64])
+def test_read_json_across_chunk_boundaries(tmp_path, chunk_size):
+    store = MarkerStore([marker(i) for i in range(30)] + [marker(99, "café-øl-東京.jpg")])
+    path = tmp_path / "markers.json"
+    write_json(path, store)
+    assert list(read_json(path, chunk_size=chunk_size)) == list(store)
@@ -0,0 +1,55 @@
+import random
+import time
+
+import pytest
+
+from exifmapper import pyramid
+from exifmapper.pyramid import ClusterPyramid, project
+
+
+def points(count, seed=1):
+    rnd = random.Random(seed)
+    return [rnd.uniform(-80, 80) for _ in range(count)], [rnd.uniform(-180, 180) for _ in range(count)]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def build(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(pyramid, 'np', None)
+    elif pyramid.np is None:
+        pytest.skip("numpy is not installed")
+    return ClusterPyramid.build
+
+
+def brute_force(index, zoom, west, south, east, north):
+    """Rows of the cells in a viewport, found by checking every cell of the level."""
+    level = index.levels[zoom]
+    side = 1 << level.bits
+    x0, y0 = project(north, west)
+    x1, y1 = project(south, east)
+    ix0, ix1 = pyramid._cell(x0, side), pyramid._cell(x1, side)
+    iy0, iy1 = pyramid._cell(y0, side), pyramid._cell(y1, side)
+    rows = []
+    for key, row in zip(level.keys, level.row):
+        ix, iy = int(key) >> level.bits, int(key) & (side - 1)
+        inside = ix0 <= ix <= ix1 if west <= east else ix >= ix0 or ix <= ix1
+        if inside and iy0 <= iy <= iy1:
+            rows.append(int(row))
+    return sorted(rows)
+
+
+@pytest.mark.parametrize('bbox', [(-180, -85, 180, 85), (-10, 30, 40, 60), (2.0, 48.0, 2.5, 48.5),
+                                  (170, -50, -170, 50), (-180, 10, 180, 20)])
+def test_query_matches_every_cell_in_view(build, bbox):
+    lats, lons = points(1000)
+    index = build(lats, lons)
+    for zoom in (0, 3, 8, 12, 16):
+        assert sorted(cell[3] for cell in index.query(zoom, *bbox)) == brute_force(index, zoom, *bbox)
+
+
+def test_world_view_at_the_deepest_zoom_is_quick(build):
+    index = build(*points(1000))
+    started = time.perf_counter()
+    found = index.query(pyramid.MAX_ZOOM, -180, -85, 180, 85)
+    assert time.perf_counter() - started < 0.5  # walking all 2 ** 19 columns took seconds
+    assert len(found) == 1000
@@ -0,0 +1,124 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from exifmapper.scheduler import FetchScheduler
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] += 1
+            hits = server.hits[self.path]
+            server.ports.add(self.client_address[1])
+        if self.path == '/slow':
+            with server.lock:
+                server.active += 1
+                server.peak = max(server.peak, server.active)
+            time.sleep(0.05)
+            with server.lock:
+                server.active -= 1
+        elif self.path == '/busy' and hits == 1:
+            return self.reply(503, {'Retry-After': '1'})
+        elif self.path == '/missing':
+            return self.reply(404)
+        elif self.path == '/drop' and hits == 1:
+            self.close_connection = True  # hang up without an answer
+            return
+        self.reply(200)
+
+    def reply(self, status, headers=()):
+        body = self.path.encode()
+        self.send_response(status)
+        for name, value in dict(headers).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = collections.Counter()
+    server.ports = set()
+    server.active = server.peak = 0
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = FetchScheduler(per_host=2, backoff=0.01)
+    yield scheduler
+    scheduler.close()
+
+
+def get(scheduler, url, stop=None):
+    def fetch(session):
+        response = session.get(url, timeout=5)
+        response.raise_for_status()
+        return response.text
+    return scheduler.call(url, fetch, stop)
+
+
+def test_per_host_cap(server, scheduler):
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: get(scheduler, server.url + '/slow'), range(8)))
+    assert results == ['/slow'] * 8
+    assert server.peak == 2
+    stats = scheduler.stats()[f"127.0.0.1:{server.server_address[1]}"]
+    assert (stats.done, stats.failed, stats.peak) == (8, 0, 2)
+
+
+def test_connections_are_reused(server, scheduler):
+    for _ in range(5):
+        assert get(scheduler, server.url + '/ok') == '/ok'
+    assert len(server.ports) == 1
+
+
+def test_retry_after_on_503(server, scheduler):
+    started = time.monotonic()
+    assert get(scheduler, server.url + '/busy') == '/busy'
+    assert time.monotonic() - started >= 1
+    assert server.hits['/busy'] == 2
+    assert next(iter(scheduler.stats().values())).retries == 1
+
+
+def test_no_retry_on_404(server, scheduler):
+    with pytest.raises(requests.HTTPError):
+        get(scheduler, server.url + '/missing')
+    assert server.hits['/missing'] == 1
+    stats = next(iter(scheduler.stats().values()))
+    assert (stats.retries, stats.failed) == (0, 1)
+
+
+def test_retry_on_dropped_connection(server, scheduler):
+    assert get(scheduler, server.url + '/drop') == '/drop'
+    assert server.hits['/drop'] == 2
+    assert next(iter(scheduler.stats().values())).retries == 1
+
+
+def test_stop_event_gives_up_retrying(server, scheduler):
+    stop = threading.Event()
+    stop.set()
+    with pytest.raises(requests.HTTPError):
+        get(scheduler, server.url + '/busy', stop)
+    assert server.hits['/busy'] == 1
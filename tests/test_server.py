@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from exifmapper import server as server_module
+from exifmapper.server import MapServer
+from exifmapper.store import MarkerStore, parse_timestamp
+
+
+def markers():
+    track = [([48.0 + i * 0.01, 2.0 + i * 0.01], f"img{i:02d}.jpg", f"2024:01:{i + 1:02d} 12:00:00", 35.0,
+              {'CameraModel': 'Cam', 'Exposure': '1/100'}) for i in range(10)]
+    track.append(([-33.9, 151.2], "<script>alert(1)</script>.jpg", "2024:02:01 <b>", None,
+                  {'CameraModel': '<i>Cam</i>', 'Exposure': '1/100', 'City': 'A & B'}))
+    return track
+
+
+@pytest.fixture
+def server():
+    server = MapServer().start()
+    server.publish(MarkerStore(markers()), "<html>map</html>")
+    yield server
+    server.stop()
+
+
+def get(server, path):
+    with urllib.request.urlopen(server.url + path.lstrip('/'), timeout=10) as response:
+        body = response.read()
+        return json.loads(body) if response.headers['Content-Type'] == 'application/json' else body
+
+
+def status(server, path):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(server, path)
+    return error.value.code
+
+
+def test_page(server):
+    assert get(server, '/') == b"<html>map</html>"
+
+
+def test_markers(server):
+    data = get(server, '/markers?zoom=3&bbox=-180,-85,180,85')
+    assert data['version'] == server.view.version
+    assert sorted(data['row']) == list(range(11))
+    assert set(data['count']) == {1}
+    assert sorted(get(server, '/markers?zoom=12&bbox=1.9,47.9,2.2,48.2')['row']) == list(range(10))
+    assert get(server, '/markers?zoom=12&bbox=151,-34,151.4,-33.8')['row'] == [10]
+
+
+def test_markers_in_a_time_range(server):
+    start, end = parse_timestamp("2024:01:03 00:00:00"), parse_timestamp("2024:01:06 00:00:00")
+    data = get(server, f'/markers?zoom=3&bbox=-180,-85,180,85&start={start}&end={end}')
+    assert sorted(data['row']) == [2, 3, 4]
+
+
+def test_markers_from_clusters_when_too_many_are_in_view(server, monkeypatch):
+    monkeypatch.setattr(server_module, 'MAX_MARKERS', 5)
+    data = get(server, '/markers?zoom=2&bbox=-180,-85,180,85')
+    assert sorted(data['count']) == [1, 10]
+    assert data['row'][data['count'].index(10)] in range(10)
+
+
+def test_heat(server):
+    points = get(server, '/heat?zoom=2&bbox=-180,-85,180,85')['points']
+    assert points and max(point[2] for point in points) == 1.0
+
+
+def test_path(server):
+    data = get(server, '/path?zoom=12&unit=km')
+    assert data['points'][0] == [48.0, 2.0]
+    assert data['points'][-1] == [-33.9, 151.2]
+    assert data['tooltip'].startswith("Total Distance: ")
+
+
+def test_marker_popup_is_escaped(server):
+    assert '<b>img03.jpg</b>' in get(server, '/marker/3')['html']
+    html = get(server, '/marker/10')['html']
+    assert '<script>' not in html and '&lt;script&gt;' in html
+    assert '&lt;i&gt;Cam&lt;/i&gt;' in html and 'A &amp; B' in html and '&lt;b&gt;' in html
+
+
+def test_errors(server):
+    assert status(server, '/marker/11') == 404
+    assert status(server, '/marker/x') == 400
+    assert status(server, f'/markers?zoom=1&version={server.view.version + 1}') == 409
+    assert status(server, '/nothing') == 404
+
+
+def test_changes_answers_when_markers_are_published(server):
+    version, page = str(server.view.version), str(server.page_id)
+    assert get(server, '/changes?version=&page=')['page'] == page  # out of date: answers at once
+
+    store = MarkerStore(markers()[:2])
+    store.append(([1.0, 1.0], "new.jpg", None, None, None))
+    timer = threading.Timer(0.2, server.publish, (store,))
+    timer.start()
+    started = time.monotonic()
+    data = get(server, f'/changes?version={version}&page={page}')
+    timer.join()
+    assert time.monotonic() - started >= 0.15
+    assert data == {'version': store.version, 'page': page}
+    assert len(get(server, '/markers?zoom=3&bbox=-180,-85,180,85')['row']) == 3
@@ -0,0 +1,33 @@
+from exifmapper.store import MarkerStore
+
+
+def names_near(store, lat, lon, radius):
+    return sorted(marker[1] for marker in store.near(lat, lon, radius))
+
+
+def test_near_sees_markers_added_while_the_name_index_is_stale():
+    store = MarkerStore([([10.0, 20.0], "a.jpg", None, None, None)])
+    assert names_near(store, 10.0, 20.0, 0.5) == ["a.jpg"]  # builds the grid
+    store.insert(0, ([10.1, 20.1], "b.jpg", None, None, None))  # drops the grid and the name index
+    assert names_near(store, 10.0, 20.0, 0.5) == ["a.jpg", "b.jpg"]
+    store.append(([10.2, 20.2], "c.jpg", None, None, None))
+    store.extend([([10.3, 20.3], "d.jpg", None, None, None)])
+    assert names_near(store, 10.0, 20.0, 0.5) == ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+
+
+def test_near_has_no_duplicates_after_the_name_index_is_rebuilt():
+    store = MarkerStore([([10.0, 20.0], "a.jpg", None, None, None)])
+    store.insert(0, ([10.1, 20.1], "b.jpg", None, None, None))
+    assert names_near(store, 10.0, 20.0, 0.5) == ["a.jpg", "b.jpg"]
+    assert store.is_duplicate([10.0, 20.0], "a.jpg")  # rebuilds the name index
+    store.append(([10.2, 20.2], "c.jpg", None, None, None))
+    assert names_near(store, 10.0, 20.0, 0.5) == ["a.jpg", "b.jpg", "c.jpg"]
+
+
+def test_near_follows_moves_and_removals():
+    store = MarkerStore([([10.0, 20.0], "a.jpg", None, None, None), ([10.1, 20.1], "b.jpg", None, None, None)])
+    assert names_near(store, 10.0, 20.0, 0.5) == ["a.jpg", "b.jpg"]
+    store[0] = ([50.0, 60.0], "a.jpg", None, None, None)
+    store.remove_name("b.jpg")
+    assert names_near(store, 10.0, 20.0, 0.5) == []
+    assert names_near(store, 50.0, 60.0, 0.5) == ["a.jpg"]